@@ -0,0 +1,703 @@
+import argparse
+import asyncio
+import contextlib
+import gc
+import io
+import json
+import os
+import random
+import re
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from catalog import Catalog, Book, CD, DVD, Magazine
+from columnar import ColumnStore
+from menu import Menu
+from sqlitecatalog import SqliteCatalog
+from storage import JsonStorage
+from urllib.parse import urlencode
+
+WORDS = ["dark", "light", "Đắc", "nhân", "tâm", "dune", "part", "two", "the", "last", "outpost", "angels",
+         "demons", "war", "love", "city", "night", "river", "mekong", "centimet", "trên", "giây", "blue"]
+NAMES = ["Dan Brown", "Dale Carnegie", "Shinkai Makoto", "Cary Grant", "Claude Rains", "Zendaya",
+         "Timothée Chalamet", "YOASOBI", "Denis Villeneuve", "Brian Eyler", "Lewis R. Foster"]
+
+def generate(count, seed=0):
+    """
+    Generates a list of random library items.
+
+    Parameters:
+        count (int): Number of items to generate
+        seed (int): Seed of the random generator
+
+    Returns:
+        data (list): List of dictionaries containing information of the items
+    """
+    rand = random.Random(seed)
+    data = []
+    for _ in range(count):
+        type = rand.choice(["Book", "CD", "DVD", "Magazine"])
+        d = {"Title": " ".join(rand.choices(WORDS, k=rand.randint(1, 5))), "Type": type}
+        if type == "Book":
+            d["Contributor"] = {"Author": ", ".join(rand.sample(NAMES, rand.randint(1, 2)))}
+            d["Subject"] = rand.choice(["Romance", "Self-help", "Research", "Mystery-thriller"])
+            d["ISBN"] = str(rand.randrange(10**12, 10**13))
+            d["DDS"] = "R%03d" % rand.randrange(1000)
+        elif type == "CD" or type == "DVD":
+            d["Contributor"] = {"Director": rand.choice(NAMES), "Actor": ", ".join(rand.sample(NAMES, 3))}
+            d["Genre"] = rand.choice(["Music", "Science Fiction", "Drama"])
+            d["ASIN"] = "B0%08d" % rand.randrange(10**8)
+        else:
+            d["Contributor"] = {"Editor": rand.choice(NAMES)}
+            d["Volume"] = rand.choice(["I", "II", "III"])
+            d["Issue"] = str(rand.randrange(1, 13))
+        d["UPC"] = str(rand.randrange(10**11, 10**13))
+        data.append(d)
+    return data
+
+def writeCatalog(directory, count):
+    """
+    Writes a generated catalog of count items into directory and returns its path.
+    """
+    path = os.path.join(directory, f"catalog_{count}.json")
+    with open(path, "w") as file:
+        json.dump(generate(count), file, indent=4)
+    return path
+
+def benchAdd(sizes, repeat):
+    """
+    Measures the cost of adding a single item to catalogs of growing size, for both storage backends.
+    """
+    print(f"{'items':>10} {'load (ms)':>12} {'journal add (ms)':>18} {'json add (ms)':>15}")
+    with tempfile.TemporaryDirectory() as directory:
+        for size in sizes:
+            path = writeCatalog(directory, size)
+            start = time.perf_counter()
+            ctl = Catalog(path)
+            load = time.perf_counter() - start
+
+            new = generate(repeat, seed=size)
+            start = time.perf_counter()
+            for d in new:
+                ctl.addItem([d])
+            journal = (time.perf_counter() - start) / repeat
+
+            ctl = Catalog(path, JsonStorage(path))
+            start = time.perf_counter()
+            for d in new:
+                ctl.addItem([d])
+            whole = (time.perf_counter() - start) / repeat
+
+            print(f"{size:>10} {load*1000:>12.2f} {journal*1000:>18.3f} {whole*1000:>15.2f}")
+
+def benchLoad(sizes):
+    """
+    Measures startup time and peak memory of loading generated catalogs, eagerly and lazily.
+    Every load runs in a fresh interpreter so that peak RSS is not shared between runs.
+    """
+    modes = ["eager", "lazy", "lazy+search"]
+    print(f"{'items':>10} {'mode':>12} {'startup (ms)':>14} {'first search (ms)':>19} {'peak RSS (MB)':>15}")
+    with tempfile.TemporaryDirectory() as directory:
+        for size in sizes:
+            path = writeCatalog(directory, size)
+            for mode in modes:
+                out = subprocess.run([sys.executable, __file__, "_load", path, mode],
+                                     capture_output=True, text=True, check=True).stdout
+                res = json.loads(out)
+                search = f"{res['search']*1000:.2f}" if res["search"] is not None else "-"
+                print(f"{size:>10} {mode:>12} {res['startup']*1000:>14.2f} {search:>19} {res['rss']/1024:>15.1f}")
+
+def benchSnapshot(sizes):
+    """
+    Measures cold start with and without the binary snapshot, and the first search after it.
+    Every load runs in a fresh interpreter, once the snapshot has been written.
+    """
+    modes = ["eager+search", "snapshot+search", "lazy+snapshot+search"]
+    print(f"{'items':>10} {'mode':>21} {'startup (ms)':>14} {'first search (ms)':>19} {'peak RSS (MB)':>15}"
+          f" {'snapshot (MB)':>15}")
+    with tempfile.TemporaryDirectory() as directory:
+        for size in sizes:
+            path = writeCatalog(directory, size)
+            start = time.perf_counter()
+            Catalog.buildSnapshot(path)
+            build = time.perf_counter() - start
+            megabytes = os.path.getsize(path + ".snapshot") / 2**20
+            for mode in modes:
+                out = subprocess.run([sys.executable, __file__, "_load", path, mode],
+                                     capture_output=True, text=True, check=True).stdout
+                res = json.loads(out)
+                print(f"{size:>10} {mode:>21} {res['startup']*1000:>14.2f} {res['search']*1000:>19.2f}"
+                      f" {res['rss']/1024:>15.1f} {megabytes:>15.1f}")
+            print(f"{size:>10} {'writing the snapshot':>21} {build*1000:>14.2f}")
+
+def loadOnce(path, mode):
+    """
+    Loads one catalog and prints its startup time, first search time and peak RSS as json.
+    The mode holds "lazy", "snapshot" and "search" joined by +, or is "eager".
+    """
+    flags = mode.split("+")
+    start = time.perf_counter()
+    ctl = Catalog(path, lazy="lazy" in flags, snapshot="snapshot" in flags)
+    startup = time.perf_counter() - start
+    search = None
+    if "search" in flags:
+        start = time.perf_counter()
+        ctl.search("mekong", "Title")
+        search = time.perf_counter() - start
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({"startup": startup, "search": search, "rss": rss}))
+
+def traced(function):
+    """
+    Calls function and returns its result together with the memory it still holds afterwards.
+    """
+    gc.collect()
+    tracemalloc.start()
+    res = function()
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return res, size
+
+def benchMemory(sizes):
+    """
+    Reports memory per item of the object layout and the columnar layout, for the items alone
+    and for a whole catalog including its indexes. The columnar layout takes more memory than objects
+    for small catalogs, so sizes from a few thousand items up show where it starts to pay off.
+    """
+    classes = {"Book": Book, "CD": CD, "DVD": DVD}
+    build = lambda d: classes.get(d["Type"], Magazine)(d)
+
+    def fill(data):
+        store = ColumnStore(build)
+        for id, d in enumerate(data):
+            store[id] = d
+        return store
+
+    print(f"{'items':>10} {'layout':>10} {'items (B/item)':>16} {'catalog (B/item)':>18}")
+    with tempfile.TemporaryDirectory() as directory:
+        for size in sizes:
+            path = writeCatalog(directory, size)
+            data = generate(size)
+            for layout in ["objects", "columnar"]:
+                if layout == "objects":
+                    items, itemsSize = traced(lambda: [build(d) for d in data])
+                else:
+                    items, itemsSize = traced(lambda: fill(data))
+                del items
+                ctl, catalogSize = traced(lambda: Catalog(path, columnar=layout == "columnar"))
+                del ctl
+                print(f"{size:>10} {layout:>10} {itemsSize/size:>16.1f} {catalogSize/size:>18.1f}")
+
+def legacySearch(items, keyword, field=None):
+    """
+    The search loop Catalog used before the token index and the pattern cache, kept as a baseline:
+    every field of every item is matched by re.search and highlighted again by re.sub with a callback.
+    """
+    f = lambda match: "\x1b[6;30;42m" + match.group(0)[0] + match.group(0)[1:] + "\x1b[0m"
+    results = []
+    for item in items:
+        information = item.locate()
+        foundDF = False
+        names = item.getContribTypes() if field == "Contributor" else [field] if field is not None else list(information)
+        for i in names:
+            if re.search(keyword, information[i], flags=re.IGNORECASE) is not None:
+                information[i] = re.sub(keyword, f, information[i], flags=re.IGNORECASE)
+                foundDF = True
+        if foundDF:
+            results.append(information)
+    results.sort(key=lambda x: (x["Type"], x["Title"]))
+    return results
+
+def benchSearch(size, repeat):
+    """
+    Compares the legacy search loop with Catalog.search on plain keywords and regular expressions.
+    """
+    queries = [("mekong", "Title"), ("dan brown", "Contributor"), ("tâm", None), ("nig", None),
+               ("^the", "Title"), ("d[au]ne?", None), ("blue|red", "Title")]
+    classes = {"Book": Book, "CD": CD, "DVD": DVD}
+    with tempfile.TemporaryDirectory() as directory:
+        path = writeCatalog(directory, size)
+        ctl = Catalog(path)
+        items = [classes.get(d["Type"], Magazine)(d) for d in generate(size)]
+
+        print(f"{'keyword':>14} {'field':>12} {'results':>8} {'legacy (ms)':>12} {'catalog (ms)':>13} {'speedup':>8}")
+        for keyword, field in queries:
+            start = time.perf_counter()
+            for _ in range(repeat):
+                legacy = legacySearch(items, keyword, field)
+            legacyTime = (time.perf_counter() - start) / repeat
+
+            start = time.perf_counter()
+            for _ in range(repeat):
+                res = ctl.search(keyword, field)
+            catalogTime = (time.perf_counter() - start) / repeat
+
+            print(f"{keyword:>14} {str(field):>12} {len(res):>8} {legacyTime*1000:>12.2f} {catalogTime*1000:>13.2f}"
+                  f" {legacyTime/catalogTime:>7.1f}x")
+
+def benchParallel(size, workers, repeat):
+    """
+    Measures regular expression searches on one catalog with a growing number of worker processes.
+    """
+    queries = [("d[au]ne?", None), ("^the", "Title"), ("br.wn|rains", "Contributor"), ("[0-9]{4}7$", "UPC")]
+    with tempfile.TemporaryDirectory() as directory:
+        ctl = Catalog(writeCatalog(directory, size))
+        print(f"{'workers':>8} " + " ".join(f"{keyword:>14}" for keyword, field in queries) + f" {'total (ms)':>12}")
+        base = None
+        for count in workers:
+            ctl.setParallel(count, threshold=0)
+            ctl.search(*queries[0])
+            times = []
+            for keyword, field in queries:
+                start = time.perf_counter()
+                for _ in range(repeat):
+                    ctl.search(keyword, field)
+                times.append((time.perf_counter() - start) / repeat)
+            base = base if base is not None else sum(times)
+            print(f"{count:>8} " + " ".join(f"{t*1000:>14.2f}" for t in times)
+                  + f" {sum(times)*1000:>12.2f} ({base/sum(times):.1f}x)")
+        ctl.setParallel(1)
+
+def benchFuzzy(size, repeat):
+    """
+    Measures the latency of prefix and typo-tolerant queries on one catalog.
+    """
+    queries = [("suggest", "m", "Title"), ("suggest", "the la", "Title"), ("suggest", "dan b", "Contributor"),
+               ("fuzzy", "mekonk", "Title"), ("fuzzy", "outpst angles", "Title"), ("fuzzy", "carnegy", "Contributor")]
+    with tempfile.TemporaryDirectory() as directory:
+        ctl = Catalog(writeCatalog(directory, size))
+        print(f"{'query':>8} {'text':>14} {'field':>12} {'results':>8} {'time (ms)':>10}")
+        for kind, text, field in queries:
+            query = ctl.suggest if kind == "suggest" else ctl.fuzzySearch
+            start = time.perf_counter()
+            for _ in range(repeat):
+                res = query(text, field)
+            elapsed = (time.perf_counter() - start) / repeat
+            print(f"{kind:>8} {text:>14} {field:>12} {len(res):>8} {elapsed*1000:>10.3f}")
+
+def benchImport(sizes):
+    """
+    Measures bulk import into an empty catalog and streaming export, for every file format.
+    Eager catalogs index the imported items at once, lazy ones defer indexing to the first search.
+    """
+    print(f"{'items':>10} {'format':>7} {'mode':>6} {'import (s)':>11} {'items/s':>10} {'export (s)':>11}")
+    with tempfile.TemporaryDirectory() as directory:
+        for size in sizes:
+            generated = writeCatalog(directory, size)
+            for format in ["jsonl", "csv"]:
+                source = os.path.join(directory, "source." + format)
+                Catalog(generated, JsonStorage(generated), lazy=True).export(source, format)
+                for mode in ["lazy", "eager"]:
+                    path = os.path.join(directory, f"{format}_{mode}_{size}.json")
+                    with open(path, "w") as file:
+                        json.dump([], file)
+                    ctl = Catalog(path, lazy=mode == "lazy")
+                    start = time.perf_counter()
+                    count, rejected = ctl.importItems(source)
+                    imported = time.perf_counter() - start
+
+                    start = time.perf_counter()
+                    ctl.export(os.path.join(directory, "export." + format), format)
+                    exported = time.perf_counter() - start
+                    print(f"{size:>10} {format:>7} {mode:>6} {imported:>11.2f} {count/imported:>10.0f}"
+                          f" {exported:>11.2f}")
+                    del ctl
+
+def benchSqlite(sizes, repeat):
+    """
+    Compares the in-memory catalog on a json file with the SQLite engine: startup, queries, single writes
+    and peak memory. Every engine runs in a fresh interpreter so that peak RSS is not shared between runs.
+    """
+    print(f"{'items':>10} {'engine':>7} {'startup (ms)':>13} {'search (ms)':>12} {'regex (ms)':>11}"
+          f" {'lookup (ms)':>12} {'add (ms)':>9} {'delete (ms)':>12} {'peak RSS (MB)':>14}")
+    with tempfile.TemporaryDirectory() as directory:
+        for size in sizes:
+            path = writeCatalog(directory, size)
+            database = os.path.join(directory, f"catalog_{size}.db")
+            SqliteCatalog(database, path).close()
+            for engine in ["json", "sqlite"]:
+                out = subprocess.run([sys.executable, __file__, "_engine", path, database, engine, str(repeat)],
+                                     capture_output=True, text=True, check=True).stdout
+                res = json.loads(out)
+                print(f"{size:>10} {engine:>7} {res['startup']*1000:>13.2f} {res['search']*1000:>12.2f}"
+                      f" {res['regex']*1000:>11.2f} {res['lookup']*1000:>12.3f} {res['add']*1000:>9.2f}"
+                      f" {res['delete']*1000:>12.2f} {res['rss']/1024:>14.1f}")
+
+def engineOnce(path, database, engine, repeat):
+    """
+    Runs the queries of benchSqlite on one engine and prints their times and peak RSS as json.
+    """
+    start = time.perf_counter()
+    ctl = Catalog(path) if engine == "json" else SqliteCatalog(database)
+    startup = time.perf_counter() - start
+
+    def timed(function):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            function()
+        return (time.perf_counter() - start) / repeat
+
+    plain = [("mekong", "Title"), ("dan brown", "Contributor"), ("tâm", None)]
+    regex = [("^the", "Title"), ("d[au]ne?", None)]
+    upc = generate(1)[0]["UPC"]
+    res = {"startup": startup,
+           "search": sum(timed(lambda: ctl.search(keyword, field)) for keyword, field in plain) / len(plain),
+           "regex": sum(timed(lambda: ctl.search(keyword, field)) for keyword, field in regex) / len(regex),
+           "lookup": timed(lambda: ctl.lookup("UPC", upc))}
+
+    item = dict(generate(1, seed=1)[0], Title="zzz benchmark item")
+    start = time.perf_counter()
+    ctl.addItem([item])
+    res["add"] = time.perf_counter() - start
+    start = time.perf_counter()
+    ctl.deleteItems("zzz benchmark item")
+    res["delete"] = time.perf_counter() - start
+    res["rss"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps(res))
+
+def benchMenu(lines, repeat):
+    """
+    Measures building and rendering a menu holding a listing, written to memory instead of the terminal.
+    """
+    classes = {"Book": Book, "CD": CD, "DVD": DVD}
+    text = Catalog.convert(dict(classes.get(d["Type"], Magazine)(d).view()) for d in generate(lines // 7 + 1))
+    text = "\n".join(line[:96] for line in text.split("\n")[:lines])
+
+    start = time.perf_counter()
+    menu = Menu(100, "Listing", "-")
+    menu.addLines(text)
+    build = time.perf_counter() - start
+
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        start = time.perf_counter()
+        menu.show()
+        first = time.perf_counter() - start
+        start = time.perf_counter()
+        for _ in range(repeat):
+            menu.show()
+        again = (time.perf_counter() - start) / repeat
+    print(f"{'lines':>8} {'build (ms)':>11} {'first show (ms)':>16} {'next show (ms)':>15} {'bytes':>10}")
+    print(f"{lines:>8} {build*1000:>11.2f} {first*1000:>16.2f} {again*1000:>15.2f} {len(out.getvalue())//(repeat+1):>10}")
+
+def benchIncremental(size, limit):
+    """
+    Measures every keystroke of typing queries, deleting them with backspace and typing them again,
+    with the search narrowing its results as the keyword grows.
+    """
+    queries = [("mekong", "Title"), ("dan brown", "Contributor"), ("Đắc nhân tâm", None), ("the lazt", None),
+               ("123456", None), ("b0012", "ASIN")]
+    with tempfile.TemporaryDirectory() as directory:
+        ctl = Catalog(writeCatalog(directory, size))
+        print(f"{'query':>14} {'field':>12} {'keys':>5} {'count':>7} {'mean (ms)':>10} {'max (ms)':>9}"
+              f" {'full search (ms)':>17}")
+        for text, field in queries:
+            search = ctl.incremental(field, limit)
+            keys = [text[:i] for i in range(1, len(text) + 1)]
+            keys += keys[-2::-1] + keys[1:]
+            times = []
+            for keyword in keys:
+                start = time.perf_counter()
+                results, count = search.search(keyword)
+                times.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            full = sum(len(list(ctl.iterSearch(keyword, field, limit=limit))) for keyword in keys)
+            fullTime = (time.perf_counter() - start) / len(keys)
+            print(f"{text:>14} {str(field):>12} {len(keys):>5} {str(count):>7} {sum(times)/len(keys)*1000:>10.3f}"
+                  f" {max(times)*1000:>9.3f} {fullTime*1000:>17.3f}")
+
+def benchService(size, clients, requests, writes, port):
+    """
+    Load-tests the HTTP service with concurrent clients, each sending requests over one connection,
+    and reports the latency of every kind of request and the number of requests served per second.
+    If port is None, a server is started on a generated catalog first.
+
+    Parameters:
+        size (int): Number of items of the generated catalog
+        clients (int): Number of concurrent clients
+        requests (int): Number of requests sent by all clients together
+        writes (float): Share of the requests that add or delete an item
+        port (int): Port of a service already running on localhost, or None
+    """
+    data = generate(size)
+    with tempfile.TemporaryDirectory() as directory:
+        server = None
+        if port is None:
+            path = os.path.join(directory, f"catalog_{size}.json")
+            with open(path, "w") as file:
+                json.dump(data, file, indent=4)
+            server = subprocess.Popen([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                       "server.py"), path, "--port", "0"], stdout=subprocess.PIPE, text=True)
+            port = int(server.stdout.readline().rsplit(":", 1)[1])
+        try:
+            times, elapsed, errors = asyncio.run(loadService(port, data, clients, requests, writes))
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait()
+
+    print(f"{clients} clients, {requests} requests in {elapsed:.2f} s: {requests/elapsed:.0f} requests/s,"
+          f" {errors} errors")
+    print(f"{'request':>10} {'count':>7} {'p50 (ms)':>9} {'p99 (ms)':>9} {'max (ms)':>9}")
+    for kind, spent in sorted(times.items()):
+        spent.sort()
+        print(f"{kind:>10} {len(spent):>7} {spent[len(spent) // 2]*1000:>9.2f}"
+              f" {spent[min(len(spent) - 1, len(spent) * 99 // 100)]*1000:>9.2f} {spent[-1]*1000:>9.2f}")
+
+async def loadService(port, data, clients, requests, writes):
+    """
+    Sends the requests of benchService and returns the time spent by every kind of request,
+    the total time and the number of failed requests.
+    """
+    rand = random.Random(1)
+    fields = ["Title", "Contributor", None]
+    plan = []
+    for i in range(requests):
+        if rand.random() < writes:
+            # Every added item is deleted again by a later write, so the catalog keeps its size.
+            title = f"zzz load item {i // 2}"
+            if i % 2 == 0:
+                item = dict(rand.choice(data), Title=title)
+                plan.append(("add", "POST", "/items", json.dumps(item).encode("utf-8")))
+            else:
+                plan.append(("delete", "DELETE", "/items?" + urlencode({"title": title}), b""))
+            continue
+        kind = rand.choice(["search", "search", "search", "lookup", "list"])
+        if kind == "search":
+            parameters = {"q": rand.choice(WORDS), "limit": 10}
+            field = rand.choice(fields)
+            if field is not None:
+                parameters["field"] = field
+            target = "/search?" + urlencode(parameters)
+        elif kind == "lookup":
+            target = "/lookup?" + urlencode({"field": "UPC", "value": rand.choice(data)["UPC"]})
+        else:
+            target = "/items?" + urlencode({"type": rand.choice(["Book", "CD", "DVD", "Magazine"]),
+                                            "offset": rand.randrange(len(data) // 4), "limit": 20})
+        plan.append((kind, "GET", target, b""))
+
+    times = {}
+    errors = 0
+    queue = iter(plan)
+
+    async def client():
+        nonlocal errors
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        for kind, method, target, body in queue:
+            start = time.perf_counter()
+            writer.write(f"{method} {target} HTTP/1.1\r\nHost: localhost\r\nContent-Length: {len(body)}\r\n\r\n"
+                         .encode("latin-1") + body)
+            status = await reader.readline()
+            length = 0
+            while True:
+                line = await reader.readline()
+                if line == b"\r\n":
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                if name.lower() == "content-length":
+                    length = int(value)
+            await reader.readexactly(length)
+            times.setdefault(kind, []).append(time.perf_counter() - start)
+            if status.split()[1] != b"200":
+                errors += 1
+        writer.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(clients)))
+    return times, time.perf_counter() - start, errors
+
+def benchStress(size, readers, writers, seconds, batch):
+    """
+    Runs searches and writes on one catalog from several threads at once and checks that every search
+    reads a single version of the catalog. Writers add batches of items with one addItem and delete them
+    with one deleteItems, so a search walking its results slowly has to see every batch whole or not at all,
+    sorted and without duplicates, even when the batch is added or deleted meanwhile.
+
+    Parameters:
+        size (int): Number of items of the generated catalog
+        readers (int): Number of reading threads
+        writers (int): Number of writing threads
+        seconds (float): How long the threads run
+        batch (int): Number of items added and deleted at a time
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        path = writeCatalog(directory, size)
+        ctl = Catalog(path)
+        template = next(d for d in generate(100) if d["Type"] == "Book")
+        stop = threading.Event()
+        counts = {"reads": 0, "writes": 0, "violations": 0}
+        errors = []
+        pattern = re.compile(r"zzz batch (\d+-\d+) item")
+
+        def read(number):
+            rand = random.Random(number)
+            reads = violations = 0
+            while not stop.is_set():
+                groups = {}
+                titles = []
+                for n, information in enumerate(ctl.iterSearch("zzz batch", "Title", highlight=False)):
+                    titles.append(information["Title"])
+                    label = pattern.match(information["Title"]).group(1)
+                    groups[label] = groups.get(label, 0) + 1
+                    if n % 16 == 0:
+                        time.sleep(0)
+                if any(count != batch for count in groups.values()) or titles != sorted(titles) \
+                        or len(set(titles)) != len(titles):
+                    violations += 1
+                ctl.search(rand.choice(WORDS), rand.choice(["Title", "Contributor", None]), highlight=False)
+                ctl.countItems(rand.choice(["Book", "CD", "DVD", "Magazine"]))
+                reads += 3
+            counts["reads"] += reads
+            counts["violations"] += violations
+
+        def write(number):
+            writes = 0
+            n = 0
+            while not stop.is_set():
+                items = [dict(template, Title=f"zzz batch {number}-{n} item {k:04d}", UPC=f"{number}{n:08d}{k:04d}")
+                         for k in range(batch)]
+                ctl.addItem(items)
+                time.sleep(0.001)
+                if ctl.deleteItems(f"zzz batch {number}-{n} item") != batch:
+                    counts["violations"] += 1
+                writes += 2
+                n += 1
+            counts["writes"] += writes
+
+        def run(function, number):
+            try:
+                function(number)
+            except Exception as e:
+                errors.append(repr(e))
+
+        threads = [threading.Thread(target=run, args=(read, i)) for i in range(readers)]
+        threads += [threading.Thread(target=run, args=(write, i)) for i in range(writers)]
+        for thread in threads:
+            thread.start()
+        time.sleep(seconds)
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+        # The storage has to hold what the catalog holds, and none of the batches.
+        again = Catalog(path)
+        left = len(ctl.search("zzz batch", "Title"))
+        stored = sum(again.countItems(t) for t in ["Book", "CD", "DVD", "Magazine"])
+        held = sum(ctl.countItems(t) for t in ["Book", "CD", "DVD", "Magazine"])
+
+    print(f"{readers} readers, {writers} writers, {seconds:.0f} s on {size} items")
+    print(f"{'reads/s':>10} {'writes/s':>10} {'violations':>11} {'errors':>7} {'left':>5} {'stored':>8} {'held':>8}")
+    print(f"{counts['reads']/seconds:>10.0f} {counts['writes']/seconds:>10.0f} {counts['violations']:>11}"
+          f" {len(errors):>7} {left:>5} {stored:>8} {held:>8}")
+    for error in errors[:5]:
+        print(error)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks for the library catalog.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    add = commands.add_parser("add", help="cost of a single addItem as the catalog grows")
+    add.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    add.add_argument("--repeat", type=int, default=5)
+
+    load = commands.add_parser("load", help="startup time and peak memory of loading a catalog")
+    load.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+
+    memory = commands.add_parser("memory", help="memory per item of the object and columnar layouts")
+    memory.add_argument("--sizes", type=int, nargs="+", default=[2000, 20000, 100000])
+
+    search = commands.add_parser("search", help="legacy search loop against Catalog.search")
+    search.add_argument("--size", type=int, default=100000)
+    search.add_argument("--repeat", type=int, default=5)
+
+    parallel = commands.add_parser("parallel", help="regular expression search across worker counts")
+    parallel.add_argument("--size", type=int, default=200000)
+    parallel.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parallel.add_argument("--repeat", type=int, default=3)
+
+    fuzzy = commands.add_parser("fuzzy", help="latency of prefix and fuzzy queries")
+    fuzzy.add_argument("--size", type=int, default=100000)
+    fuzzy.add_argument("--repeat", type=int, default=20)
+
+    bulk = commands.add_parser("import", help="bulk import and streaming export of csv and json-lines files")
+    bulk.add_argument("--sizes", type=int, nargs="+", default=[100000, 1000000])
+
+    sqlite = commands.add_parser("sqlite", help="the json engine against the SQLite engine")
+    sqlite.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000])
+    sqlite.add_argument("--repeat", type=int, default=3)
+
+    menu = commands.add_parser("menu", help="building and rendering a long menu")
+    menu.add_argument("--lines", type=int, default=10000)
+    menu.add_argument("--repeat", type=int, default=10)
+
+    incremental = commands.add_parser("incremental", help="latency of every keystroke of search as you type")
+    incremental.add_argument("--size", type=int, default=100000)
+    incremental.add_argument("--limit", type=int, default=10)
+
+    service = commands.add_parser("service", help="latency and throughput of the HTTP service under load")
+    service.add_argument("--size", type=int, default=100000)
+    service.add_argument("--clients", type=int, default=16)
+    service.add_argument("--requests", type=int, default=20000)
+    service.add_argument("--writes", type=float, default=0.01)
+    service.add_argument("--port", type=int, default=None, help="port of a running service to test instead")
+
+    snapshot = commands.add_parser("snapshot", help="cold start from the binary snapshot")
+    snapshot.add_argument("--sizes", type=int, nargs="+", default=[100000, 1000000])
+
+    stress = commands.add_parser("stress", help="concurrent searches and writes on one catalog from threads")
+    stress.add_argument("--size", type=int, default=100000)
+    stress.add_argument("--readers", type=int, default=8)
+    stress.add_argument("--writers", type=int, default=2)
+    stress.add_argument("--seconds", type=float, default=10)
+    stress.add_argument("--batch", type=int, default=50)
+
+    once = commands.add_parser("_load")
+    once.add_argument("path")
+    once.add_argument("mode")
+
+    engine = commands.add_parser("_engine")
+    engine.add_argument("path")
+    engine.add_argument("database")
+    engine.add_argument("engine")
+    engine.add_argument("repeat", type=int)
+
+    args = parser.parse_args()
+    if args.command == "add":
+        benchAdd(args.sizes, args.repeat)
+    elif args.command == "load":
+        benchLoad(args.sizes)
+    elif args.command == "memory":
+        benchMemory(args.sizes)
+    elif args.command == "search":
+        benchSearch(args.size, args.repeat)
+    elif args.command == "parallel":
+        benchParallel(args.size, args.workers, args.repeat)
+    elif args.command == "fuzzy":
+        benchFuzzy(args.size, args.repeat)
+    elif args.command == "import":
+        benchImport(args.sizes)
+    elif args.command == "sqlite":
+        benchSqlite(args.sizes, args.repeat)
+    elif args.command == "menu":
+        benchMenu(args.lines, args.repeat)
+    elif args.command == "incremental":
+        benchIncremental(args.size, args.limit)
+    elif args.command == "service":
+        benchService(args.size, args.clients, args.requests, args.writes, args.port)
+    elif args.command == "snapshot":
+        benchSnapshot(args.sizes)
+    elif args.command == "stress":
+        benchStress(args.size, args.readers, args.writers, args.seconds, args.batch)
+    elif args.command == "_load":
+        loadOnce(args.path, args.mode)
+    elif args.command == "_engine":
+        engineOnce(args.path, args.database, args.engine, args.repeat)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+from abc import ABC, abstractmethod
+import csv
+import json
+import os
+from storage import Storage
+
+class BulkFormat(ABC):
+    """
+    An abstract class for file formats used to import and export many items at once.
+    Files are read and written one item at a time, so that they never have to fit in memory.
+    """
+
+    @abstractmethod
+    def read(self, path):
+        """
+        Reads the items of a file.
+
+        Parameters:
+            path (str): The file to read
+
+        Returns:
+            A generator of (line, dictionary) pairs, where line is the position of the item in the file.
+            An item that cannot be parsed gives (line, ValueError) instead
+
+        Raises:
+            ValueError: If the file as a whole cannot be parsed
+        """
+
+    @abstractmethod
+    def write(self, file, records):
+        """
+        Writes items into a file.
+
+        Parameters:
+            file: A file opened in text mode
+            records (iterable): Dictionaries of the items, in the format they are stored in
+        """
+
+    @staticmethod
+    def of(path, format=None, fields=(), roles=()):
+        """
+        Returns the format of a file.
+
+        Parameters:
+            path (str): The file. Its extension gives the format if format is None
+            format (str): "csv", "jsonl" or "json". Default=None
+            fields (list): Names of all fields that are not contributors, used by csv
+            roles (list): Types of contributors written by csv
+
+        Returns:
+            A BulkFormat object
+        """
+        if format is None:
+            format = os.path.splitext(path)[1].lower().lstrip(".")
+            format = "jsonl" if format == "ndjson" else format
+        if format == "csv":
+            return CsvFormat(fields, roles)
+        elif format == "jsonl":
+            return JsonLinesFormat()
+        elif format == "json":
+            return JsonFormat()
+        raise ValueError("Invalid format.")
+
+
+class JsonLinesFormat(BulkFormat):
+    """
+    A file holding one item per line as json, in the format they are stored in.
+    """
+
+    def read(self, path):
+        """
+        Overwrites read method in BulkFormat class. Blank lines are skipped.
+        """
+        with open(path, encoding="utf-8") as file:
+            for line, text in enumerate(file, 1):
+                if text.strip() == "":
+                    continue
+                try:
+                    yield line, json.loads(text)
+                except json.JSONDecodeError as e:
+                    yield line, ValueError(f"Invalid json: {e.msg}.")
+
+    def write(self, file, records):
+        """
+        Overwrites write method in BulkFormat class.
+        """
+        for d in records:
+            file.write(json.dumps(d, ensure_ascii=False) + "\n")
+
+
+class JsonFormat(BulkFormat):
+    """
+    A json file holding an array of items, as written by JsonStorage.
+    """
+
+    def read(self, path):
+        """
+        Overwrites read method in BulkFormat class. Items are numbered from 1 instead of by line.
+        """
+        with open(path, "rb") as file:
+            yield from enumerate(Storage.iterArray(file), 1)
+
+    def write(self, file, records):
+        """
+        Overwrites write method in BulkFormat class. The output is the same as json.dump(records, indent=4).
+        """
+        separator = "[\n"
+        for d in records:
+            file.write(separator + "    " + json.dumps(d, indent=4).replace("\n", "\n    "))
+            separator = ",\n"
+        file.write("[]" if separator == "[\n" else "\n]")
+
+
+class CsvFormat(BulkFormat):
+    """
+    A csv file with a header and one item per row. Columns are named like the fields returned by search():
+    Title, Type, one column per type of contributor (Author, Director, ...), then the other fields.
+    Columns that an item does not have are left empty.
+    """
+
+    def __init__(self, fields, roles=()):
+        """
+        Initializes a CsvFormat object.
+
+        Parameters:
+            fields (list): Names of all fields that are not contributors. Other columns are read as contributors
+            roles (list): Types of contributors to write a column for
+        """
+        self.__fields = list(fields)
+        self.__roles = list(roles)
+
+    def read(self, path):
+        """
+        Overwrites read method in BulkFormat class. Lines are counted from the header.
+        """
+        known = set(self.__fields) | {"Title", "Type"}
+        with open(path, newline="", encoding="utf-8") as file:
+            reader = csv.DictReader(file)
+            try:
+                for row in reader:
+                    d = {"Title": row.get("Title"), "Type": row.get("Type"), "Contributor": {}}
+                    for k, v in row.items():
+                        if v is None or v == "" or k is None:
+                            continue
+                        if k in known:
+                            d.setdefault(k, v)
+                        else:
+                            d["Contributor"][k] = v
+                    yield reader.line_num, d
+            except csv.Error as e:
+                raise ValueError(f"Line {reader.line_num}: {e}.")
+
+    def write(self, file, records):
+        """
+        Overwrites write method in BulkFormat class.
+        """
+        writer = csv.writer(file)
+        writer.writerow(["Title", "Type"] + self.__roles + self.__fields)
+        for d in records:
+            row = [d["Title"], d["Type"]]
+            row += [d["Contributor"].get(r, "") for r in self.__roles]
+            row += [d.get(f, "") for f in self.__fields]
+            writer.writerow(row)
@@ -1,25 +1,93 @@
 from abc import ABC, abstractmethod
+from collections import deque
+from contextlib import contextmanager
+from itertools import islice
 import json
-import re
+import multiprocessing
+import pickle
+import sys
+import threading
+from types import MappingProxyType
+from weakref import WeakValueDictionary, finalize
+from bulk import BulkFormat, CsvFormat
+from columnar import ColumnStore
+from incremental import IncrementalSearch
+from index import ContributorIndex, FuzzyIndex, HashIndex, NormalizedKeys, SearchPattern, SortedView, TokenIndex
+from locking import ReadWriteLock
+from parallel import ParallelSearch
+from snapshot import Snapshot
+from storage import JournalStorage, Storage
 
 class Catalog:
     """
     A class that simulates a library catalog and its functionality to track available items in the library.
+
+    A catalog can be shared by threads. Searches and listings run at the same time under a read lock, while
+    additions, deletions and reloads run one at a time under a write lock, which also serializes the writes
+    of the storage. Generators returned by iterSearch() and iterItems() read the catalog as it was when they
+    were made: their ids are found at once, and items are built in batches, each under the read lock, so
+    that writers can run in between. Items removed meanwhile are kept until no such generator can read them.
     """
+    __types = ["Book", "CD", "DVD", "Magazine"]
+    __identifiers = ["UPC", "ISBN", "ASIN"]
+    __indexes = ["index", "views", "identifiers", "fuzzy", "keys", "contributors"]
 
-    def __init__(self, dataPath):
+    def __init__(self, dataPath, storage=None, lazy=False, columnar=False, snapshot=False, readOnly=False):
         """
         Initializes a Catalog object.
 
         Parameters:
             dataPath: The path to a json file containing information about library items
+            storage (Storage): Where changes are persisted. Default is a JournalStorage on dataPath,
+                read-only if readOnly is True
+            lazy (bool): If True, items are kept as raw dictionaries until a search or listing touches them,
+                and the index is built by the first search. Default=False
+            columnar (bool): If True, items are kept in a ColumnStore instead of as objects, and are built
+                every time they are used. This only saves memory above tens of thousands of items, about 11% at
+                100,000, and makes searches and listings several times slower. See ColumnStore. Default=False
+            snapshot (bool): If True, items and indexes are restored from the binary snapshot next to dataPath
+                when it was made from the same storage files and signed with the key of the user, and only the
+                changes journaled since then are applied. In lazy mode the indexes are restored by the first
+                search. A missing or stale snapshot is written again by a background process. See saveSnapshot()
+                and Snapshot. Default=False
+            readOnly (bool): If True, the catalog cannot be changed and never writes a file, not even its
+                snapshot, so that it can be searched while other programs write it. Default=False
         """
-        self.__dataPath = dataPath
-        with open(dataPath) as file:
-            self.__data = json.load(file)
+        self.__storage = storage if storage is not None else JournalStorage(dataPath, readOnly=readOnly)
+        self.__readOnly = readOnly
+        self.__lazy = lazy
+        self.__columnar = columnar
 
-        self.__items = []
-        self.__update()
+        self.__items = ColumnStore(Catalog.__build) if columnar else {}
+        self.__index = None if lazy else TokenIndex()
+        self.__views = None if lazy else SortedView()
+        self.__identifiers = None if lazy else HashIndex(Catalog.__identifiers)
+        self.__fuzzy = None if lazy else {"Title": FuzzyIndex(), "Contributor": FuzzyIndex()}
+        self.__keys = None if lazy else NormalizedKeys()
+        self.__contributors = None if lazy else ContributorIndex()
+        self.__nextId = 0
+        self.__version = 0
+        self.__parallel = None
+        self.__dataPath = dataPath
+        self.__pending = None
+        self.__rebuilding = False
+        self.__lock = ReadWriteLock()
+        self.__searching = threading.Lock()
+        # Generators reading an older version of the catalog, counted by version, and the removed items they may read.
+        self.__readers = {}
+        self.__counting = threading.Lock()
+        self.__released = deque()
+        self.__retired = {}
+        # Loading may repair the journal, which must not happen while another program appends to it.
+        with self.__storage.lock():
+            stamp = self.__storage.stamp()
+            stale = self.__restore() if snapshot else None
+            if stale is None:
+                self.__insert(self.__storage.load())
+        self.__stamp = stamp
+        # The rebuild is forked after the lock is released, so that the new process does not hold it.
+        if snapshot and stale is not False:
+            self.__rebuild()
 
     @staticmethod
     def convert(data):
@@ -32,56 +100,59 @@ class Catalog:
         Returns:
             res (str): Formatted string of data
         """
-        res = []
-        for d in data:
-            r = ""
-            for i in d:
-                r += f"{i}: {d[i]}\n"
-            res.append(r)
-        res = "\n".join(res)
-        return res
+        return "".join(Catalog.iterConvert(data))
+
+    @staticmethod
+    def iterConvert(data):
+        """
+        Yields the formatted string of convert() one item at a time.
+
+        Parameters:
+            data (iterable): Items whose information is in dictionaries, may be a generator
+
+        Returns:
+            A generator of formatted strings, one per item
+        """
+        for n, d in enumerate(data):
+            lines = [f"{i}: {d[i]}\n" for i in d]
+            if n != 0:
+                lines.insert(0, "\n")
+            yield "".join(lines)
     
-    def search(self, keyword, field=None):
+    def search(self, keyword, field=None, highlight=True):
         """
         Finds all items that matches with the provided keyword.
 
         Parameters:
             keyword (str): The keyword to search for
             field (str): The field in which the function searches. If None, the function will search all fields
+            highlight (bool): If False, matches are not marked in the returned information. Default=True
 
         Returns:
             results (list): List of all library items that matches the keyword
         """
-        if keyword == "":
-            raise ValueError("Invalid Value.")
-
-        results = []
-
-        for item in self.__items:
-            information = item.locate()
-            foundDF = False
-            if field == "Contributor":
-                for t in item.getContribTypes():
-                    if re.search(keyword, information[t], flags=re.IGNORECASE) is not None:
-                        information[t] = re.sub(keyword, self.__f, information[t], flags=re.IGNORECASE)
-                        foundDF = True
-            elif field is not None:
-                if re.search(keyword, information[field], flags=re.IGNORECASE) is not None:
-                    information[field] = re.sub(keyword, self.__f, information[field], flags=re.IGNORECASE)
-                    foundDF = True
-            else:
-                for i in information:
-                    if re.search(keyword, information[i], flags=re.IGNORECASE) is not None:
-                        information[i] = re.sub(keyword, self.__f, information[i], flags=re.IGNORECASE)
-                        foundDF = True
+        return list(self.iterSearch(keyword, field, highlight=highlight))
 
-            if foundDF:
-                results.append(information)
+    def iterSearch(self, keyword, field=None, offset=0, limit=None, highlight=True):
+        """
+        Finds items that match with the provided keyword, one at a time and in the order of search().
+        Items are only matched and highlighted when the caller asks for them.
 
-        if len(results) != 0:
-            results.sort(key=lambda x: (x["Type"], x["Title"]))
+        Parameters:
+            keyword (str): The keyword to search for
+            field (str): The field in which the function searches. If None, the function will search all fields
+            offset (int): Number of matched items to skip. Default=0
+            limit (int): Maximum number of items to return. If None, all matched items are returned
+            highlight (bool): If False, matches are not marked in the returned information. Default=True
 
-        return results
+        Returns:
+            A generator of information of the library items that match the keyword
+        """
+        query = SearchPattern(keyword)
+        self.__prepare()
+        with self.__lock.reading():
+            matches = self.__matches(query, field, highlight)
+        return islice(matches, offset, None if limit is None else offset + limit)
 
     def getItems(self):
         """
@@ -94,87 +165,917 @@ class Catalog:
                 results[2]: A list of DVD items
                 results[3]: A list of Magazine items
         """
-        results = [[], [], [], []]
-
-        for item in self.__items:
-            res = item.locate()
-            if res["Type"] == "Book":
-                del res["Type"]
-                results[0].append(res)
-            elif res["Type"] == "CD":
-                del res["Type"]
-                results[1].append(res)
-            elif res["Type"] == "DVD":
-                del res["Type"]
-                results[2].append(res)
-            elif res["Type"] == "Magazine":
-                del res["Type"]
-                results[3].append(res)
-
-        for r in results:
-            r.sort(key = lambda x: x["Title"])
-        return results
+        self.__prepare()
+        with self.__lock.reading():
+            return [list(self.iterItems(type)) for type in Catalog.__types]
 
-    def addItem(self, data):
+    def iterItems(self, type, offset=0, limit=None):
         """
-        Adds new item to library json file.
-        
+        Returns library items of one type sorted by title, one at a time.
+
         Parameters:
-            data (dict): A dictionary containing information of the item
+            type (str): Type of the items (Book, CD, DVD or Magazine)
+            offset (int): Number of items to skip. Default=0
+            limit (int): Maximum number of items to return. If None, all items are returned
+
+        Returns:
+            A generator of information of the items, without their type
+        """
+        self.__prepare()
+        with self.__lock.reading():
+            ids = islice(self.__views.ids(type), offset, None if limit is None else offset + limit)
+            return self.__read(ids, self.__listing)
+
+    def countItems(self, type):
+        """
+        Returns the number of library items of one type.
+
+        Parameters:
+            type (str): Type of the items (Book, CD, DVD or Magazine)
+        """
+        self.__prepare()
+        with self.__lock.reading():
+            return self.__views.count(type)
+
+    def lookup(self, field, value):
+        """
+        Finds items by an exact identifier, ignoring spaces, dashes and case.
+
+        Parameters:
+            field (str): The identifier field (UPC, ISBN or ASIN)
+            value (str): The identifier to look for
+
+        Returns:
+            results (list): List of all library items holding the identifier, sorted by type and title
+        """
+        if field not in Catalog.__identifiers:
+            raise ValueError("Invalid field.")
+
+        self.__prepare()
+        with self.__lock.reading():
+            return [dict(self.__item(id).view()) for id in self.__order(self.__identifiers.get(field, value))]
+
+    def duplicates(self, field):
+        """
+        Finds identifiers that are held by more than one item.
+
+        Parameters:
+            field (str): The identifier field (UPC, ISBN or ASIN)
+
+        Returns:
+            results (dict): Maps every duplicated identifier to the list of library items holding it
+        """
+        if field not in Catalog.__identifiers:
+            raise ValueError("Invalid field.")
+
+        self.__prepare()
+        with self.__lock.reading():
+            return {value: [dict(self.__item(id).view()) for id in self.__order(ids)]
+                    for value, ids in self.__identifiers.duplicates(field).items()}
+
+    def byContributor(self, name, role=None):
+        """
+        Finds all items crediting a contributor, by exact name.
+
+        Parameters:
+            name (str): Name of the contributor, ignoring case and diacritics
+            role (str): Type of contributor (Author, Director, Actor, ...). If None, all roles are used
+
+        Returns:
+            results (list): List of all library items crediting the contributor, sorted by type and title
         """
+        self.__prepare()
+        with self.__lock.reading():
+            return [dict(self.__item(id).view()) for id in self.__order(self.__contributors.get(name, role))]
 
-        self.__data.extend(data)
-        updated_json = json.dumps(self.__data, indent=4)
+    def byRole(self, role):
+        """
+        Finds all items having a contributor of a type.
+
+        Parameters:
+            role (str): Type of contributor (Author, Director, Actor, ...)
 
-        with open(self.__dataPath, 'w') as file:
-            file.write(updated_json)
+        Returns:
+            results (list): List of all library items with such a contributor, sorted by type and title
+        """
+        self.__prepare()
+        with self.__lock.reading():
+            return [dict(self.__item(id).view()) for id in self.__order(self.__contributors.role(role))]
 
-        self.__update()
+    def getContributors(self, role=None):
+        """
+        Returns the names of all contributors of the library, sorted.
+
+        Parameters:
+            role (str): Type of contributor (Author, Director, Actor, ...). If None, all types are used
+        """
+        self.__prepare()
+        with self.__lock.reading():
+            return self.__contributors.names(role)
+
+    def suggest(self, prefix, field="Title", limit=10):
+        """
+        Finds items as the user types, treating the last word of prefix as incomplete.
+        Items where the last word is already complete come first, then the others, each sorted by type and title.
+
+        Parameters:
+            prefix (str): What the user has typed so far
+            field (str): Title or Contributor. Default="Title"
+            limit (int): Maximum number of items to return. Default=10
+
+        Returns:
+            results (list): List of information of the best matching library items
+        """
+        if field not in self.__fuzzyFields():
+            raise ValueError("Invalid field.")
+
+        self.__prepare()
+        with self.__lock.reading():
+            return self.__top(self.__fuzzy[field].prefix(TokenIndex.tokenize(prefix)), limit)
+
+    def fuzzySearch(self, query, field="Title", maxDistance=2, limit=10):
+        """
+        Finds items despite typos. Every word of query has to be within maxDistance edits of a word of the field.
+        Items are ranked by their total number of edits, then sorted by type and title.
+
+        Parameters:
+            query (str): The words to search for
+            field (str): Title or Contributor. Default="Title"
+            maxDistance (int): Maximum number of insertions, deletions or substitutions per word. Default=2
+            limit (int): Maximum number of items to return. Default=10
+
+        Returns:
+            results (list): List of information of the best matching library items
+        """
+        if field not in self.__fuzzyFields():
+            raise ValueError("Invalid field.")
+
+        self.__prepare()
+        with self.__lock.reading():
+            return self.__top(self.__fuzzy[field].fuzzy(TokenIndex.tokenize(query), maxDistance), limit)
+
+    def incremental(self, field=None, limit=10):
+        """
+        Starts a search that is run again on every keystroke. Each keystroke narrows the results of the
+        previous keyword instead of searching from scratch, and only the first limit results are matched.
+
+        Parameters:
+            field (str): The field in which the search looks. If None, all fields are searched
+            limit (int): Number of results returned for a keyword. Default=10
+
+        Returns:
+            An IncrementalSearch object, whose search(keyword) returns the first results and their count
+        """
+        self.__prepare()
+        with self.__lock.reading():
+            self.__index.prepare(field)
+        # Fields other than the title, the type, the UPC and contributors belong to some types only.
+        types = [t for t in Catalog.__types if field in Catalog.__classOf({"Type": t})._fields]
+        return IncrementalSearch(self.__views, types if len(types) != 0 else None, self.__key,
+                                 lambda id, query: self.__test(id, query, field),
+                                 lambda id, query: self.__highlight(id, query.highlighter(self.__keys.getter()), field),
+                                 lambda keyword, vocabulary: self.__index.candidates(keyword, field, vocabulary),
+                                 lambda: self.__version,
+                                 limit, lock=self.__lock.reading)
+
+    def setParallel(self, workers, threshold=100000, shardSize=None):
+        """
+        Makes searches with regular expressions run on several processes for large catalogs.
+        Plain keywords are looked up in the index and are not affected.
+
+        Parameters:
+            workers (int): Number of worker processes. 1 turns parallel search off
+            threshold (int): Catalogs with fewer items than this are still searched in one process
+            shardSize (int): Number of items sent to a worker at a time. If None, items are split evenly
+        """
+        with self.__lock.writing():
+            if self.__parallel is not None:
+                self.__parallel.close()
+            self.__parallel = ParallelSearch(workers, threshold, shardSize) if workers > 1 else None
+
+    def addItem(self, data):
+        """
+        Adds new items to the library and persists them in its storage.
+        Only the new items are built and indexed, the rest of the library is left untouched.
+        
+        Parameters:
+            data (list): A list of dictionaries containing information of the items
+        """
+        with self.__writing():
+            self.__insert(data)
+            self.__commit(data, [])
 
     def deleteItems(self, keyword):
         """
-        Deletes items that match with keyword by title.
+        Deletes items that match with keyword by title, which are the items search(keyword, "Title") finds.
+        Plain keywords are looked up in the token index. Only the matched items are removed from the library
+        and its indexes, with a single storage write.
 
         Parameters:
             keyword (str): keyword to search for
+
+        Returns:
+            count (int): Number of deleted items
         """
-        newData = []
-        for i in range(len(self.__data)):
-            if keyword not in self.__data[i]["Title"]:
-                newData.append(self.__data[i])
+        query = SearchPattern(keyword)
+        with self.__writing():
+            self.__ensureIndex()
+            candidates = None if query.isRegex() else self.__index.candidates(query.getKeyword(), "Title")
+            ids = self.__items if candidates is None else sorted(candidates)
+            return self.__delete([id for id in ids if self.__test(id, query, "Title")])
 
-        self.__data = newData
+    def deleteByIdentifier(self, field, values):
+        """
+        Deletes all items holding any of many identifiers, ignoring spaces, dashes and case like lookup().
+        Items are found in the identifier index, and removed with a single storage write.
 
-        updated_json = json.dumps(self.__data, indent=4)
+        Parameters:
+            field (str): The identifier field (UPC, ISBN or ASIN)
+            values (list): The identifiers of the items to delete
 
-        with open(self.__dataPath, 'w') as file:
-            file.write(updated_json)
+        Returns:
+            count (int): Number of deleted items
+        """
+        if field not in Catalog.__identifiers:
+            raise ValueError("Invalid field.")
 
-        self.__update()
+        with self.__writing():
+            self.__ensureIndex()
+            ids = set()
+            for value in values:
+                ids.update(self.__identifiers.get(field, value))
+            return self.__delete(sorted(ids))
 
+    def compact(self):
+        """
+        Writes all items of the library into a single snapshot and clears pending changes in the storage.
+        Changes made by other programs are read first, so that they are kept.
+        """
+        with self.__writing():
+            self.__storage.compact(self.__records())
+            self.__stamp = self.__storage.stamp()
 
-    def __update(self):
+    def saveSnapshot(self):
         """
-        Updates items in the library.
+        Writes the items and indexes of the catalog into its binary snapshot, next to the data file,
+        together with the position of the storage they were read up to.
+
+        Raises:
+            ValueError: If the storage cannot tell its position, so the snapshot could never be used
         """
-        items = []
-        for d in self.__data:
-            if d["Type"] == "Book":
-                item = Book(d)
-            elif d["Type"] == "CD":
-                item = CD(d)
-            elif d["Type"] == "DVD":
-                item = DVD(d)
-            else:
-                item = Magazine(d)
-            items.append(item)
+        self.__prepare()
+        with self.__lock.reading():
+            position = self.__storage.position()
+            if position is None:
+                raise ValueError("Invalid storage.")
+            sections = {"items": self.__items, "nextId": self.__nextId, "index": self.__index, "views": self.__views,
+                        "identifiers": self.__identifiers, "fuzzy": self.__fuzzy, "keys": self.__keys,
+                        "contributors": self.__contributors}
+            Snapshot.write(Snapshot.pathOf(self.__dataPath), {"position": position, "columnar": self.__columnar},
+                           sections, {"build": Catalog.__build} if self.__columnar else None)
+
+    @staticmethod
+    def create(dataPath, data, storage=None):
+        """
+        Creates a catalog holding data, replacing the one at dataPath if there is one.
+        Its journal and its snapshot are dropped, so that none of the changes made to the old catalog
+        is applied to the new one, even if both hold the same items.
+
+        Parameters:
+            dataPath: The path to the json file of the catalog
+            data (list): Dictionaries of the items
+            storage (Storage): Where the items are written. Default is a JournalStorage on dataPath
+        """
+        storage = storage if storage is not None else JournalStorage(dataPath)
+        with storage.lock():
+            storage.compact(data)
+        Snapshot.remove(Snapshot.pathOf(dataPath))
+
+    @staticmethod
+    def buildSnapshot(dataPath, storage=None, columnar=False):
+        """
+        Loads a catalog and writes its snapshot. The background rebuild runs this in another process.
+
+        Parameters:
+            dataPath: The path to a json file containing information about library items
+            storage (Storage): Where the items are read from. Default is a JournalStorage on dataPath
+            columnar (bool): If True, the snapshot is made for catalogs in columnar mode. Default=False
+
+        Returns:
+            True if the snapshot was written, False if the storage could not be read or cannot tell its position
+        """
+        try:
+            Catalog(dataPath, storage, columnar=columnar).saveSnapshot()
+        except (OSError, ValueError):
+            return False
+        return True
+
+    def reload(self):
+        """
+        Picks up the changes that other programs made to the storage since the catalog was loaded or written.
+        Nothing is read when the files of the storage are unchanged. Batches appended to a journal are applied
+        on their own. Otherwise the storage is loaded again, and only the items that differ from the ones in
+        memory are removed and added, so that the other items keep their place in the indexes.
+
+        Returns:
+            changed (bool): True if items were added or deleted
+        """
+        stamp = self.__storage.stamp()
+        if stamp is None or stamp == self.__stamp:
+            return False
+        with self.__lock.writing(), self.__storage.lock():
+            version = self.__version
+            self.__sync()
+            return self.__version != version
+
+    def importItems(self, path, format=None):
+        """
+        Adds the items of a csv, json-lines or json file to the library.
+        The whole file is read and validated first, then its valid items are added with a single storage write,
+        so that a file that cannot be read leaves the library unchanged. Invalid items are skipped.
+
+        Parameters:
+            path (str): The file to read
+            format (str): "csv", "jsonl" or "json". If None, it is guessed from the extension of path
+
+        Returns:
+            count (int): Number of added items
+            rejected (list): (line, reason) pairs of the skipped items
+
+        Raises:
+            ValueError: If the format is unknown or the file is not valid
+            OSError: If the file cannot be read
+        """
+        valid, rejected = Catalog.checkItems(BulkFormat.of(path, format, Catalog.columns()).read(path))
+        if len(valid) != 0:
+            with self.__writing():
+                self.__insert(valid)
+                self.__commit(valid, [])
+        return len(valid), rejected
+
+    @staticmethod
+    def columns():
+        """
+        Returns the names of the fields of all types of items that are not contributors, as used in csv files.
+        """
+        columns = []
+        for cls in (Book, CD, DVD, Magazine):
+            columns += [f for f in cls._fields if f not in columns]
+        return columns + ["UPC"]
+
+    @staticmethod
+    def checkItems(rows):
+        """
+        Validates items read from a file, type by type.
+
+        Parameters:
+            rows (iterable): (line, dictionary) pairs of the items, or (line, ValueError) pairs of the items
+                that could not be parsed
+
+        Returns:
+            valid (list): Dictionaries of the valid items, in the order of rows
+            rejected (list): (line, reason) pairs of the invalid items, in the order of rows
+        """
+        valid = []
+        rejected = []
+        for type, group in Catalog.__byType(rows).items():
+            cls = Catalog.__classOf({"Type": type}) if type in Catalog.__types else None
+            for line, d in group:
+                try:
+                    if isinstance(d, ValueError):
+                        raise d
+                    if cls is None:
+                        raise ValueError("Invalid Type.")
+                    cls.validate(d)
+                except ValueError as e:
+                    rejected.append((line, str(e)))
+                else:
+                    valid.append((line, d))
+        valid.sort(key=lambda x: x[0])
+        rejected.sort(key=lambda x: x[0])
+        return [d for line, d in valid], rejected
+
+    def export(self, path, format="json"):
+        """
+        Writes all items of the library into a file, one item at a time.
+
+        Parameters:
+            path (str): The path of the file
+            format (str): "json", "jsonl" or "csv". If None, it is guessed from the extension of path.
+                Default="json"
+        """
+        with self.__lock.reading():
+            roles = []
+            if format == "csv" or (format is None and path.lower().endswith(".csv")):
+                types = set()
+                for id in self.__items:
+                    types.update(Catalog.__describe(self.__entry(id))[1])
+                roles = sorted(types)
+            writer = BulkFormat.of(path, format, Catalog.columns(), roles)
+            with Storage.openAtomic(path, newline="" if isinstance(writer, CsvFormat) else None) as file:
+                writer.write(file, self.__records())
+
+    def __insert(self, data):
+        """
+        Adds new items to the library and its index. In lazy mode the items are not built yet.
+
+        Parameters:
+            data (iterable): Dictionaries containing information of the items
+        """
+        for d in data:
+            entry = d if self.__lazy or self.__columnar else Catalog.__build(d)
+            id = self.__nextId
+            self.__nextId += 1
+            self.__version += 1
+            self.__items[id] = entry
+            if self.__index is not None:
+                self.__indexItem(id, entry)
+        if self.__views is not None:
+            self.__views.merge()
+
+    def __remove(self, ids):
+        """
+        Removes items from the library and its index.
+
+        Parameters:
+            ids (list): Ids of the items to remove
+
+        Returns:
+            deleted (list): Dictionaries of the removed items
+        """
+        self.__prune()
+        deleted = []
+        for id in ids:
+            entry = self.__entry(id)
+            del self.__items[id]
+            self.__version += 1
+            if len(self.__readers) != 0:
+                self.__retired[id] = (entry, self.__version)
+            deleted.append(Catalog.__record(entry))
+            if self.__index is not None:
+                information, contribTypes = Catalog.__describe(entry)
+                self.__index.remove(id, information, contribTypes)
+                self.__views.remove(information["Type"], information["Title"], id)
+                self.__identifiers.remove(id, information)
+                self.__keys.remove(information)
+                self.__contributors.remove(id, information, contribTypes)
+                for field, words in Catalog.__words(information, contribTypes).items():
+                    self.__fuzzy[field].remove(id, words)
+        if self.__views is not None:
+            self.__views.merge()
+        return deleted
+
+    def __restore(self):
+        """
+        Restores the items, and unless in lazy mode the indexes, from the snapshot if the storage can resume
+        from where it was made, then applies the changes made since.
+
+        Returns:
+            stale (bool): None if the snapshot was not used, else True if changes were made since it was written
+        """
+        snapshot = Snapshot.open(Snapshot.pathOf(self.__dataPath), {"build": Catalog.__build})
+        if snapshot is None:
+            return None
+        source = snapshot.source()
+        if not isinstance(source, dict) or source.get("columnar") != self.__columnar \
+                or not self.__storage.resume(source.get("position")):
+            snapshot.close()
+            return None
+        try:
+            items = snapshot.load("items")
+            nextId = snapshot.load("nextId")
+            indexes = None if self.__lazy else [snapshot.load(name) for name in Catalog.__indexes]
+        except (pickle.UnpicklingError, EOFError, AttributeError, ImportError, IndexError, KeyError, TypeError,
+                ValueError):
+            snapshot.close()
+            return None
+
         self.__items = items
-            
-    def __f(self, match):
+        self.__nextId = nextId
+        if indexes is None:
+            self.__pending = (snapshot, self.__version)
+        else:
+            self.__index, self.__views, self.__identifiers, self.__fuzzy, self.__keys, self.__contributors = indexes
+            snapshot.close()
+        batches = self.__storage.follow()
+        if batches is None:
+            self.__replace(self.__storage.load())
+        else:
+            for added, deleted in batches:
+                self.__insert(added)
+                self.__discard(deleted)
+        return batches is None or len(batches) != 0
+
+    def __rebuild(self):
+        """
+        Writes the snapshot again in a background process, which reads the storage without writing it.
+        """
+        reader = self.__storage.reader()
+        if reader is None or self.__rebuilding or self.__readOnly:
+            return
+        self.__rebuilding = True
+        # A forked process starts at once, without importing the modules again. It is not a daemon,
+        # so a program exiting before the snapshot is written waits for it instead of wasting it.
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context("fork" if "fork" in methods else None)
+        context.Process(target=Catalog.buildSnapshot, args=(self.__dataPath, reader, self.__columnar)).start()
+
+    def __delete(self, ids):
+        """
+        Removes items and persists their removal, unless there are none. Must run under the write lock.
+
+        Returns:
+            count (int): Number of deleted items
+        """
+        deleted = self.__remove(ids)
+        if len(deleted) != 0:
+            self.__commit([], deleted)
+        return len(deleted)
+
+    @contextmanager
+    def __writing(self):
+        """
+        Holds the write lock and the lock of the storage inside a with block, after reading the changes
+        other programs made to the storage, so that a batch is always written after the ones it follows.
+
+        Raises:
+            ValueError: If the catalog is read-only
+        """
+        if self.__readOnly:
+            raise ValueError("Read-only catalog.")
+        with self.__lock.writing(), self.__storage.lock():
+            self.__sync()
+            yield
+
+    def __sync(self):
+        """
+        Applies the changes other programs made to the storage since the catalog last read or wrote it.
+        Must run under the write lock and the lock of the storage.
+        """
+        stamp = self.__storage.stamp()
+        if stamp is None or stamp == self.__stamp:
+            return
+        batches = self.__storage.follow()
+        if batches is None:
+            self.__replace(self.__storage.load())
+        else:
+            for added, deleted in batches:
+                self.__insert(added)
+                self.__discard(deleted)
+        self.__stamp = stamp
+
+    def __commit(self, added, deleted):
+        """
+        Persists one batch of changes, remembering the state of the storage after it
+        so that reload() does not read the catalog's own changes again. If the storage holds changes
+        the catalog has not read, the state is forgotten instead, so that the next write or reload loads it.
+        """
+        current = self.__storage.commit(added, deleted, self.__records())
+        self.__stamp = self.__storage.stamp() if current is not False else None
+
+    def __replace(self, records):
+        """
+        Makes the library hold the given items, only removing and adding the items that differ.
+
+        Parameters:
+            records (iterable): Dictionaries of all items
+        """
+        current = {}
+        for id in self.__items:
+            current.setdefault(Catalog.__fingerprint(Catalog.__record(self.__entry(id))), []).append(id)
+        added = []
+        for d in records:
+            ids = current.get(Catalog.__fingerprint(d))
+            if ids:
+                ids.pop()
+            else:
+                added.append(d)
+        self.__remove([id for ids in current.values() for id in ids])
+        self.__insert(added)
+
+    def __discard(self, records):
+        """
+        Removes an item holding the same information for every dictionary, like the journal does when it is replayed.
+        Items are found by UPC when the indexes are built.
+
+        Parameters:
+            records (list): Dictionaries of the items to remove
+        """
+        wanted = {}
+        for d in records:
+            key = Catalog.__fingerprint(d)
+            wanted[key] = wanted.get(key, 0) + 1
+        if self.__identifiers is not None and all(isinstance(d.get("UPC"), str) for d in records):
+            ids = (id for d in records for id in self.__identifiers.get("UPC", d["UPC"]))
+        else:
+            ids = list(self.__items)
+        chosen = {}
+        for id in ids:
+            key = Catalog.__fingerprint(Catalog.__record(self.__entry(id)))
+            if wanted.get(key, 0) > 0 and id not in chosen:
+                wanted[key] -= 1
+                chosen[id] = True
+        self.__remove(list(chosen))
+
+    def __item(self, id):
+        """
+        Returns the item with the given id, building it first if it is still a raw dictionary.
+        """
+        try:
+            entry = self.__items[id]
+        except KeyError:
+            entry = self.__retired[id][0]
+            return Catalog.__build(entry) if isinstance(entry, dict) else entry
+        if isinstance(entry, dict):
+            entry = Catalog.__build(entry)
+            self.__items[id] = entry
+        return entry
+
+    def __entry(self, id):
+        """
+        Returns the item with the given id if it is built, else its raw dictionary.
+        """
+        try:
+            return self.__items.record(id) if self.__columnar else self.__items[id]
+        except KeyError:
+            return self.__retired[id][0]
+
+    def __entries(self):
+        """
+        Returns a generator of (id, keys, contribTypes) of all items, used to start parallel search.
+        keys holds the folded search keys of the item's fields.
+        """
+        for id in self.__items:
+            information, contribTypes = Catalog.__describe(self.__entry(id))
+            yield id, {k: self.__keys.get(v) for k, v in information.items()}, contribTypes
+
+    def __records(self):
+        """
+        Returns a generator of dictionaries of all items, in the format they are stored in.
+        """
+        return (Catalog.__record(self.__entry(id)) for id in self.__items)
+
+    def __ensureIndex(self):
+        """
+        Builds the indexes and the sorted views if they have been deferred by lazy mode.
         """
-        Wraps matched strings with green background.
+        if self.__pending is not None:
+            snapshot, version = self.__pending
+            self.__pending = None
+            try:
+                # Indexes in the snapshot only hold the items restored with them.
+                if version == self.__version:
+                    indexes = [snapshot.load(name) for name in Catalog.__indexes]
+                    self.__index, self.__views, self.__identifiers, self.__fuzzy, self.__keys, \
+                        self.__contributors = indexes
+            except (pickle.UnpicklingError, EOFError, AttributeError, ImportError, IndexError, KeyError,
+                    TypeError, ValueError):
+                pass
+            finally:
+                snapshot.close()
+        if self.__index is None:
+            self.__index = TokenIndex()
+            self.__views = SortedView()
+            self.__identifiers = HashIndex(Catalog.__identifiers)
+            self.__fuzzy = {"Title": FuzzyIndex(), "Contributor": FuzzyIndex()}
+            self.__keys = NormalizedKeys()
+            self.__contributors = ContributorIndex()
+            for id in self.__items:
+                self.__indexItem(id, self.__entry(id))
+            self.__views.merge()
+
+    def __prepare(self):
+        """
+        Builds or restores the indexes deferred by lazy mode before a read, since doing so writes the catalog.
+        """
+        if self.__index is None or self.__pending is not None:
+            with self.__lock.writing():
+                self.__ensureIndex()
+
+    def __read(self, ids, function):
+        """
+        Returns a generator of function(id) for ids, leaving out None. The results are computed in batches
+        that grow from 8 to 512, each under the read lock, so that the first results come fast and writers
+        can run between batches. Items removed after this is called can still be read by the generator.
+
+        Parameters:
+            ids (iterable): Ids of the items, found under the read lock before this is called
+            function (function): Given an id, returns what the generator yields for it
+        """
+        def read():
+            size = 8
+            while True:
+                batch = list(islice(ids, size))
+                if len(batch) == 0:
+                    return
+                with self.__lock.reading():
+                    results = [function(id) for id in batch]
+                yield from (res for res in results if res is not None)
+                size = min(size * 2, 512)
+
+        version = self.__version
+        with self.__counting:
+            self.__readers[version] = self.__readers.get(version, 0) + 1
+        generator = read()
+        # The generator is released by the garbage collector, which may run in any thread, even one holding the lock.
+        finalize(generator, self.__released.append, version)
+        return generator
+
+    def __prune(self):
+        """
+        Forgets the generators that were released and the removed items that no generator can read anymore.
+        """
+        with self.__counting:
+            while len(self.__released) != 0:
+                version = self.__released.popleft()
+                count = self.__readers[version] - 1
+                if count == 0:
+                    del self.__readers[version]
+                else:
+                    self.__readers[version] = count
+            oldest = min(self.__readers, default=None)
+        if len(self.__retired) != 0:
+            # A generator reads the items removed after its version.
+            self.__retired = {id: r for id, r in self.__retired.items() if oldest is not None and r[1] > oldest}
+
+    def __indexItem(self, id, entry):
+        """
+        Adds an item to the indexes and the sorted views.
+        """
+        information, contribTypes = Catalog.__describe(entry)
+        self.__index.add(id, information, contribTypes)
+        self.__views.add(information["Type"], information["Title"], id)
+        self.__identifiers.add(id, information)
+        self.__keys.add(information)
+        self.__contributors.add(id, information, contribTypes)
+        for field, words in Catalog.__words(information, contribTypes).items():
+            self.__fuzzy[field].add(id, words)
+
+    @staticmethod
+    def __classOf(d):
+        """
+        Returns the class of library item that a dictionary describes.
+        """
+        if d["Type"] == "Book":
+            return Book
+        elif d["Type"] == "CD":
+            return CD
+        elif d["Type"] == "DVD":
+            return DVD
+        else:
+            return Magazine
+
+    @staticmethod
+    def __byType(rows):
+        """
+        Groups (line, dictionary) pairs by the type of item they describe.
+        """
+        groups = {}
+        for line, d in rows:
+            type = d.get("Type") if isinstance(d, dict) else None
+            groups.setdefault(type if isinstance(type, str) else None, []).append((line, d))
+        return groups
+
+    @staticmethod
+    def __build(d):
+        """
+        Builds a library item from its dictionary.
+        """
+        return Catalog.__classOf(d)(d)
+
+    @staticmethod
+    def __record(entry):
+        """
+        Returns the dictionary of a built item or of a raw dictionary.
+        """
+        return entry if isinstance(entry, dict) else entry.toDict()
+
+    @staticmethod
+    def __fingerprint(d):
+        """
+        Returns a key that is equal for dictionaries holding the same information, in any order.
+        """
+        try:
+            return frozenset((k, frozenset(v.items()) if isinstance(v, dict) else v) for k, v in d.items())
+        except TypeError:
+            return json.dumps(d, sort_keys=True)
+
+    @staticmethod
+    def __describe(entry):
+        """
+        Returns the information and contributors' types of a built item or of a raw dictionary.
+        """
+        if isinstance(entry, dict):
+            return Catalog.__classOf(entry).project(entry), list(entry["Contributor"])
+        return entry.view(), entry.getContribTypes()
+
+    def __matches(self, query, field, highlight=True):
+        """
+        Returns a generator of highlighted information of items matching a query, sorted by type and title.
+        Plain keywords are looked up in the token index. Keywords containing regular expression syntax
+        are matched against every item. The ids to match are found at once, under the read lock.
+
+        Parameters:
+            query (SearchPattern): The keyword to search for
+            field (str): The field in which the function searches. If None, all fields are searched
+            highlight (bool): If False, matched fields are left as they are. Default=True
         """
-        return "\x1b[6;30;42m" + match.group(0)[0] + match.group(0)[1:] + "\x1b[0m"
+        highlight = query.highlighter(self.__keys.getter(), highlight)
+        pattern = query.getPattern()
+        candidates = None if query.isRegex() else self.__index.candidates(query.getKeyword(), field)
+
+        if candidates is None and self.__parallel is not None and self.__parallel.accepts(len(self.__items)):
+            # The worker processes serve one search at a time.
+            with self.__searching:
+                ids = self.__order(self.__parallel.search(pattern.pattern, pattern.flags, field, self.__version,
+                                                          self.__entries))
+        elif candidates is None:
+            ids = self.__views.ids()
+        else:
+            ids = self.__order(candidates)
+        return self.__read(iter(ids), lambda id: self.__highlight(id, highlight, field))
+
+    def __highlight(self, id, highlight, field):
+        """
+        Returns information of an item with the matches of a highlighter marked, or None if nothing matches.
+        """
+        item = self.__item(id)
+        view = item.view()
+        information = None
+        for i in Catalog.__fields(item, view, field):
+            value, count = highlight(view[i])
+            if count != 0:
+                if information is None:
+                    information = dict(view)
+                information[i] = value
+        return information
+
+    def __test(self, id, query, field):
+        """
+        Returns True if a field of an item matches a query.
+        """
+        item = self.__item(id)
+        view = item.view()
+        key = self.__keys.getter()
+        return any(query.matches(key(view[i])) for i in Catalog.__fields(item, view, field))
+
+    def __order(self, ids):
+        """
+        Sorts ids of items by the type and title of the items.
+        """
+        return self.__views.order(ids, self.__key)
+
+    def __top(self, tiers, limit):
+        """
+        Returns information of the first limit items of a list of tiers of ids, sorting each tier by type and title.
+        """
+        ids = []
+        for tier in tiers:
+            ids += self.__views.first(tier, limit - len(ids), self.__key)
+        return [dict(self.__item(id).view()) for id in ids]
+
+    def __key(self, id):
+        """
+        Returns the (type, title) pair by which an item is sorted.
+        """
+        information = self.__item(id).view()
+        return information["Type"], information["Title"]
+
+    def __listing(self, id):
+        """
+        Returns information of an item as shown in listings, without its type.
+        """
+        res = dict(self.__item(id).view())
+        del res["Type"]
+        return res
+
+    @staticmethod
+    def __fuzzyFields():
+        """
+        Returns the fields that can be searched by suggest() and fuzzySearch().
+        """
+        return ["Title", "Contributor"]
+
+    @staticmethod
+    def __words(information, contribTypes):
+        """
+        Returns the normalized words of the title and of the contributors' names of an item.
+        """
+        contributors = set()
+        for t in contribTypes:
+            contributors.update(TokenIndex.tokenize(information[t]))
+        return {"Title": set(TokenIndex.tokenize(information["Title"])), "Contributor": contributors}
+
+    @staticmethod
+    def __fields(item, information, field):
+        """
+        Returns the names of the fields of an item that a search on field has to look at.
+        """
+        if field == "Contributor":
+            return item.getContribTypes()
+        if field is not None:
+            return [field] if field in information else []
+        return list(information)
 
 
 class LibraryItem(ABC):
@@ -183,6 +1084,9 @@ class LibraryItem(ABC):
     An abstract class that contains information about an item in the library.
     The item can be a Book, a CD, a DVD, or a Magazine.
     """
+    __slots__ = ("_title", "_UPC", "_contributors", "_information", "_record")
+    _fields = ()
+
     def __init__(self, data):
         """
         A customized constructor for derived class.
@@ -192,14 +1096,37 @@ class LibraryItem(ABC):
         """
         self._title = data["Title"]
         self._UPC = data["UPC"]
+        self._information = None
         self._contributors = []
         for d in data["Contributor"]:
             self._contributors.append(ContributorWithType(d, data["Contributor"][d]))
+        # toDict() rebuilds the dictionary from the fields of the item. A dictionary it would rebuild
+        # differently, with other keys, another order or an unknown type, is kept as it is instead.
+        self._record = None if self.__rebuildable(data) else data
     
-    @abstractmethod
     def locate(self) -> dict:
         """
-        An abstract method that locates the item in the library inventory.
+        Locates the item in the library inventory.
+        The information is computed once and cached. The result is a copy of the cache,
+        so callers may change it without affecting the item.
+
+        Returns:
+            A dictionary containing information of the item.
+        """
+        return dict(self.view())
+
+    def view(self):
+        """
+        Returns a read-only view of the cached information of the item, computing it on first use.
+        """
+        if self._information is None:
+            self._information = MappingProxyType(self._describe())
+        return self._information
+
+    @abstractmethod
+    def _describe(self) -> dict:
+        """
+        An abstract method that computes the information of the item returned by locate().
 
         Returns:
             A dictionary containing information of the item.
@@ -211,10 +1138,78 @@ class LibraryItem(ABC):
         """
         return [c.getType() for c in self._contributors]
 
+    def toDict(self):
+        """
+        Returns the dictionary the item was built from, in the format it is stored in.
+        """
+        if self._record is not None:
+            return self._record
+        information = self.view()
+        types = self.getContribTypes()
+        res = {
+            "Title": information["Title"],
+            "Type": information["Type"],
+            "Contributor": {t: information[t] for t in types}
+        }
+        for i in information:
+            if i not in res and i not in types:
+                res[i] = information[i]
+        return res
+
+    def __rebuildable(self, data):
+        """
+        Returns True if toDict() gives back data, key by key and in the same order.
+        """
+        contributors = data["Contributor"]
+        keys = ["Title", "Type", "Contributor", *self._fields, "UPC"]
+        return list(data) == keys and data["Type"] == type(self).__name__ \
+            and all(isinstance(v, str) for v in contributors.values()) and contributors.keys().isdisjoint(keys)
+
+    @classmethod
+    def validate(cls, data):
+        """
+        Checks that data holds every field an item of this class needs.
+
+        Parameters:
+            data (dict): A dictionary containing information of the item
+
+        Raises:
+            ValueError: If a field is missing or is not a string
+        """
+        for f in ("Title",) + cls._fields + ("UPC",):
+            if not isinstance(data.get(f), str) or data[f] == "":
+                raise ValueError(f"Missing {f}.")
+        contributors = data.get("Contributor")
+        if not isinstance(contributors, dict) or len(contributors) == 0:
+            raise ValueError("Missing Contributor.")
+        for t, names in contributors.items():
+            if not isinstance(names, str) or names == "":
+                raise ValueError(f"Missing names of {t}.")
+
+    @classmethod
+    def project(cls, data):
+        """
+        Returns the information locate() would return for an item built from data, without building it.
+
+        Parameters:
+            data (dict): A dictionary containing information of the item
+        """
+        res = {
+            "Title": data["Title"],
+            "Type": cls.__name__
+        }
+        res.update(data["Contributor"])
+        for f in cls._fields:
+            res[f] = data[f]
+        res["UPC"] = data["UPC"]
+        return res
+
 class ContributorWithType:
     """
     A class containing name and type of contributors of a library item.
     """
+    __slots__ = ("__type", "__contributor")
+
     def __init__(self, type, contributor):
         """
         Initializes a ContributorWithType object.
@@ -223,8 +1218,8 @@ class ContributorWithType:
             type (str): Type of contributor (Author, Director, Actor, ...)
             contributor (str): Name of contributors, seperated by ", "
         """
-        self.__type = type
-        self.__contributor = [Contributor(c) for c in contributor.split(", ")]
+        self.__type = sys.intern(type)
+        self.__contributor = tuple(Contributor.get(c) for c in contributor.split(", "))
     
     def getContributors(self):
         """
@@ -239,23 +1234,50 @@ class ContributorWithType:
 class Contributor:
     """
     A class containing name of the contributor.
+    Contributors are interned: every name has a single Contributor object, shared by all items
+    crediting it for as long as one of them is alive.
     """
+    __slots__ = ("__name", "__weakref__")
+    __registry = WeakValueDictionary()
+
     def __init__(self, name):
         """
-        Initializes a Contributor object.
+        Initializes a Contributor object. Use get() to obtain the shared object of a name.
 
         Parameters:
             name (str): Name of the contributor
         """
         self.__name = name
 
+    @staticmethod
+    def get(name):
+        """
+        Returns the Contributor object of a name, creating it if no item credits the name yet.
+
+        Parameters:
+            name (str): Name of the contributor
+        """
+        contributor = Contributor.__registry.get(name)
+        if contributor is None:
+            contributor = Contributor.__registry[name] = Contributor(sys.intern(name))
+        return contributor
+
     def getName(self):
         return self.__name
 
+    def __reduce__(self):
+        """
+        Pickles the contributor by name, so that unpickling it gives the shared object of the name.
+        """
+        return Contributor.get, (self.__name,)
+
 class Book(LibraryItem):
     """
     A class containing information of book-type item in library.
     """
+    __slots__ = ("__subject", "__ISBN", "__DDS")
+    _fields = ("Subject", "ISBN", "DDS")
+
     def __init__(self, data):
         """
         Initializes a Book object.
@@ -267,9 +1289,9 @@ class Book(LibraryItem):
         self.__subject = data["Subject"]
         self.__ISBN = data["ISBN"]
         self.__DDS = data["DDS"]
-    def locate(self):
+    def _describe(self):
         """
-        Overwrites locate method in LibraryItem class.
+        Overwrites _describe method in LibraryItem class.
         """
         contribs = {}
         for c in self._contributors:
@@ -293,6 +1315,9 @@ class CD(LibraryItem):
     """
     A class containing information of CD-type item in library.
     """
+    __slots__ = ("__genre", "__ASIN")
+    _fields = ("Genre", "ASIN")
+
     def __init__(self, data):
         """
         Initializes a CD object
@@ -304,9 +1329,9 @@ class CD(LibraryItem):
         self.__genre = data["Genre"]
         self.__ASIN = data["ASIN"]
 
-    def locate(self):
+    def _describe(self):
         """
-        Overwrites Locate method in LibraryItem class.
+        Overwrites _describe method in LibraryItem class.
         """
         contribs = {}
         for c in self._contributors:
@@ -329,6 +1354,9 @@ class DVD(LibraryItem):
     """
     A class containing information of DVD-type item in library.
     """
+    __slots__ = ("__genre", "__ASIN")
+    _fields = ("Genre", "ASIN")
+
     def __init__(self, data):
         """
         Initializes a DVD object
@@ -340,9 +1368,9 @@ class DVD(LibraryItem):
         self.__genre = data["Genre"]
         self.__ASIN = data["ASIN"]
 
-    def locate(self):
+    def _describe(self):
         """
-        Overwrites Locate method in LibraryItem class.
+        Overwrites _describe method in LibraryItem class.
         """
         contribs = {}
         for c in self._contributors:
@@ -365,6 +1393,9 @@ class Magazine(LibraryItem):
     """
     A class containing information of magazine-type item in library.
     """
+    __slots__ = ("__volume", "__issue")
+    _fields = ("Volume", "Issue")
+
     def __init__(self, data):
         """
         Initializes a Magazine object
@@ -376,9 +1407,9 @@ class Magazine(LibraryItem):
         self.__volume = data["Volume"]
         self.__issue = data["Issue"]
 
-    def locate(self):
+    def _describe(self):
         """
-        Overwrites Locate method in LibraryItem class.
+        Overwrites _describe method in LibraryItem class.
         """
         contribs = {}
         for c in self._contributors:
@@ -0,0 +1,137 @@
+from array import array
+from collections.abc import MutableMapping
+import sys
+
+class ColumnStore(MutableMapping):
+    """
+    A compact store of library items that can replace the dictionary of item objects in a catalog.
+    Items are kept in tables, one per item type and set of fields. Each field is a column of integers
+    pointing into a table of interned values, so that repeated titles, genres or contributors are only
+    stored once. Items are built again every time they are read, and are iterated in the order of their ids.
+
+    The store only pays off for large catalogs. Its tables have a fixed cost, so a few thousand items take more
+    memory than item objects: 380 against 332 bytes per item at 2,000 items, 316 against 332 at 20,000 and
+    239 against 331 at 100,000 (bench.py memory). The indexes take most of the memory of a catalog either way,
+    so a whole catalog of 100,000 items only shrinks by about 11%, while its searches take about three times
+    as long and listing its items five times, since every read builds the items again.
+    """
+
+    def __init__(self, build):
+        """
+        Initializes an empty ColumnStore object.
+
+        Parameters:
+            build (function): Builds a library item from its dictionary
+        """
+        self.__build = build
+        self.__values = []
+        self.__valueIds = {}
+        self.__tables = {}
+        self.__schemas = []
+        self.__locations = array("q")
+        self.__count = 0
+
+    def __setitem__(self, id, entry):
+        """
+        Stores an item under id.
+
+        Parameters:
+            id (int): Id of the item
+            entry: A library item or a dictionary containing information of the item
+        """
+        if id in self:
+            del self[id]
+        d = entry if isinstance(entry, dict) else entry.toDict()
+        fields = tuple((k, isinstance(v, dict)) for k, v in d.items())
+        signature = (d["Type"], fields)
+        table = self.__tables.get(signature)
+        if table is None:
+            columns = [array("I") for k, isDict in fields if k != "Type"]
+            table = self.__tables[signature] = (len(self.__schemas), columns, [])
+            self.__schemas.append(signature)
+        number, columns, free = table
+
+        values = []
+        for k, v in d.items():
+            if k == "Type":
+                continue
+            if isinstance(v, dict):
+                v = tuple((sys.intern(t), sys.intern(n)) for t, n in v.items())
+            values.append(self.__intern(v))
+
+        if len(free) != 0:
+            row = free.pop()
+            for column, value in zip(columns, values):
+                column[row] = value
+        else:
+            row = len(columns[0]) if len(columns) != 0 else 0
+            for column, value in zip(columns, values):
+                column.append(value)
+
+        while len(self.__locations) <= id:
+            self.__locations.append(-1)
+        self.__locations[id] = number << 32 | row
+        self.__count += 1
+
+    def __getitem__(self, id):
+        """
+        Builds the item stored under id.
+        """
+        return self.__build(self.record(id))
+
+    def __delitem__(self, id):
+        """
+        Removes the item stored under id. Its row is reused by the next item of the same table.
+        """
+        if id not in self:
+            raise KeyError(id)
+        location = self.__locations[id]
+        self.__tables[self.__schemas[location >> 32]][2].append(location & 0xFFFFFFFF)
+        self.__locations[id] = -1
+        self.__count -= 1
+
+    def __contains__(self, id):
+        return isinstance(id, int) and 0 <= id < len(self.__locations) and self.__locations[id] != -1
+
+    def __iter__(self):
+        for id, location in enumerate(self.__locations):
+            if location != -1:
+                yield id
+
+    def __len__(self):
+        return self.__count
+
+    def record(self, id):
+        """
+        Returns the dictionary of the item stored under id, without building the item.
+
+        Parameters:
+            id (int): Id of the item
+        """
+        if id not in self:
+            raise KeyError(id)
+        location = self.__locations[id]
+        signature = self.__schemas[location >> 32]
+        columns = self.__tables[signature][1]
+        row = location & 0xFFFFFFFF
+
+        res = {}
+        i = 0
+        for k, isDict in signature[1]:
+            if k == "Type":
+                res[k] = signature[0]
+                continue
+            value = self.__values[columns[i][row]]
+            res[k] = dict(value) if isDict else value
+            i += 1
+        return res
+
+    def __intern(self, value):
+        """
+        Returns the id of a value in the table of interned values, adding it if needed.
+        """
+        valueId = self.__valueIds.get(value)
+        if valueId is None:
+            valueId = self.__valueIds[value] = len(self.__values)
+            self.__values.append(value)
+        return valueId
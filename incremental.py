@@ -0,0 +1,202 @@
+from collections import OrderedDict
+from contextlib import nullcontext
+from index import SearchPattern, TokenIndex
+
+class IncrementalSearch:
+    """
+    Searches a catalog while a keyword is being typed, one keystroke at a time.
+    Results of every keyword are kept in order, and only as many of them are matched as are shown.
+    When a plain keyword grows, its results are taken from the results of the shorter keyword instead of
+    from the whole catalog, and going back to a shorter keyword reuses what was already matched for it.
+
+    A state holds [found ids, iterator of the next ids or None once all are found, pool], where pool is
+    None or a sorted list of ids known to hold all the matches.
+    """
+
+    def __init__(self, views, types, key, test, show, candidates, version, limit=10, budget=500, cacheSize=64,
+                 lock=None):
+        """
+        Initializes an IncrementalSearch object.
+
+        Parameters:
+            views (SortedView): The ids of all items, sorted by type and title
+            types (list): The sorted types of items that can match, or None if items of all types can
+            key (function): Returns the (type, title) pair of an item
+            test (function): Given an id and a SearchPattern, returns True if the item matches
+            show (function): Given an id and a SearchPattern, returns the highlighted information of the item
+            candidates (function): Given a keyword and a vocabulary, returns a superset of the ids of items
+                matching it, or None if it cannot be looked up. See TokenIndex.candidates()
+            version (function): Returns the version of the catalog. Cached results are dropped when it changes
+            limit (int): Number of results shown for a keyword. Default=10
+            budget (int): Number of items tested, also for the shorter keywords it narrows, before a plain
+                keyword matching few of them is looked up in the index. Default=500
+            cacheSize (int): Number of keywords whose results are kept. Default=64
+            lock (function): Returns a context manager held while a keyword is searched, since matching
+                the next results reads the catalog. Default=None
+        """
+        self.__views = views
+        self.__types = types
+        self.__key = key
+        self.__match = test
+        self.__tested = 0
+        self.__show = show
+        self.__candidates = candidates
+        self.__version = version
+        self.__limit = limit
+        self.__budget = budget
+        self.__cacheSize = cacheSize
+        self.__lock = lock if lock is not None else nullcontext
+        self.__states = OrderedDict()
+        self.__vocabulary = {}
+        self.__seen = None
+
+    def search(self, keyword):
+        """
+        Finds the first results of a keyword.
+
+        Parameters:
+            keyword (str): The keyword typed so far
+
+        Returns:
+            results (list): Highlighted information of at most limit items, sorted by type and title
+            count (int): Number of matched items, or None if there are more than the ones shown
+                and they have not been counted yet
+
+        Raises:
+            ValueError: If the keyword is empty or matches the empty string
+        """
+        query = SearchPattern(keyword)
+        with self.__lock():
+            if self.__seen != self.__version() or len(self.__vocabulary) > 4 * self.__cacheSize:
+                self.__states.clear()
+                self.__vocabulary.clear()
+                self.__seen = self.__version()
+
+            state = self.__state(query)
+            IncrementalSearch.__pull(state, self.__limit + 1)
+            found = state[0]
+            count = len(found) if state[1] is None else None
+            return [self.__show(id, query) for id in found[:self.__limit]], count
+
+    def __state(self, query):
+        """
+        Returns the cached state of a query, creating it from the longest cached plain keyword it contains.
+        """
+        key = (query.isRegex(), query.getKeyword() if query.isRegex() else TokenIndex.fold(query.getKeyword()))
+        state = self.__states.get(key)
+        if state is not None:
+            self.__states.move_to_end(key)
+            return state
+
+        parent = None
+        if not query.isRegex():
+            # Every item containing a keyword also contains the parts of it.
+            longest = None
+            for (isRegex, folded), cached in self.__states.items():
+                if not isRegex and folded in key[1] and (longest is None or len(folded) > len(longest)):
+                    longest, parent = folded, cached
+        state = [[], None, None]
+        state[1] = self.__source(state, query, parent)
+
+        self.__states[key] = state
+        if len(self.__states) > self.__cacheSize:
+            self.__states.popitem(last=False)
+        return state
+
+    def __source(self, state, query, parent):
+        """
+        Yields the ids of items matching a query, in order.
+        Items of the parent's results if they are all found, or of the parent's pool, or else the next results
+        of the parent or of the whole catalog, are tested one by one. If a plain keyword matches few of them,
+        it is looked up in the index so that a rare keyword does not test every item: a pool is narrowed to the
+        candidates, few candidates are sorted to become the pool, and many only skip the items not among them
+        while the whole catalog is walked again. Items before the scanned ones that are not among them are
+        not results of the parent, so they cannot match.
+        """
+        test = self.__test
+        pool = None
+        if parent is not None and (parent[1] is None or parent[2] is not None):
+            pool = parent[0] if parent[1] is None else parent[2]
+            state[2] = pool
+            ids = iter(pool)
+        else:
+            ids = iter(self.__all() if parent is None else IncrementalSearch.__walk(parent))
+        if query.isRegex():
+            yield from (id for id in ids if test(id, query))
+            return
+
+        # Getting the next item of a shorter keyword may test many items too, so they count as well,
+        # but not what is tested elsewhere while this scan waits between keystrokes. Every match allows
+        # 64 more tests, so only keywords matching fewer items than that are looked up.
+        scanned = set()
+        spent = 0
+        allowed = self.__budget
+        while spent < allowed:
+            before = self.__tested
+            id = next(ids, None)
+            if id is None:
+                return
+            scanned.add(id)
+            matched = test(id, query)
+            spent += self.__tested - before
+            if matched:
+                allowed += 64
+                yield id
+
+        candidates = self.__candidates(query.getKeyword(), self.__vocabulary)
+        if candidates is None:
+            yield from (id for id in ids if test(id, query))
+            return
+        if pool is not None:
+            state[2] = [id for id in pool if id in candidates]
+        elif len(candidates) * 32 < len(self.__views):
+            state[2] = self.__views.order(candidates, self.__key)
+        else:
+            # Sorting many candidates costs more than walking the catalog until enough of them are found.
+            yield from (id for id in self.__all() if id in candidates and id not in scanned and test(id, query))
+            return
+        # The pool is sorted like the scanned ids, so the matches not scanned yet all come after them.
+        yield from (id for id in state[2] if id not in scanned and test(id, query))
+
+    def __all(self):
+        """
+        Yields the ids of all items of the types that can match, sorted by type and title.
+        """
+        if self.__types is None:
+            return self.__views.ids()
+        return (id for type in self.__types for id in self.__views.ids(type))
+
+    def __test(self, id, query):
+        """
+        Returns True if an item matches a query, counting the items tested.
+        """
+        self.__tested += 1
+        return self.__match(id, query)
+
+    @staticmethod
+    def __walk(state):
+        """
+        Yields all ids of a state in order, matching more of them as they are needed.
+        """
+        found = state[0]
+        i = 0
+        while True:
+            if i == len(found):
+                IncrementalSearch.__pull(state, i + 1)
+                if i == len(found):
+                    return
+            yield found[i]
+            i += 1
+
+    @staticmethod
+    def __pull(state, count):
+        """
+        Matches ids of a state until it has count of them or all of them are found.
+        """
+        found = state[0]
+        while len(found) < count and state[1] is not None:
+            id = next(state[1], None)
+            if id is None:
+                state[1] = None
+            else:
+                found.append(id)
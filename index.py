@@ -0,0 +1,1014 @@
+from bisect import bisect_left, insort
+from functools import lru_cache
+from heapq import nsmallest
+from itertools import islice
+import re
+import unicodedata
+
+class TokenIndex:
+    """
+    An inverted index that maps normalized tokens to the ids of the items containing them.
+    Every field has its own index, and an extra view under the None key covers all fields.
+    The tokens of a field are also joined into one text when a keyword is looked up, so that tokens containing
+    part of it are found by searching the text instead of testing every token. The text is dropped when the
+    field gains or loses a token.
+    """
+    __tokenPattern = re.compile(r"\w+")
+
+    def __init__(self):
+        """
+        Initializes an empty TokenIndex object.
+        """
+        self.__fields = {None: {}}
+        self.__texts = {}
+
+    @staticmethod
+    def tokenize(text):
+        """
+        Splits a text into normalized tokens.
+
+        Parameters:
+            text (str): The text to split
+
+        Returns:
+            A list of folded word tokens
+        """
+        return TokenIndex.__tokenPattern.findall(TokenIndex.fold(text))
+
+    @staticmethod
+    def fold(text):
+        """
+        Normalizes a text for searching: it is casefolded, decomposed with NFKD and stripped of diacritics,
+        so that "Đắc nhân tâm" becomes "dac nhan tam".
+
+        Parameters:
+            text (str): The text to normalize
+
+        Returns:
+            The folded text
+        """
+        if text.isascii():
+            return text.lower()
+        return "".join(map(TokenIndex.__foldChar, text))
+
+    @staticmethod
+    def align(text):
+        """
+        Folds a text and records where every folded character comes from, so that a match in the folded text
+        can be mapped back to the original one.
+
+        Parameters:
+            text (str): The text to normalize
+
+        Returns:
+            A pair of the folded text and a list holding, for each folded character, the index of the original
+            character it comes from. The list is None when both texts have the same positions
+        """
+        if text.isascii():
+            return text.lower(), None
+        parts = list(map(TokenIndex.__foldChar, text))
+        folded = "".join(parts)
+        if len(folded) == len(text) and "" not in parts:
+            # Every character folds to exactly one, as in Vietnamese.
+            return folded, None
+        positions = []
+        for i, part in enumerate(parts):
+            positions.extend([i] * len(part))
+        return folded, positions
+
+    @staticmethod
+    @lru_cache(maxsize=4096)
+    def __foldChar(c):
+        """
+        Folds a single character. Combining marks fold to an empty string, and some characters to several.
+        """
+        decomposed = unicodedata.normalize("NFKD", c.casefold())
+        return "".join(ch for ch in decomposed if not unicodedata.combining(ch)).replace("đ", "d")
+
+    def add(self, id, information, contribTypes):
+        """
+        Adds an item to the index.
+
+        Parameters:
+            id (int): Id of the item
+            information (dict): The item's information returned by locate()
+            contribTypes (list): The item's contributors' types, also indexed under "Contributor"
+        """
+        for field, tokens in self.__tokens(information, contribTypes):
+            postings = self.__fields.setdefault(field, {})
+            for token in tokens:
+                ids = postings.get(token)
+                if ids is None:
+                    postings[token] = {id}
+                    self.__texts.pop(field, None)
+                else:
+                    ids.add(id)
+
+    def remove(self, id, information, contribTypes):
+        """
+        Removes an item from the index.
+
+        Parameters:
+            id (int): Id of the item
+            information (dict): The item's information returned by locate()
+            contribTypes (list): The item's contributors' types
+        """
+        for field, tokens in self.__tokens(information, contribTypes):
+            postings = self.__fields.get(field, {})
+            for token in tokens:
+                ids = postings.get(token)
+                if ids is None:
+                    continue
+                ids.discard(id)
+                if len(ids) == 0:
+                    del postings[token]
+                    self.__texts.pop(field, None)
+
+    def candidates(self, keyword, field=None, vocabulary=None):
+        """
+        Returns the ids of items whose field may contain keyword as a substring, ignoring case and diacritics.
+        The result is a superset of the real matches, so callers still have to verify each item.
+
+        Parameters:
+            keyword (str): The keyword to look up
+            field (str): The field to look in. If None, all fields are used
+            vocabulary (dict): Indexed tokens matched by earlier keywords, filled by this method. When a keyword
+                extends an earlier one, only the tokens the earlier one matched are looked at. It has to be
+                emptied whenever the index changes. Default=None
+
+        Returns:
+            A set of item ids, or None if the keyword cannot narrow the search: it has no word characters,
+            or its tokens are part of so many indexed tokens that nearly every item is a candidate
+        """
+        folded = TokenIndex.fold(keyword)
+        tokens = TokenIndex.__tokenPattern.findall(folded)
+        if len(tokens) == 0:
+            return None
+
+        postings = self.__fields.get(field, {})
+        # Tokens at the edges of the keyword may only be part of an indexed token,
+        # e.g. "an ta" matches "...nhan tam", while inner tokens must match exactly.
+        openStart = TokenIndex.__tokenPattern.match(folded[0]) is not None
+        openEnd = TokenIndex.__tokenPattern.match(folded[-1]) is not None
+
+        results = None
+        for i, token in enumerate(tokens):
+            start = openStart and i == 0
+            end = openEnd and i == len(tokens) - 1
+            if start or end:
+                mode = "in" if start and end else "end" if start else "start"
+                words = self.__matching(field, token, mode, vocabulary)
+                if words is None:
+                    # Leaving out a token only adds candidates.
+                    continue
+                ids = set().union(*[postings.get(t, ()) for t in words])
+            else:
+                ids = postings.get(token, set())
+            results = set(ids) if results is None else results & ids
+            if len(results) == 0:
+                break
+        return results
+
+    def prepare(self, field=None):
+        """
+        Joins the tokens of a field into the text searched by candidates(), which is otherwise done
+        by the first lookup after the field has changed.
+
+        Parameters:
+            field (str): The field to prepare. If None, the view of all fields is prepared
+        """
+        if field not in self.__texts:
+            self.__texts[field] = "\n" + "\n".join(self.__fields.get(field, {})) + "\n"
+
+    def __matching(self, field, token, mode, vocabulary):
+        """
+        Returns the indexed tokens that contain token ("in"), end with it ("end") or start with it ("start"),
+        or None if they are more than a quarter of the tokens of the field.
+        """
+        words = None
+        if vocabulary is not None:
+            # Tokens containing "mekong" are among those containing "meko", so the smallest earlier
+            # list that must hold all of them is filtered instead of the whole index.
+            for (f, m, t), cached in vocabulary.items():
+                if f == field and (words is None or len(cached) < len(words)) and (
+                        m == "in" and t in token or m == mode == "start" and token.startswith(t)
+                        or m == mode == "end" and token.endswith(t)):
+                    words = cached
+        if words is None:
+            res = self.__find(field, token, mode)
+        elif mode == "in":
+            res = [t for t in words if token in t]
+        elif mode == "end":
+            res = [t for t in words if t.endswith(token)]
+        else:
+            res = [t for t in words if t.startswith(token)]
+        if res is None or len(res) * 4 > len(self.__fields.get(field, {})):
+            return None
+        if vocabulary is not None:
+            vocabulary[(field, mode, token)] = res
+        return res
+
+    def __find(self, field, token, mode):
+        """
+        Finds the tokens of a field that contain, end with or start with token in the text of all of its tokens,
+        where every token is on its own line. Returns None as soon as they are more than a quarter of the tokens.
+        """
+        count = len(self.__fields.get(field, {}))
+        self.prepare(field)
+        text = self.__texts[field]
+
+        needle = token if mode == "in" else "\n" + token if mode == "start" else token + "\n"
+        # The beginning of the text tells quickly if most tokens match.
+        sample = min(len(text), 1 << 16)
+        if text.count(needle, 0, sample) * len(text) > sample * count // 4:
+            return None
+
+        find = text.find
+        res = []
+        i = find(needle)
+        while i != -1:
+            if len(res) * 4 > count:
+                return None
+            start = i + 1 if mode == "start" else text.rfind("\n", 0, i) + 1
+            end = i + len(token) if mode == "end" else find("\n", i + len(needle))
+            res.append(text[start:end])
+            i = find(needle, end)
+        return res
+
+    @staticmethod
+    def __tokens(information, contribTypes):
+        """
+        Yields (field, tokens) pairs for every view an item belongs to.
+        """
+        everything = set()
+        contributors = set()
+        for field, value in information.items():
+            tokens = set(TokenIndex.tokenize(value))
+            everything |= tokens
+            if field in contribTypes:
+                contributors |= tokens
+            yield field, tokens
+        yield "Contributor", contributors
+        yield None, everything
+
+
+class FoldedKeys(dict):
+    """
+    Maps values to their folded keys, folding values that are not held instead of failing.
+    A search reading an item that was removed after it started still finds the item's keys this way.
+    """
+
+    def __missing__(self, value):
+        return TokenIndex.fold(value)
+
+
+class NormalizedKeys:
+    """
+    The folded search keys of the values of all items, computed once when the items are indexed
+    instead of on every query. Values are counted, so that a key is dropped with the last item using it.
+    """
+
+    def __init__(self):
+        """
+        Initializes an empty NormalizedKeys object.
+        """
+        self.__keys = FoldedKeys()
+        self.__counts = {}
+
+    def add(self, information):
+        """
+        Computes the keys of the values of an item.
+
+        Parameters:
+            information (dict): The item's information returned by locate()
+        """
+        for value in information.values():
+            count = self.__counts.get(value)
+            if count is None:
+                self.__keys[value] = TokenIndex.fold(value)
+                count = 0
+            self.__counts[value] = count + 1
+
+    def remove(self, information):
+        """
+        Releases the keys of the values of an item.
+
+        Parameters:
+            information (dict): The item's information returned by locate()
+        """
+        for value in information.values():
+            count = self.__counts.get(value)
+            if count is None:
+                continue
+            if count == 1:
+                del self.__counts[value]
+                del self.__keys[value]
+            else:
+                self.__counts[value] = count - 1
+
+    def get(self, value):
+        """
+        Returns the folded key of a value of an indexed item.
+
+        Parameters:
+            value (str): A value of an item's field
+        """
+        return self.__keys[value]
+
+    def getter(self):
+        """
+        Returns a function mapping values of indexed items to their keys. It is faster than get() in tight loops.
+        """
+        return self.__keys.__getitem__
+
+
+class SearchPattern:
+    """
+    A search keyword, matched against the folded keys of fields so that case and diacritics are ignored.
+    Keywords containing regular expression syntax are regular expressions, others are plain substrings.
+    Matches are highlighted in the original text.
+    """
+
+    def __init__(self, keyword):
+        """
+        Initializes a SearchPattern object.
+
+        Parameters:
+            keyword (str): The keyword to search for
+
+        Raises:
+            ValueError: If the keyword is empty or matches the empty string
+        """
+        if TokenIndex.fold(keyword) == "":
+            raise ValueError("Invalid Value.")
+        self.__keyword = keyword
+        self.__regex = SearchPattern.isPattern(keyword)
+        if self.__regex:
+            # Only non-ASCII characters are folded, which leaves the syntax and escapes such as \D untouched.
+            self.__folded = None
+            pattern = "".join(c if c.isascii() else TokenIndex.fold(c) for c in keyword)
+        else:
+            self.__folded = TokenIndex.fold(keyword)
+            pattern = re.escape(self.__folded)
+        self.__pattern = SearchPattern.__compile(pattern, re.IGNORECASE)
+        if self.__regex and self.__pattern.search("") is not None:
+            # A pattern that matches the empty string matches everything and cannot be highlighted.
+            raise ValueError("Invalid Value.")
+
+    def getKeyword(self):
+        return self.__keyword
+
+    def getPattern(self):
+        """
+        Returns the compiled pattern that matches folded keys.
+        """
+        return self.__pattern
+
+    def isRegex(self):
+        """
+        Returns True if the keyword is a regular expression.
+        """
+        return self.__regex
+
+    def matches(self, key):
+        """
+        Returns True if a folded key matches the keyword.
+
+        Parameters:
+            key (str): The folded key of a field
+        """
+        if self.__regex:
+            return self.__pattern.search(key) is not None
+        return self.__folded in key
+
+    def highlighter(self, key, mark=True):
+        """
+        Returns a function that highlights a value, giving a pair of the highlighted text and the number of matches.
+        The function is meant to be called on many fields in a row.
+
+        Parameters:
+            key (function): Maps a value to its folded key
+            mark (bool): If False, values are returned as they are, with 1 as the count when they match. Default=True
+        """
+        if not mark:
+            matches = self.matches
+            return lambda value: (value, 1) if matches(key(value)) else (value, 0)
+        pattern = self.__pattern
+        highlight = SearchPattern.__highlight
+        if self.__regex:
+            search = pattern.search
+            subn = pattern.subn
+            wrap = SearchPattern.__wrap
+
+            def highlighter(value):
+                if value.isascii():
+                    # Folding only lowers ASCII text, which a pattern ignoring case matches in the same places.
+                    return subn(wrap, value)
+                return highlight(pattern, value) if search(key(value)) else (value, 0)
+            return highlighter
+
+        folded = self.__folded
+        # Most fields do not contain the keyword, and a substring test rules them out
+        # much faster than the regular expression engine.
+        return lambda value: highlight(pattern, value) if folded in key(value) else (value, 0)
+
+    @staticmethod
+    def isPattern(keyword):
+        """
+        Returns True if keyword contains regular expression syntax and cannot be looked up in an index.
+        """
+        return any(c in ".^$*+?{}[]\\|()" for c in keyword)
+
+    @staticmethod
+    def __highlight(pattern, value):
+        """
+        Wraps the parts of value whose folded text matches pattern with green background.
+        """
+        if value.isascii():
+            return pattern.subn(SearchPattern.__wrap, value)
+
+        folded, positions = TokenIndex.align(value)
+        res = []
+        last = 0
+        count = 0
+        for match in pattern.finditer(folded):
+            start, end = match.span()
+            if positions is not None:
+                start, end = SearchPattern.__original(positions, start, end, len(value))
+            res.append(value[last:start])
+            res.append("\x1b[6;30;42m" + value[start:end] + "\x1b[0m")
+            last = end
+            count += 1
+        res.append(value[last:])
+        return "".join(res), count
+
+    @staticmethod
+    def __wrap(match):
+        """
+        Wraps matched strings with green background.
+        A plain function is faster here than a replacement template, which re parses again on every call.
+        """
+        return "\x1b[6;30;42m" + match.group(0) + "\x1b[0m"
+
+    @staticmethod
+    def __original(positions, start, end, length):
+        """
+        Maps a span of a folded key back to the span of the original text it comes from.
+        Characters that fold to nothing, such as combining marks, stay with the character before them.
+        """
+        first = positions[start] if start < len(positions) else length
+        if start == end:
+            return first, first
+        if end == len(positions):
+            return first, length
+        if positions[end] == positions[end - 1]:
+            # The span ends inside the folding of one character, e.g. in "ss" from "ß".
+            return first, positions[end - 1] + 1
+        return first, positions[end]
+
+    @staticmethod
+    @lru_cache(maxsize=128)
+    def __compile(pattern, flags):
+        """
+        Compiles a regular expression. The most recently used patterns are kept, so that repeated queries
+        reuse the same compiled pattern.
+        """
+        return re.compile(pattern, flags)
+
+
+class SortedView:
+    """
+    Keeps the ids of library items of every type sorted by title.
+    New and removed items are buffered and merged into the sorted lists when they are read,
+    so that loading many items costs one sort instead of one insertion each.
+    A sorted list given out by ids() is not changed anymore: merging into it makes a new list,
+    so that searches still walking the old one are not disturbed.
+    """
+    # Number of buffered items that are inserted or deleted one by one. More are merged by sorting or filtering.
+    __inserted = 8
+
+    def __init__(self):
+        """
+        Initializes an empty SortedView object.
+        """
+        self.__views = {}
+        self.__pending = {}
+        self.__removed = {}
+        self.__shared = set()
+        self.__count = 0
+
+    def add(self, type, title, id):
+        """
+        Adds an item to the view of its type.
+
+        Parameters:
+            type (str): Type of the item
+            title (str): Title of the item
+            id (int): Id of the item
+        """
+        self.__pending.setdefault(type, []).append((title, id))
+        self.__count += 1
+
+    def remove(self, type, title, id):
+        """
+        Removes an item from the view of its type.
+
+        Parameters:
+            type (str): Type of the item
+            title (str): Title of the item
+            id (int): Id of the item
+        """
+        pending = self.__pending.get(type, [])
+        if (title, id) in pending:
+            pending.remove((title, id))
+            self.__count -= 1
+            return
+        view = self.__views.get(type, [])
+        i = bisect_left(view, (title, id))
+        if i < len(view) and view[i] == (title, id):
+            self.__removed.setdefault(type, set()).add((title, id))
+            self.__count -= 1
+
+    def ids(self, type=None):
+        """
+        Returns the ids of all items of a type, sorted by title.
+        The ids are the ones held when this is called, even if items are added or removed before they are read.
+
+        Parameters:
+            type (str): Type of the items. If None, items of all types are given, sorted by type and title
+
+        Returns:
+            A generator of ids
+        """
+        types = [type] if type is not None else sorted(set(self.__views) | set(self.__pending))
+        views = [self.__view(t) for t in types]
+        self.__shared.update(types)
+        return (id for view in views for title, id in view)
+
+    def count(self, type):
+        """
+        Returns the number of items of a type.
+
+        Parameters:
+            type (str): Type of the items
+        """
+        return len(self.__views.get(type, [])) + len(self.__pending.get(type, [])) \
+            - len(self.__removed.get(type, ()))
+
+    def order(self, ids, key):
+        """
+        Sorts items by type and title, the order in which search results are shown.
+        When the items are a large part of the catalog, the sorted views are walked instead of sorting,
+        and the keys of the items are not needed.
+
+        Parameters:
+            ids (iterable): Ids of the items
+            key (function): Returns the (type, title) pair of an item
+
+        Returns:
+            A sorted list of the ids
+        """
+        ids = ids if isinstance(ids, (set, frozenset)) else set(ids)
+        if len(ids) * 16 < self.__count:
+            return sorted(ids, key=lambda id: (*key(id), id))
+        return [id for id in self.ids() if id in ids]
+
+    def first(self, ids, limit, key):
+        """
+        Returns the first items in the order of order(), without sorting all of them.
+        Few items are sorted, otherwise the sorted views are walked until enough items are found.
+
+        Parameters:
+            ids (set): Ids of the items
+            limit (int): Number of items to return
+            key (function): Returns the (type, title) pair of an item
+
+        Returns:
+            A sorted list of at most limit ids
+        """
+        if limit <= 0:
+            return []
+        if len(ids) * len(ids) < limit * self.__count:
+            return nsmallest(limit, ids, key=lambda id: (*key(id), id))
+        return list(islice((id for id in self.ids() if id in ids), limit))
+
+    def merge(self):
+        """
+        Merges all buffered items into the sorted lists, so that later reads do not have to.
+        A catalog read by several threads merges after every change, so that reads never have to.
+        """
+        for type in set(self.__pending) | set(self.__removed):
+            self.__view(type)
+
+    def __len__(self):
+        return self.__count
+
+    def __view(self, type):
+        """
+        Returns the sorted list of (title, id) pairs of a type, merging buffered items into it first.
+        """
+        view = self.__views.get(type, [])
+        pending = self.__pending.pop(type, None)
+        removed = self.__removed.pop(type, None)
+        if pending is None and removed is None:
+            return view
+        if type in self.__shared:
+            self.__shared.discard(type)
+            view = list(view)
+        if removed is not None and len(removed) <= SortedView.__inserted:
+            for entry in removed:
+                del view[bisect_left(view, entry)]
+        elif removed is not None:
+            view[:] = [entry for entry in view if entry not in removed]
+        if pending is not None and len(pending) <= SortedView.__inserted:
+            for entry in pending:
+                insort(view, entry)
+        elif pending is not None:
+            view.extend(pending)
+            view.sort()
+        self.__views[type] = view
+        return view
+
+
+class HashIndex:
+    """
+    Maps identifiers (UPC, ISBN, ASIN, ...) of library items to the ids of the items holding them.
+    Identifiers are normalized, so spaces, dashes and case do not matter. Most identifiers belong
+    to a single item, so that item's id is stored directly, and only duplicated identifiers get a list.
+    """
+    __separators = re.compile(r"[\s-]")
+
+    def __init__(self, fields):
+        """
+        Initializes an empty HashIndex object.
+
+        Parameters:
+            fields (iterable): Names of the fields to index
+        """
+        self.__values = {f: {} for f in fields}
+        self.__duplicates = {f: set() for f in fields}
+
+    @staticmethod
+    def normalize(value):
+        """
+        Returns the normalized form of an identifier.
+
+        Parameters:
+            value (str): The identifier
+        """
+        return HashIndex.__separators.sub("", value).upper()
+
+    def fields(self):
+        """
+        Returns the names of the indexed fields.
+        """
+        return list(self.__values)
+
+    def add(self, id, information):
+        """
+        Adds an item to the index.
+
+        Parameters:
+            id (int): Id of the item
+            information (dict): The item's information returned by locate()
+        """
+        for field, values in self.__values.items():
+            if field not in information:
+                continue
+            value = HashIndex.normalize(information[field])
+            ids = values.get(value)
+            if ids is None:
+                values[value] = id
+            elif isinstance(ids, list):
+                ids.append(id)
+            else:
+                values[value] = [ids, id]
+                self.__duplicates[field].add(value)
+
+    def remove(self, id, information):
+        """
+        Removes an item from the index.
+
+        Parameters:
+            id (int): Id of the item
+            information (dict): The item's information returned by locate()
+        """
+        for field, values in self.__values.items():
+            if field not in information:
+                continue
+            value = HashIndex.normalize(information[field])
+            ids = values.get(value)
+            if ids == id:
+                del values[value]
+            elif isinstance(ids, list) and id in ids:
+                ids.remove(id)
+                if len(ids) == 1:
+                    values[value] = ids[0]
+                    self.__duplicates[field].discard(value)
+
+    def get(self, field, value):
+        """
+        Returns the ids of items whose field holds an identifier.
+
+        Parameters:
+            field (str): Name of an indexed field
+            value (str): The identifier
+
+        Returns:
+            A list of item ids
+        """
+        ids = self.__values[field].get(HashIndex.normalize(value))
+        if ids is None:
+            return []
+        return list(ids) if isinstance(ids, list) else [ids]
+
+    def duplicates(self, field):
+        """
+        Returns the identifiers of a field that are held by more than one item.
+
+        Parameters:
+            field (str): Name of an indexed field
+
+        Returns:
+            A dictionary mapping each duplicated identifier to the ids of its items
+        """
+        values = self.__values[field]
+        return {value: list(values[value]) for value in self.__duplicates[field]}
+
+
+class ContributorIndex:
+    """
+    Maps every contributor to the items crediting them, by role (Author, Director, Actor, ...),
+    and every role to the items having a contributor in it. Names are looked up by their folded form.
+    """
+
+    def __init__(self):
+        """
+        Initializes an empty ContributorIndex object.
+        """
+        self.__names = {}
+        self.__credits = {}
+        self.__roles = {}
+
+    def add(self, id, information, contribTypes):
+        """
+        Adds the contributors of an item to the index.
+
+        Parameters:
+            id (int): Id of the item
+            information (dict): The item's information returned by locate()
+            contribTypes (list): The item's contributors' types
+        """
+        for role, name in ContributorIndex.__credited(information, contribTypes):
+            key = TokenIndex.fold(name)
+            self.__names.setdefault(key, name)
+            self.__credits.setdefault(key, {}).setdefault(role, set()).add(id)
+            self.__roles.setdefault(role, set()).add(id)
+
+    def remove(self, id, information, contribTypes):
+        """
+        Removes the contributors of an item from the index.
+
+        Parameters:
+            id (int): Id of the item
+            information (dict): The item's information returned by locate()
+            contribTypes (list): The item's contributors' types
+        """
+        for role, name in ContributorIndex.__credited(information, contribTypes):
+            key = TokenIndex.fold(name)
+            roles = self.__credits.get(key, {})
+            ids = roles.get(role, set())
+            ids.discard(id)
+            if len(ids) == 0:
+                roles.pop(role, None)
+            if len(roles) == 0:
+                self.__credits.pop(key, None)
+                self.__names.pop(key, None)
+            ids = self.__roles.get(role, set())
+            ids.discard(id)
+            if len(ids) == 0:
+                self.__roles.pop(role, None)
+
+    def get(self, name, role=None):
+        """
+        Returns the ids of items crediting a contributor.
+
+        Parameters:
+            name (str): Name of the contributor, ignoring case and diacritics
+            role (str): Only count credits in this role. If None, all roles are used
+
+        Returns:
+            A set of item ids
+        """
+        roles = self.__credits.get(TokenIndex.fold(name), {})
+        if role is not None:
+            return set(roles.get(role, ()))
+        return set().union(*roles.values())
+
+    def role(self, role):
+        """
+        Returns the ids of items having a contributor in a role.
+
+        Parameters:
+            role (str): Type of contributor (Author, Director, Actor, ...)
+        """
+        return set(self.__roles.get(role, ()))
+
+    def names(self, role=None):
+        """
+        Returns the names of all contributors, sorted.
+
+        Parameters:
+            role (str): Only return contributors credited in this role. If None, all contributors are returned
+        """
+        return sorted(self.__names[key] for key, roles in self.__credits.items() if role is None or role in roles)
+
+    @staticmethod
+    def __credited(information, contribTypes):
+        """
+        Yields (role, name) pairs of every contributor of an item.
+        """
+        for role in contribTypes:
+            for name in information[role].split(", "):
+                yield role, name
+
+
+class FuzzyIndex:
+    """
+    An index of the words of one field (such as titles or contributor names) for prefix and typo-tolerant queries.
+    Words are kept sorted for prefix lookups, and every word is split into trigrams,
+    so that words close to a misspelled query can be found without comparing it to the whole vocabulary.
+    """
+
+    def __init__(self):
+        """
+        Initializes an empty FuzzyIndex object.
+        """
+        self.__words = {}
+        self.__grams = {}
+        self.__lengths = {}
+        self.__sorted = []
+        self.__dirty = False
+
+    def add(self, id, words):
+        """
+        Adds the words of an item to the index.
+
+        Parameters:
+            id (int): Id of the item
+            words (iterable): Normalized words of the item's field
+        """
+        for word in words:
+            ids = self.__words.get(word)
+            if ids is not None:
+                ids.add(id)
+                continue
+            self.__words[word] = {id}
+            for gram in FuzzyIndex.__trigrams(word):
+                self.__grams.setdefault(gram, set()).add(word)
+            self.__lengths.setdefault(len(word), set()).add(word)
+            self.__dirty = True
+
+    def remove(self, id, words):
+        """
+        Removes the words of an item from the index.
+
+        Parameters:
+            id (int): Id of the item
+            words (iterable): Normalized words of the item's field
+        """
+        for word in words:
+            ids = self.__words.get(word)
+            if ids is None:
+                continue
+            ids.discard(id)
+            if len(ids) != 0:
+                continue
+            del self.__words[word]
+            for gram in FuzzyIndex.__trigrams(word):
+                self.__grams[gram].discard(word)
+                if len(self.__grams[gram]) == 0:
+                    del self.__grams[gram]
+            self.__lengths[len(word)].discard(word)
+            self.__dirty = True
+
+    def prefix(self, words):
+        """
+        Finds items containing all words, the last of which may be incomplete.
+
+        Parameters:
+            words (list): Normalized words of the query
+
+        Returns:
+            A list of two sets of item ids: items where the last word is complete, and items where it is not
+        """
+        if len(words) == 0:
+            return [set(), set()]
+        last = words[-1]
+        view = self.__view()
+        completions = []
+        for i in range(bisect_left(view, last), len(view)):
+            if not view[i].startswith(last):
+                break
+            if view[i] != last:
+                completions.append(self.__words[view[i]])
+        complete = self.__words.get(last, set())
+        tiers = [set(complete), set().union(*completions) - complete]
+        for word in words[:-1]:
+            ids = self.__words.get(word, set())
+            tiers = [tier & ids for tier in tiers]
+        return tiers
+
+    def fuzzy(self, words, maxDistance):
+        """
+        Finds items containing, for every word of the query, a word within maxDistance edits of it.
+
+        Parameters:
+            words (list): Normalized words of the query
+            maxDistance (int): Maximum number of insertions, deletions or substitutions per word
+
+        Returns:
+            A list of sets of item ids, where the set at index i holds the items with a total edit distance of i
+        """
+        if len(words) == 0:
+            return []
+        tiers = None
+        for word in words:
+            found = [[] for _ in range(maxDistance + 1)]
+            for candidate in self.__candidates(word, maxDistance):
+                distance = FuzzyIndex.distance(word, candidate, maxDistance)
+                if distance <= maxDistance:
+                    found[distance].append(self.__words[candidate])
+            # An item counts with the closest of its words.
+            closest = []
+            seen = set()
+            for sets in found:
+                tier = set().union(*sets) - seen
+                seen |= tier
+                closest.append(tier)
+
+            if tiers is None:
+                tiers = closest
+                continue
+            combined = [set() for _ in range(len(tiers) + maxDistance)]
+            for i, a in enumerate(tiers):
+                for j, b in enumerate(closest):
+                    combined[i + j] |= a & b
+            tiers = combined
+        return tiers
+
+    @staticmethod
+    def distance(a, b, maxDistance):
+        """
+        Returns the Levenshtein distance between two words, or maxDistance + 1 if it is larger than maxDistance.
+
+        Parameters:
+            a (str): The first word
+            b (str): The second word
+            maxDistance (int): The largest distance that has to be exact
+        """
+        if abs(len(a) - len(b)) > maxDistance:
+            return maxDistance + 1
+        previous = list(range(len(b) + 1))
+        for i, ca in enumerate(a, 1):
+            current = [i]
+            for j, cb in enumerate(b, 1):
+                current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+            if min(current) > maxDistance:
+                return maxDistance + 1
+            previous = current
+        return min(previous[-1], maxDistance + 1)
+
+    def __candidates(self, word, maxDistance):
+        """
+        Returns words of the index that may be within maxDistance edits of word.
+        An edit changes at most 3 trigrams, so a close word shares all but 3 * maxDistance of them.
+        Short words cannot be filtered by trigrams, and are compared to every word of a similar length.
+        """
+        grams = FuzzyIndex.__trigrams(word)
+        needed = len(grams) - 3 * maxDistance
+        if needed <= 0:
+            return [w for length in range(len(word) - maxDistance, len(word) + maxDistance + 1)
+                    for w in self.__lengths.get(length, ())]
+        counts = {}
+        for gram in grams:
+            for w in self.__grams.get(gram, ()):
+                counts[w] = counts.get(w, 0) + 1
+        return [w for w, count in counts.items() if count >= needed]
+
+    def __view(self):
+        """
+        Returns the words of the index in sorted order.
+        """
+        if self.__dirty:
+            self.__sorted = sorted(self.__words)
+            self.__dirty = False
+        return self.__sorted
+
+    @staticmethod
+    def __trigrams(word):
+        """
+        Returns the set of trigrams of a word padded with a marker at both ends.
+        """
+        padded = "\0" + word + "\0"
+        return {padded[i:i + 3] for i in range(len(padded) - 2)}
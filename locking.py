@@ -0,0 +1,79 @@
+from contextlib import contextmanager
+import threading
+
+class ReadWriteLock:
+    """
+    A lock for threads that is held by many readers at once or by a single writer.
+    A waiting writer stops new readers from entering, so that a stream of searches cannot starve it.
+    A thread holding the lock may take it again, as a reader or as the writer it already is,
+    but a reader cannot become the writer, since two readers doing so would wait for each other forever.
+    """
+
+    def __init__(self):
+        """
+        Initializes a ReadWriteLock object.
+        """
+        self.__changed = threading.Condition(threading.Lock())
+        self.__readers = 0
+        self.__writer = None
+        self.__waiting = 0
+        self.__local = threading.local()
+
+    @contextmanager
+    def reading(self):
+        """
+        Holds the lock as a reader inside a with block.
+        """
+        local = self.__local
+        depth = getattr(local, "depth", 0)
+        if depth > 0 or self.__writer == threading.get_ident():
+            local.depth = depth + 1
+            try:
+                yield
+            finally:
+                local.depth = depth
+            return
+
+        with self.__changed:
+            while self.__writer is not None or self.__waiting != 0:
+                self.__changed.wait()
+            self.__readers += 1
+        local.depth = 1
+        try:
+            yield
+        finally:
+            local.depth = 0
+            with self.__changed:
+                self.__readers -= 1
+                if self.__readers == 0:
+                    self.__changed.notify_all()
+
+    @contextmanager
+    def writing(self):
+        """
+        Holds the lock as the only writer inside a with block.
+
+        Raises:
+            RuntimeError: If the thread holds the lock as a reader
+        """
+        me = threading.get_ident()
+        if self.__writer == me:
+            yield
+            return
+        if getattr(self.__local, "depth", 0) > 0:
+            raise RuntimeError("Cannot write while reading.")
+
+        with self.__changed:
+            self.__waiting += 1
+            try:
+                while self.__writer is not None or self.__readers != 0:
+                    self.__changed.wait()
+            finally:
+                self.__waiting -= 1
+            self.__writer = me
+        try:
+            yield
+        finally:
+            with self.__changed:
+                self.__writer = None
+                self.__changed.notify_all()
@@ -1,8 +1,13 @@
+import argparse
 import os
 import json
+import re
+import sys
+import time
 from sys import exit
 from catalog import Catalog
 from menu import Menu
+from sqlitecatalog import SqliteCatalog
 
 def addFunc():
     results = []
@@ -92,7 +97,146 @@ def addFunc():
     Menu.getKeyLog("Press Enter to continue")
     return results
 
-def main():
+def toLines(results):
+    """
+    Returns a generator of the lines showing information of items.
+
+    Parameters:
+        results (iterable): information of the items to show, may be a generator
+    """
+    return (line for text in Catalog.iterConvert(results) for line in text.rstrip("\n").split("\n"))
+
+def showPages(title, results):
+    """
+    Shows results in a scrollable viewport, so the first screen appears before the rest is searched or formatted.
+
+    Parameters:
+        title (str): title of the viewport
+        results (iterable): information of the items to show, may be a generator
+    """
+    Menu(100, title, "-").browse(toLines(results))
+
+def liveSearch(ctl):
+    """
+    Searches all fields while the user types, showing the first results after every key.
+    Enter then shows all results of the keyword.
+
+    Parameters:
+        ctl (Catalog): the catalog to search
+    """
+    search = ctl.incremental()
+
+    def results(keyword):
+        if keyword == "":
+            return [], "type a keyword"
+        try:
+            items, count = search.search(keyword)
+        except (ValueError, re.error):
+            return [], "not a valid keyword"
+        status = f"{count} items" if count is not None else f"first {len(items)} items"
+        return list(toLines(items)), status
+
+    keyword = Menu(100, "Search as you type", "-").live(results)
+    if keyword is None:
+        return
+    try:
+        showPages(f"Search: {keyword}", ctl.iterSearch(keyword))
+    except (ValueError, re.error):
+        Menu.logError("Invalid keyword.")
+
+def runQueries(ctl, queries, field=None, limit=None, out=sys.stdout):
+    """
+    Searches a catalog for many keywords and writes the results of every keyword as a line of json.
+    A line holds the keyword, the field, the number of results, the results without highlighting
+    and the time the search took in milliseconds. Invalid keywords give a line with an error instead.
+
+    Parameters:
+        ctl (Catalog): the catalog to search
+        queries (iterable): lines holding one keyword each. Blank lines are skipped
+        field (str): the field to search. If None, all fields are searched
+        limit (int): maximum number of results of a keyword. If None, all results are written
+        out: a file opened in text mode, where results are written
+
+    Returns:
+        times (list): time every search took in seconds
+    """
+    times = []
+    for line in queries:
+        keyword = line.rstrip("\r\n")
+        if keyword.strip() == "":
+            continue
+        res = {"query": keyword, "field": field}
+        start = time.perf_counter()
+        try:
+            results = list(ctl.iterSearch(keyword, field, limit=limit, highlight=False))
+        except (ValueError, re.error) as e:
+            results = None
+            res["error"] = str(e)
+        elapsed = time.perf_counter() - start
+        times.append(elapsed)
+        if results is not None:
+            res["count"] = len(results)
+            res["results"] = results
+        res["ms"] = round(elapsed * 1000, 3)
+        out.write(json.dumps(res, ensure_ascii=False) + "\n")
+    return times
+
+def openCatalog(fileName, engine="json", readOnly=False):
+    """
+    Opens the catalog of a json file.
+
+    Parameters:
+        fileName (str): json file of the catalog
+        engine (str): "json" loads the catalog into memory and journals edits next to the file.
+            "sqlite" keeps the catalog in an SQLite database next to the file, filled from it on first use,
+            and edits only the database. Default="json"
+        readOnly (bool): If True, the catalog is only searched and no file is written. Default=False
+
+    Returns:
+        A Catalog or SqliteCatalog object
+    """
+    if engine == "sqlite":
+        return SqliteCatalog(SqliteCatalog.databasePath(fileName), None if readOnly else fileName, readOnly)
+    return Catalog(fileName, snapshot=True, readOnly=readOnly)
+
+def query(args):
+    """
+    Runs the query command: loads the catalog once, answers every keyword of the queries file or of stdin,
+    then reports the loading time and the latency of the searches on stderr. The catalog is opened read-only.
+    A catalog or queries file that cannot be opened ends the program with an error message and exit status 1.
+    """
+    queries = sys.stdin
+    if args.queries is not None:
+        try:
+            queries = open(args.queries, encoding="utf-8")
+        except OSError as e:
+            print(f"Cannot open the queries: {e.strerror}: {args.queries}", file=sys.stderr)
+            exit(1)
+
+    start = time.perf_counter()
+    try:
+        ctl = openCatalog(args.file, args.engine, readOnly=True)
+    except OSError as e:
+        print(f"Cannot open the catalog: {e.strerror}: {e.filename or args.file}", file=sys.stderr)
+        exit(1)
+    except ValueError as e:
+        print(f"Cannot read the catalog: {e}", file=sys.stderr)
+        exit(1)
+    loadTime = time.perf_counter() - start
+    with queries:
+        times = runQueries(ctl, queries, args.field, args.limit)
+    sys.stdout.flush()
+
+    print(f"Loaded {args.file} in {loadTime*1000:.1f} ms", file=sys.stderr)
+    if len(times) == 0:
+        print("No queries.", file=sys.stderr)
+        return
+    times.sort()
+    print(f"{len(times)} queries in {sum(times)*1000:.1f} ms: mean {sum(times)/len(times)*1000:.3f} ms,"
+          f" p50 {times[len(times) // 2]*1000:.3f} ms, p99 {times[min(len(times) - 1, len(times) * 99 // 100)]*1000:.3f} ms,"
+          f" max {times[-1]*1000:.3f} ms", file=sys.stderr)
+
+def main(engine="json"):
     createMenu = Menu(100, "Library Catalog (ver 1.0)")
     createMenu.addLines("A catalog that helps you find what you need in the library.")
     createMenu.addLines()
@@ -106,6 +250,8 @@ def main():
     mainMenu.addList("Search for items with a keyword")
     mainMenu.addList("List all items in the library")
     mainMenu.addList("Add items")
+    mainMenu.addList("Import items from a csv or json-lines file")
+    mainMenu.addList("Export items to a file")
     mainMenu.addList("Delete items")
     mainMenu.addList("Quit")
 
@@ -113,6 +259,7 @@ def main():
     searchMenu.addList("Search by title")
     searchMenu.addList("Search by contributors")
     searchMenu.addList("Search by UPC")
+    searchMenu.addList("Search as you type")
     searchMenu.addList("Quit")
 
     searchByMenu = Menu(100, sep="-")
@@ -143,10 +290,13 @@ def main():
                     Menu.logError("You have to add at least 1 item to the library.")
                     continue
                 break
-            data = json.dumps(res, indent=4)
-            with open(fileName, "w") as newFile:
-                newFile.write(data)
-            ctl = Catalog(fileName)
+            try:
+                Catalog.create(fileName, res)
+                if engine == "sqlite":
+                    SqliteCatalog.create(SqliteCatalog.databasePath(fileName), res)
+            except OSError as e:
+                Menu.logError(f"Cannot write the file: {e.strerror}.")
+                continue
         elif choice == 2:
             fileMenu.setTitle("Import Catalog from json file")
             fileMenu.show()
@@ -160,63 +310,96 @@ def main():
             exit()
         break
 
+    ctl = openCatalog(fileName, engine)
     while True:
-        ctl = Catalog(fileName)
+        # Edits made to the file by other programs are applied, the catalog is not loaded again.
+        ctl.reload()
         mainMenu.show()
-        choice = Menu.getChoice(5)
+        choice = Menu.getChoice(7)
         if choice == -1:
             Menu.logError("Invalid value")
         if choice == 1:
             while True:
-                resultMenu = Menu(100, sep="-")
                 searchMenu.show()
-                choice = Menu.getChoice(4)
+                choice = Menu.getChoice(5)
                 if choice == -1:
                     Menu.logError("Invalid value")
                     continue
                 if choice == 1:
                     searchByMenu.setTitle("Search by title")
                     searchByMenu.show()
-                    res = ctl.search(Menu.getKeyLog("Enter a keyword"), "Title")
-                    resultMenu.setTitle("Found " + str(len(res)) + " items")
-                    resultMenu.addLines(Catalog.convert(res))
-                    resultMenu.show()
-                    Menu.getKeyLog("Press Enter to continue")
+                    res = ctl.iterSearch(Menu.getKeyLog("Enter a keyword"), "Title")
+                    showPages("Search by title", res)
                 elif choice == 2:
                     searchByMenu.setTitle("Search by contributors")
                     searchByMenu.show()
-                    res = ctl.search(Menu.getKeyLog("Enter a keyword"), "Contributor")
-                    resultMenu.setTitle("Found " + str(len(res)) + " items")
-                    resultMenu.addLines(Catalog.convert(res))
-                    resultMenu.show()
-                    Menu.getKeyLog("Press Enter to continue")
+                    res = ctl.iterSearch(Menu.getKeyLog("Enter a keyword"), "Contributor")
+                    showPages("Search by contributors", res)
                 elif choice == 3:
                     searchByMenu.setTitle("Search by UPC")
                     searchByMenu.show()
-                    res = ctl.search(Menu.getKeyLog("Enter a keyword"), "UPC")
-                    resultMenu.setTitle("Found " + str(len(res)) + " items")
-                    resultMenu.addLines(Catalog.convert(res))
-                    resultMenu.show()
-                    Menu.getKeyLog("Press Enter to continue")
+                    keyword = Menu.getKeyLog("Enter a keyword")
+                    res = ctl.lookup("UPC", keyword) if keyword != "" else []
+                    if len(res) == 0:
+                        res = ctl.iterSearch(keyword, "UPC")
+                    showPages("Search by UPC", res)
+                elif choice == 4:
+                    liveSearch(ctl)
                 else:
                     break
 
         elif choice == 2:
-            res = ctl.getItems()
-            menus = [Menu(100, "Book: "+str(len(res[0]))+" items", "-"), Menu(100, "CD: "+str(len(res[1]))+" items", "-"), Menu(100, "DVD: "+str(len(res[2]))+" items", "-"), Menu(100, "Magazine: "+str(len(res[3]))+" items", "-")]
-            for i, menu in enumerate(menus):
-                menu.addLines(Catalog.convert(res[i]))
-                menu.show()
-                Menu.getKeyLog("Press Enter to continue")
+            for type in ["Book", "CD", "DVD", "Magazine"]:
+                showPages(f"{type}: {ctl.countItems(type)} items", ctl.iterItems(type))
         elif choice == 3:
             res = addFunc()
             ctl.addItem(res)
         elif choice == 4:
+            importMenu = Menu(100, "Import items", "-")
+            importMenu.show()
+            path = Menu.getKeyLog("Enter the path of a .csv, .jsonl or .json file")
+            if not os.path.isfile(path):
+                Menu.logError("File not found.")
+                continue
+            try:
+                count, rejected = ctl.importItems(path)
+            except OSError as e:
+                Menu.logError(f"Cannot read the file: {e.strerror}.")
+                continue
+            except ValueError as e:
+                Menu.logError(f"Nothing imported. {e}")
+                continue
+            importMenu.addLines(f"Imported {count} items.")
+            for line, reason in rejected[:10]:
+                importMenu.addLines(f"Skipped line {line}: {reason}")
+            if len(rejected) > 10:
+                importMenu.addLines(f"Skipped {len(rejected) - 10} more items.")
+            importMenu.show()
+            Menu.getKeyLog("Press Enter to continue")
+        elif choice == 5:
+            exportMenu = Menu(100, "Export items", "-")
+            exportMenu.show()
+            path = Menu.getKeyLog("Enter the path of a .csv, .jsonl or .json file")
+            try:
+                ctl.export(path, None)
+            except OSError as e:
+                Menu.logError(f"Cannot write the file: {e.strerror}.")
+                continue
+            except ValueError:
+                Menu.logError("Unknown file format.")
+                continue
+            exportMenu.addLines(f"Exported items to {path}.")
+            exportMenu.show()
+            Menu.getKeyLog("Press Enter to continue")
+        elif choice == 6:
             deleteMenu = Menu(100, "Delete item", "-")
             deleteMenu.show()
             keyword = Menu.getKeyLog("Enter the title of the item you want to delete")
-            matches = ctl.search(keyword, "Title")
-            delItems = len(matches)
+            try:
+                matches = ctl.search(keyword, "Title")
+            except (ValueError, re.error):
+                Menu.logError("Invalid keyword.")
+                continue
             matches = Catalog.convert(matches)
             if matches == "":
                 deleteMenu.addLines("Found 0 items...")
@@ -227,15 +410,31 @@ def main():
             deleteMenu.show()
             choice = Menu.getKeyLog("Are you sure you want to delete these items? (y/n)")
             if choice.lower() == "y":
-                ctl.deleteItems(keyword)
+                delItems = ctl.deleteItems(keyword)
                 deleteMenu.addLines(f"Delete {delItems} items.")
                 deleteMenu.show()
                 Menu.getKeyLog("Press Enter to continue")
             else:
                 Menu.getKeyLog("Aborted. Press Enter to continue")
-        elif choice == 5:
+        elif choice == 7:
             Menu.clear()
             exit()
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Library catalog. Runs the interactive menu without a command.")
+    parser.add_argument("--engine", choices=["json", "sqlite"], default="json",
+                        help="keep the catalog in memory (json) or in an SQLite database next to the json file")
+    commands = parser.add_subparsers(dest="command")
+
+    search = commands.add_parser("query", help="search for keywords read one per line, writing json lines")
+    search.add_argument("--file", required=True, help="json file of the catalog")
+    search.add_argument("--field", default=None, help="field to search, such as Title, Contributor or UPC."
+                                                       " All fields are searched by default")
+    search.add_argument("--queries", default=None, help="file holding one keyword per line. Default: stdin")
+    search.add_argument("--limit", type=int, default=None, help="maximum number of results per keyword")
+
+    args = parser.parse_args()
+    if args.command == "query":
+        query(args)
+    else:
+        main(args.engine)
@@ -1,5 +1,14 @@
+from functools import lru_cache
+from itertools import islice
 import re
-from os import name, system
+import shutil
+import sys
+from os import name, read, system
+if name == "nt":
+    import msvcrt
+else:
+    import termios
+    import tty
 
 class Menu:
     """
@@ -20,6 +29,12 @@ class Menu:
         {"from": "\U0002b740", "to": "\U0002b81f"},
         {"from": "\U0002b820", "to": "\U0002ceaf"}  # included as of Unicode 8.0
     ]
+    # Characters that take two columns on screen, compiled once from the ranges above.
+    __widePattern = re.compile("[" + "".join(r["from"] + "-" + r["to"] for r in __ranges) + "]")
+    __clearScreen = "\x1b[H\x1b[2J\x1b[3J"
+    if name == "nt":
+        # Lets the Windows console understand ANSI escape sequences.
+        system("")
 
     def __init__(self, maxLength, title="", sep=" "):
         """
@@ -75,12 +90,100 @@ class Menu:
         """
         Print the menu to the screen.
         """
-        Menu.clear()
         self.__format()
-        print(self.__border)
-        for c in self.__content:
-            print(c)
-        print(self.__border)
+        sys.stdout.write(Menu.__clearScreen + self.__border + "\n" + "\n".join(self.__content)
+                         + "\n" + self.__border + "\n")
+        sys.stdout.flush()
+
+    def browse(self, rows, height=None):
+        """
+        Shows rows in a scrollable viewport, one screen at a time, until the user leaves.
+        Rows are pulled from the iterator only when they scroll into view, and only visible rows are formatted,
+        so that browsing a long listing starts right away.
+        Enter shows the next page, "p" the previous one, "g <row>" jumps to a row and "!q" leaves.
+
+        Parameters:
+            rows (iterable): lines to show, may be a generator
+            height (int): number of rows per screen. If None, it is taken from the height of the terminal
+        """
+        if height is None:
+            height = max(1, shutil.get_terminal_size((self.__maxLength, 30)).lines - 6)
+        rows = iter(rows)
+        pulled = []
+        exhausted = False
+        first = 0
+        while True:
+            if not exhausted and len(pulled) < first + height + 1:
+                # One extra row tells whether there is a next page.
+                more = list(islice(rows, first + height + 1 - len(pulled)))
+                pulled.extend(more)
+                exhausted = len(pulled) < first + height + 1
+            visible = pulled[first:first + height]
+            total = f"{len(pulled)}" if exhausted else f"{len(pulled) - 1}+"
+            if len(visible) == 0:
+                title = f"{self.__title} (0 rows)"
+            else:
+                title = f"{self.__title} ({first + 1}-{first + len(visible)} of {total})"
+            self.__showRows(title, visible)
+
+            last = exhausted and first + height >= len(pulled)
+            key = Menu.getKeyLog("Enter: " + ("leave" if last else "next page") + ", p: previous page, "
+                                 "g <row>: jump to row, !q: leave").strip()
+            if key == "!q" or (key == "" and last):
+                return
+            if key == "":
+                first += height
+            elif key == "p":
+                first = max(0, first - height)
+            elif key.startswith("g") and key[1:].strip().isdigit():
+                target = max(0, int(key[1:].strip()) - 1)
+                if not exhausted and target >= len(pulled):
+                    pulled.extend(islice(rows, target + 1 - len(pulled)))
+                    exhausted = len(pulled) <= target
+                first = min(target, max(0, len(pulled) - 1)) if exhausted else target
+
+    def live(self, search, height=None):
+        """
+        Reads a keyword one key at a time, and after every key shows the rows search gives for it.
+        Backspace deletes the last character, Enter accepts the keyword and Esc leaves.
+
+        Parameters:
+            search (function): Given the keyword typed so far, returns a pair of the rows to show
+                and a status shown in the title
+            height (int): number of rows shown. If None, it is taken from the height of the terminal
+
+        Returns:
+            The keyword when Enter is pressed, or None when the user leaves
+        """
+        if height is None:
+            height = max(1, shutil.get_terminal_size((self.__maxLength, 30)).lines - 6)
+        keyword = ""
+        while True:
+            rows, status = search(keyword)
+            # Only the start of a long keyword scrolls out of the prompt.
+            prompt = "> " + keyword[-(self.__maxLength - 3):]
+            self.__showRows(f"{self.__title} ({status})", rows[:height], prompt)
+            for key in Menu.getKey():
+                if key == "\x1b":
+                    return None
+                if key == "\n" and keyword != "":
+                    return keyword
+                if key == "\b":
+                    keyword = keyword[:-1]
+                elif key.isprintable():
+                    keyword += key
+
+    def __showRows(self, title, rows, prompt=""):
+        """
+        Formats and draws one screen of the viewport, with a prompt under it.
+        """
+        anchor = (self.__maxLength-2)//2 - len(title)//2
+        content = ["|" + " "*anchor + title + " "*(self.__maxLength-2-anchor-len(title)) + "|", self.__sep]
+        for line in rows:
+            content.append("|" + " " + line + " "*(self.__maxLength-3-Menu.__calcLen(line)) + "|")
+        sys.stdout.write(Menu.__clearScreen + self.__border + "\n" + "\n".join(content)
+                         + "\n" + self.__border + "\n" + prompt)
+        sys.stdout.flush()
 
     @staticmethod
     def getChoice(choices):
@@ -107,14 +210,41 @@ class Menu:
             raise ValueError("Cannot enter empty string.")
         return inp
     @staticmethod
-    def clear():
+    def getKey():
         """
-        A function that clears the console screen.
+        Returns the keys pressed, without waiting for Enter. Enter gives "\\n", Backspace "\\b" and Esc "\\x1b".
+        Keys sending escape sequences, such as arrows, give an empty string, and pasted text may give several
+        characters at once. Without a terminal, a character of standard input is read, and its end gives Esc.
         """
         if name == "nt":
-            _ = system("cls")
+            key = msvcrt.getwch()
+            if key in ("\x00", "\xe0"):
+                msvcrt.getwch()
+                return ""
+        elif not sys.stdin.isatty():
+            key = sys.stdin.read(1)
+            if key == "":
+                return "\x1b"
         else:
-            _ = system("clear")
+            fd = sys.stdin.fileno()
+            old = termios.tcgetattr(fd)
+            try:
+                tty.setcbreak(fd)
+                # A key sending several bytes sends them at once, so one read gets all of them.
+                key = read(fd, 64).decode("utf-8", "ignore")
+            finally:
+                termios.tcsetattr(fd, termios.TCSADRAIN, old)
+            if key.startswith("\x1b") and len(key) > 1:
+                return ""
+        return key.replace("\r\n", "\n").replace("\r", "\n").replace("\x7f", "\b")
+
+    @staticmethod
+    def clear():
+        """
+        A function that clears the console screen.
+        """
+        sys.stdout.write(Menu.__clearScreen)
+        sys.stdout.flush()
 
     @staticmethod
     def logError(error):
@@ -129,15 +259,13 @@ class Menu:
         input()
 
     @staticmethod
+    @lru_cache(maxsize=4096)
     def __calcLen(line):
         """
         Calculate the length of the line. This function covers the situations in which the line contains special characters.
+        Widths are remembered, since every line is measured when it is added and again when it is shown.
         """
-        pattern = []
-        for r in Menu.__ranges:
-            pattern.append("["+r["from"]+"-"+r["to"]+"]")
-        pattern = re.compile("|".join(pattern))
-        res = re.findall(pattern, line)
+        res = Menu.__widePattern.findall(line)
         return len(line) - line.count("\x1b[6;30;42m")*14 + len(res)
 
     def __format(self):
@@ -0,0 +1,110 @@
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import re
+
+class ParallelSearch:
+    """
+    Matches regular expressions against a large catalog on several cores.
+    Items are split into shards that every worker process receives once, when the pool is started.
+    A search then only sends the pattern to the workers and gets back the ids of matched items.
+    The pool is started again when the catalog has changed since it was built.
+    """
+    _shards = None
+
+    def __init__(self, workers, threshold, shardSize=None):
+        """
+        Initializes a ParallelSearch object.
+
+        Parameters:
+            workers (int): Number of worker processes
+            threshold (int): Catalogs with fewer items than this are searched in the calling process
+            shardSize (int): Number of items per shard. If None, items are split evenly between workers
+        """
+        self.__workers = workers
+        self.__threshold = threshold
+        self.__shardSize = shardSize
+        self.__pool = None
+        self.__shardCount = 0
+        self.__version = None
+
+    def accepts(self, count):
+        """
+        Returns True if a catalog of count items should be searched in parallel.
+
+        Parameters:
+            count (int): Number of items in the catalog
+        """
+        return self.__workers > 1 and count >= self.__threshold
+
+    def search(self, pattern, flags, field, version, entries):
+        """
+        Finds the ids of items with a field matching a regular expression.
+
+        Parameters:
+            pattern (str): The regular expression
+            flags (int): Flags of the regular expression
+            field (str): The field to look in. "Contributor" means all contributors, None means all fields
+            version (int): Version of the catalog. The pool is rebuilt when it changes
+            entries (function): Returns (id, keys, contribTypes) of all items, used to rebuild the pool.
+                keys maps the fields of an item to their folded search keys
+
+        Returns:
+            A list of ids of matched items
+        """
+        if self.__pool is None or self.__version != version:
+            self.__start(list(entries()))
+            self.__version = version
+        futures = [self.__pool.submit(ParallelSearch.match, i, pattern, flags, field) for i in range(self.__shardCount)]
+        return [id for future in futures for id in future.result()]
+
+    def close(self):
+        """
+        Stops the worker processes.
+        """
+        if self.__pool is not None:
+            self.__pool.shutdown(cancel_futures=True)
+            self.__pool = None
+
+    def __start(self, entries):
+        """
+        Splits entries into shards and starts a pool of workers holding them.
+        """
+        self.close()
+        size = self.__shardSize if self.__shardSize else max(1, -(-len(entries) // self.__workers))
+        shards = [entries[i:i + size] for i in range(0, len(entries), size)]
+        # Forked workers inherit the shards without pickling them, so prefer fork where it exists.
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context("fork" if "fork" in methods else None)
+        self.__pool = ProcessPoolExecutor(self.__workers, mp_context=context,
+                                          initializer=ParallelSearch.load, initargs=(shards,))
+        self.__shardCount = len(shards)
+
+    @staticmethod
+    def load(shards):
+        """
+        Keeps the shards in a worker process.
+        """
+        ParallelSearch._shards = shards
+
+    @staticmethod
+    def match(index, pattern, flags, field):
+        """
+        Matches a regular expression against one shard in a worker process.
+
+        Returns:
+            A list of ids of matched items
+        """
+        compiled = re.compile(pattern, flags)
+        results = []
+        for id, keys, contribTypes in ParallelSearch._shards[index]:
+            if field == "Contributor":
+                names = contribTypes
+            elif field is not None:
+                names = [field] if field in keys else []
+            else:
+                names = keys
+            for i in names:
+                if compiled.search(keys[i]) is not None:
+                    results.append(id)
+                    break
+        return results
@@ -0,0 +1,232 @@
+import argparse
+import asyncio
+import json
+import re
+from http import HTTPStatus
+from urllib.parse import parse_qs, urlsplit
+from catalog import Catalog
+from locking import ReadWriteLock
+from sqlitecatalog import SqliteCatalog
+
+class CatalogService:
+    """
+    Serves a catalog over a local HTTP/JSON API. The catalog is loaded once and stays warm in memory.
+
+    Requests are read by one event loop and answered in worker threads. Searches, listings and lookups
+    run concurrently. Additions and deletions wait until no read is running, then run one at a time.
+    Threads wait for the lock instead of the event loop, so that a write in progress does not stop the
+    server from accepting connections.
+
+        GET /search?q=keyword[&field=Title][&offset=0][&limit=10]
+        GET /items?type=Book[&offset=0][&limit=10]
+        GET /lookup?field=UPC&value=identifier
+        POST /items with a json item or list of items as body
+        DELETE /items?title=keyword
+
+    Every response is a json object. Failed requests give {"error": reason}.
+    """
+    def __init__(self, ctl):
+        """
+        Initializes a CatalogService object.
+
+        Parameters:
+            ctl (Catalog): The catalog to serve, or a SqliteCatalog
+        """
+        self.__ctl = ctl
+        self.__lock = ReadWriteLock()
+        self.__routes = {
+            ("GET", "/search"): self.__search,
+            ("GET", "/items"): self.__items,
+            ("GET", "/lookup"): self.__lookup,
+            ("POST", "/items"): self.__add,
+            ("DELETE", "/items"): self.__delete,
+        }
+
+    async def serve(self, host="127.0.0.1", port=8080):
+        """
+        Serves requests until the task is cancelled.
+
+        Parameters:
+            host (str): The address to listen on. Default="127.0.0.1"
+            port (int): The port to listen on. 0 picks a free port. Default=8080
+        """
+        server = await asyncio.start_server(self.__connection, host, port)
+        address = server.sockets[0].getsockname()
+        print(f"Serving the catalog on http://{address[0]}:{address[1]}", flush=True)
+        async with server:
+            await server.serve_forever()
+
+    async def __connection(self, reader, writer):
+        """
+        Answers the requests of one connection, which is kept open between requests unless the client closes it.
+        """
+        try:
+            while True:
+                request = await CatalogService.__read(reader)
+                if request is None:
+                    break
+                method, target, headers, body = request
+                status, res = await self.__dispatch(method, target, body)
+                keepAlive = headers.get("connection", "").lower() != "close"
+                CatalogService.__write(writer, status, res, keepAlive)
+                await writer.drain()
+                if not keepAlive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            # Closed connections and requests that are not HTTP end the connection.
+            pass
+        finally:
+            writer.close()
+
+    async def __dispatch(self, method, target, body):
+        """
+        Runs the handler of a request and returns its status and json response.
+        """
+        url = urlsplit(target)
+        handler = self.__routes.get((method, url.path))
+        if handler is None:
+            if any(path == url.path for _, path in self.__routes):
+                return HTTPStatus.METHOD_NOT_ALLOWED, {"error": "Method not allowed."}
+            return HTTPStatus.NOT_FOUND, {"error": "Not found."}
+        parameters = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        try:
+            return await handler(parameters, body)
+        except KeyError as e:
+            return HTTPStatus.BAD_REQUEST, {"error": f"Missing parameter {e}."}
+        except (ValueError, re.error) as e:
+            return HTTPStatus.BAD_REQUEST, {"error": str(e)}
+
+    async def __search(self, parameters, body):
+        """
+        Handles GET /search.
+        """
+        offset, limit = CatalogService.__range(parameters)
+        keyword, field = parameters["q"], parameters.get("field")
+        results = await self.__reading(lambda: list(self.__ctl.iterSearch(keyword, field, offset, limit,
+                                                                          highlight=False)))
+        return HTTPStatus.OK, {"count": len(results), "results": results}
+
+    async def __items(self, parameters, body):
+        """
+        Handles GET /items.
+        """
+        type = parameters["type"]
+        if type not in ["Book", "CD", "DVD", "Magazine"]:
+            raise ValueError("Invalid Type.")
+        offset, limit = CatalogService.__range(parameters)
+        total, results = await self.__reading(lambda: (self.__ctl.countItems(type),
+                                                       list(self.__ctl.iterItems(type, offset, limit))))
+        return HTTPStatus.OK, {"total": total, "count": len(results), "results": results}
+
+    async def __lookup(self, parameters, body):
+        """
+        Handles GET /lookup.
+        """
+        field, value = parameters["field"], parameters["value"]
+        results = await self.__reading(lambda: self.__ctl.lookup(field, value))
+        return HTTPStatus.OK, {"count": len(results), "results": results}
+
+    async def __add(self, parameters, body):
+        """
+        Handles POST /items. Invalid items are skipped and reported by their position in the body.
+        """
+        data = json.loads(body)
+        data = data if isinstance(data, list) else [data]
+        valid, rejected = Catalog.checkItems(list(enumerate(data)))
+        if len(valid) != 0:
+            await self.__writing(lambda: self.__ctl.addItem(valid))
+        return HTTPStatus.OK, {"added": len(valid), "rejected": rejected}
+
+    async def __delete(self, parameters, body):
+        """
+        Handles DELETE /items.
+        """
+        keyword = parameters["title"]
+        count = await self.__writing(lambda: self.__ctl.deleteItems(keyword))
+        return HTTPStatus.OK, {"deleted": count}
+
+    async def __reading(self, function):
+        """
+        Calls function in a worker thread holding the lock as a reader, and returns its result.
+        """
+        def read():
+            with self.__lock.reading():
+                return function()
+        return await asyncio.get_running_loop().run_in_executor(None, read)
+
+    async def __writing(self, function):
+        """
+        Calls function in a worker thread holding the lock as the writer, and returns its result.
+        """
+        def write():
+            with self.__lock.writing():
+                return function()
+        return await asyncio.get_running_loop().run_in_executor(None, write)
+
+    @staticmethod
+    def __range(parameters):
+        """
+        Returns the offset and limit parameters of a request.
+        """
+        offset = int(parameters.get("offset", 0))
+        limit = int(parameters["limit"]) if "limit" in parameters else None
+        if offset < 0 or (limit is not None and limit < 0):
+            raise ValueError("Invalid Value.")
+        return offset, limit
+
+    @staticmethod
+    async def __read(reader):
+        """
+        Reads a request from a connection.
+
+        Returns:
+            (method, target, headers, body), or None if the connection was closed
+        """
+        line = await reader.readline()
+        if line == b"":
+            return None
+        method, target, _ = line.decode("latin-1").split(" ", 2)
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        length = int(headers.get("content-length", 0))
+        body = await reader.readexactly(length) if length > 0 else b""
+        return method, target, headers, body
+
+    @staticmethod
+    def __write(writer, status, res, keepAlive):
+        """
+        Writes a json response to a connection.
+        """
+        body = json.dumps(res, ensure_ascii=False).encode("utf-8")
+        head = (f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+                f"Content-Type: application/json; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: {'keep-alive' if keepAlive else 'close'}\r\n\r\n")
+        writer.write(head.encode("latin-1") + body)
+
+def main():
+    parser = argparse.ArgumentParser(description="Serves a library catalog over a local HTTP/JSON API.")
+    parser.add_argument("file", help="json file of the catalog")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--engine", choices=["json", "sqlite"], default="json",
+                        help="keep the catalog in memory (json) or in an SQLite database next to the json file")
+    args = parser.parse_args()
+
+    if args.engine == "sqlite":
+        ctl = SqliteCatalog(SqliteCatalog.databasePath(args.file), args.file)
+    else:
+        ctl = Catalog(args.file, snapshot=True)
+    service = CatalogService(ctl)
+    try:
+        asyncio.run(service.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
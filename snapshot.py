@@ -0,0 +1,259 @@
+import copyreg
+import gc
+import hashlib
+import hmac
+import io
+import os
+import pickle
+import struct
+from types import MappingProxyType
+
+class Snapshot:
+    """
+    A binary file holding the state of a catalog, so that it can be restored without parsing and indexing
+    its items again. The state is split into named sections, pickled one by one, which are read from the file
+    when they are needed. Strings shared by many items are pickled once. Restoring still creates every
+    object of the catalog, so it takes about a fifth of the time of loading the json file, growing with it.
+
+    The file starts with a magic number, a signature, the length of the header and the pickled header.
+    The header holds the format version, a description of the source the state was read from, and where
+    every section is with a hash of its bytes. A snapshot is only used if its version and source match,
+    so the caller decides when it is stale.
+
+    Unpickling runs code named by the file, so a snapshot is only read if it was written with the key of the
+    user: the signature is a keyed BLAKE2b hash of the header, checked before the header is unpickled,
+    and a section is only unpickled if its bytes have the hash the header holds.
+    The key is made on first use and kept in a file only the user can read, outside the directory of the
+    data, so that anyone able to write that directory still cannot make a snapshot that is read.
+    """
+    __magic = b"CATSNAP\0"
+    __version = 4
+    __length = struct.Struct("<Q")
+    __signatureSize = 32
+    # Cached information of items is a read-only view, which pickle cannot copy.
+    # It is written as a dictionary and wrapped again when it is read.
+    __dispatch = copyreg.dispatch_table.copy()
+    __dispatch[MappingProxyType] = lambda proxy: (Snapshot.view, (dict(proxy),))
+
+    def __init__(self, file, header, persistent):
+        """
+        Initializes a Snapshot object. Use open() to read a snapshot from a file.
+        """
+        self.__file = file
+        self.__header = header
+        self.__persistent = persistent
+
+    @staticmethod
+    def write(path, source, sections, persistent=None):
+        """
+        Writes a snapshot through a temporary file, so that readers never see a partial one.
+
+        Parameters:
+            path (str): The file to write
+            source: A picklable description of the source of the state
+            sections (dict): Maps names of sections to the objects they hold
+            persistent (dict): Maps names to objects that are not pickled but given again by open(),
+                such as functions. Default=None
+
+        Raises:
+            OSError: If the file or the key cannot be written
+        """
+        names = {id(v): k for k, v in (persistent or {}).items()}
+        blobs = []
+        for name, value in sections.items():
+            buffer = io.BytesIO()
+            pickler = pickle.Pickler(buffer, protocol=pickle.HIGHEST_PROTOCOL)
+            pickler.dispatch_table = Snapshot.__dispatch
+            if len(names) != 0:
+                pickler.persistent_id = lambda obj: names.get(id(obj))
+            enabled = gc.isenabled()
+            gc.disable()
+            try:
+                pickler.dump(value)
+            finally:
+                if enabled:
+                    gc.enable()
+            blobs.append((name, buffer.getvalue()))
+
+        # Offsets are relative to the end of the header, whose length depends on them.
+        offset = 0
+        places = {}
+        for name, blob in blobs:
+            places[name] = (offset, len(blob), Snapshot.__hash(blob))
+            offset += len(blob)
+        header = pickle.dumps({"version": Snapshot.__version, "source": source, "sections": places},
+                              protocol=pickle.HIGHEST_PROTOCOL)
+        signature = hashlib.blake2b(Snapshot.__length.pack(len(header)) + header, key=Snapshot.__key(),
+                                    digest_size=Snapshot.__signatureSize)
+
+        # Rebuilds started by different programs may run at the same time, so each writes its own file.
+        tmpPath = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmpPath, "wb") as file:
+                file.write(Snapshot.__magic + signature.digest() + Snapshot.__length.pack(len(header)) + header)
+                for name, blob in blobs:
+                    file.write(blob)
+                file.flush()
+                os.fsync(file.fileno())
+        except BaseException:
+            if os.path.isfile(tmpPath):
+                os.remove(tmpPath)
+            raise
+        os.replace(tmpPath, path)
+
+    @staticmethod
+    def open(path, persistent=None):
+        """
+        Opens a snapshot.
+
+        Parameters:
+            path (str): The file of the snapshot
+            persistent (dict): The objects given to write() as persistent. Default=None
+
+        Returns:
+            A Snapshot object, or None if the file does not exist, is damaged, is not signed with the key
+            of the user or has another format version
+        """
+        try:
+            key = Snapshot.__key(False)
+            if key is None:
+                # Without a key, none of the snapshots of the user can have been signed yet.
+                return None
+            file = open(path, "rb")
+        except OSError:
+            return None
+        try:
+            if file.read(len(Snapshot.__magic)) != Snapshot.__magic:
+                raise ValueError("Not a snapshot.")
+            expected = file.read(Snapshot.__signatureSize)
+            prefix = file.read(Snapshot.__length.size)
+            length, = Snapshot.__length.unpack(prefix)
+            header = file.read(length)
+            signature = hashlib.blake2b(prefix + header, key=key, digest_size=Snapshot.__signatureSize)
+            if not hmac.compare_digest(signature.digest(), expected):
+                raise ValueError("Invalid snapshot signature.")
+            header = pickle.loads(header)
+            if header.get("version") != Snapshot.__version:
+                raise ValueError("Unknown snapshot version.")
+            base = file.tell()
+            header["sections"] = {k: (base + offset, size, digest)
+                                  for k, (offset, size, digest) in header["sections"].items()}
+        except (ValueError, OSError, EOFError, AttributeError, TypeError, pickle.UnpicklingError, struct.error):
+            file.close()
+            return None
+        return Snapshot(file, header, persistent or {})
+
+    def source(self):
+        """
+        Returns the description of the source given to write().
+        """
+        return self.__header["source"]
+
+    def load(self, name):
+        """
+        Unpickles a section from the file.
+
+        Parameters:
+            name (str): Name of the section
+
+        Returns:
+            The object held by the section
+
+        Raises:
+            ValueError: If the bytes of the section are not the ones the snapshot was written with
+        """
+        offset, size, digest = self.__header["sections"][name]
+        self.__file.seek(offset)
+        blob = self.__file.read(size)
+        if not hmac.compare_digest(Snapshot.__hash(blob), digest):
+            raise ValueError("Damaged snapshot.")
+        unpickler = pickle.Unpickler(io.BytesIO(blob))
+        unpickler.persistent_load = self.__persistent.__getitem__
+        # Unpickling creates millions of objects and no garbage, so collections would only scan them again and again.
+        enabled = gc.isenabled()
+        gc.disable()
+        try:
+            return unpickler.load()
+        finally:
+            if enabled:
+                gc.enable()
+
+    def close(self):
+        """
+        Closes the file.
+        """
+        self.__file.close()
+
+    @staticmethod
+    def view(data):
+        """
+        Returns a read-only view of a dictionary. Pickled views are unpickled with this function.
+        """
+        return MappingProxyType(data)
+
+    @staticmethod
+    def __hash(blob):
+        """
+        Returns the hash of the bytes of a section.
+        """
+        return hashlib.blake2b(blob, digest_size=Snapshot.__signatureSize).digest()
+
+    @staticmethod
+    def keyPath():
+        """
+        Returns the path of the file holding the key snapshots are signed with. It is the file named by
+        the CATALOG_SNAPSHOT_KEY environment variable, or .catalog/snapshot.key in the home directory.
+        """
+        path = os.environ.get("CATALOG_SNAPSHOT_KEY")
+        return path if path else os.path.join(os.path.expanduser("~"), ".catalog", "snapshot.key")
+
+    @staticmethod
+    def __key(make=True):
+        """
+        Returns the key snapshots are signed with. If there is none, it is made first,
+        or None is returned if make is False.
+
+        Raises:
+            OSError: If the key cannot be read or made
+        """
+        path = Snapshot.keyPath()
+        try:
+            with open(path, "rb") as file:
+                key = file.read()
+        except FileNotFoundError:
+            if not make:
+                return None
+            os.makedirs(os.path.dirname(path) or ".", mode=0o700, exist_ok=True)
+            key = os.urandom(32)
+            try:
+                descriptor = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+            except FileExistsError:
+                # Another program made the key meanwhile.
+                with open(path, "rb") as file:
+                    key = file.read()
+            else:
+                with os.fdopen(descriptor, "wb") as file:
+                    file.write(key)
+        if len(key) != 32:
+            raise OSError(f"Invalid snapshot key {path}.")
+        return key
+
+    @staticmethod
+    def remove(path):
+        """
+        Removes a snapshot if there is one.
+
+        Parameters:
+            path (str): The file of the snapshot
+        """
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    @staticmethod
+    def pathOf(dataPath):
+        """
+        Returns the path of the snapshot of a data file.
+        """
+        return dataPath + ".snapshot"
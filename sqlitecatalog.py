@@ -0,0 +1,560 @@
+import errno
+from itertools import islice
+import json
+import os
+import re
+import sqlite3
+import threading
+from urllib.request import pathname2url
+from bulk import BulkFormat, CsvFormat
+from catalog import Catalog, Book, CD, DVD, Magazine
+from index import HashIndex, SearchPattern, TokenIndex
+from storage import Storage
+
+class SqliteCatalog:
+    """
+    A catalog kept in an SQLite database instead of in memory. It has the same interface as Catalog,
+    but only the items a call returns are ever loaded, so memory use does not grow with the catalog.
+
+    Items are rows of a typed items table holding their stored dictionary as json, with indexed columns
+    for sorting and for normalized UPC, ISBN and ASIN. Contributors have their own table, linked to items
+    by credits. Every field of every item has a folded search key in an FTS5 table with trigram tokens,
+    which answers substring queries. Regular expressions are matched against the same keys.
+
+    Every thread uses its own connection, so that a search never sees the rows of a write that another
+    thread is in the middle of.
+    """
+    __types = ["Book", "CD", "DVD", "Magazine"]
+    __identifiers = ["UPC", "ISBN", "ASIN"]
+    __classes = {"Book": Book, "CD": CD, "DVD": DVD, "Magazine": Magazine}
+    # Search keys of an item have rowids id * __stride + n, so that they can be deleted without a scan.
+    __stride = 256
+    __schema = """
+        CREATE TABLE IF NOT EXISTS items (
+            id INTEGER PRIMARY KEY,
+            type TEXT NOT NULL,
+            title TEXT NOT NULL,
+            record TEXT NOT NULL,
+            upc TEXT,
+            isbn TEXT,
+            asin TEXT
+        );
+        CREATE INDEX IF NOT EXISTS itemsOrder ON items (type, title, id);
+        CREATE INDEX IF NOT EXISTS itemsUPC ON items (upc);
+        CREATE INDEX IF NOT EXISTS itemsISBN ON items (isbn);
+        CREATE INDEX IF NOT EXISTS itemsASIN ON items (asin);
+        CREATE TABLE IF NOT EXISTS contributors (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            key TEXT NOT NULL UNIQUE
+        );
+        CREATE TABLE IF NOT EXISTS credits (
+            item INTEGER NOT NULL,
+            contributor INTEGER NOT NULL,
+            role TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS creditsItem ON credits (item);
+        CREATE INDEX IF NOT EXISTS creditsContributor ON credits (contributor, role);
+        CREATE INDEX IF NOT EXISTS creditsRole ON credits (role, item);
+        CREATE VIRTUAL TABLE IF NOT EXISTS fields USING fts5 (
+            key, item UNINDEXED, name UNINDEXED, contributor UNINDEXED, tokenize = 'trigram'
+        );
+    """
+
+    def __init__(self, dbPath, dataPath=None, readOnly=False):
+        """
+        Initializes a SqliteCatalog object, creating the database if needed.
+
+        Parameters:
+            dbPath (str): The path to the SQLite database
+            dataPath (str): A json file containing information about library items. Its items are imported
+                when the database is empty. Default=None
+            readOnly (bool): If True, the database is opened read-only and must exist. Default=False
+
+        Raises:
+            FileNotFoundError: If the catalog is read-only and the database does not exist
+        """
+        self.__path = dbPath
+        self.__readOnly = readOnly
+        self.__local = threading.local()
+        self.__connections = []
+        self.__connecting = threading.Lock()
+        if readOnly:
+            if not os.path.isfile(dbPath):
+                raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), dbPath)
+            return
+        self.__db.execute("PRAGMA journal_mode = WAL")
+        self.__db.executescript(SqliteCatalog.__schema)
+        if dataPath is not None and self.__db.execute("SELECT 1 FROM items LIMIT 1").fetchone() is None:
+            self.importItems(dataPath, "json")
+
+    @staticmethod
+    def create(dbPath, data):
+        """
+        Creates a database holding data, replacing the one at dbPath if there is one.
+
+        Parameters:
+            dbPath (str): The path to the SQLite database
+            data (list): Dictionaries of the items
+        """
+        for path in (dbPath, dbPath + "-wal", dbPath + "-shm"):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        ctl = SqliteCatalog(dbPath)
+        ctl.addItem(data)
+        ctl.close()
+
+    @staticmethod
+    def databasePath(dataPath):
+        """
+        Returns the path of the database kept next to a json file, such as items.db for items.json.
+        """
+        return os.path.splitext(dataPath)[0] + ".db"
+
+    def close(self):
+        """
+        Closes the database.
+        """
+        with self.__connecting:
+            for db in self.__connections:
+                db.close()
+            self.__connections = []
+        self.__local = threading.local()
+
+    def reload(self):
+        """
+        Does nothing, since every call reads the database and sees the changes of other programs.
+        It is there to have the same interface as Catalog.
+
+        Returns:
+            changed (bool): False
+        """
+        return False
+
+    def incremental(self, field=None, limit=10):
+        """
+        Starts a search that is run again on every keystroke. Every keyword is searched from scratch,
+        which the trigram index makes fast enough, and only the first limit results are read.
+
+        Parameters:
+            field (str): The field in which the search looks. If None, all fields are searched
+            limit (int): Number of results returned for a keyword. Default=10
+
+        Returns:
+            A SqliteIncrementalSearch object, whose search(keyword) returns the first results and their count
+        """
+        return SqliteIncrementalSearch(self, field, limit)
+
+    @property
+    def __db(self):
+        """
+        The connection of the calling thread, opened on first use.
+        """
+        db = getattr(self.__local, "db", None)
+        if db is None:
+            if self.__readOnly:
+                db = sqlite3.connect(f"file:{pathname2url(os.path.abspath(self.__path))}?mode=ro", uri=True,
+                                     check_same_thread=False)
+            else:
+                db = sqlite3.connect(self.__path, check_same_thread=False)
+            db.execute("PRAGMA synchronous = NORMAL")
+            db.create_function("regexp", 2, SqliteCatalog.__regexp, deterministic=True)
+            with self.__connecting:
+                self.__connections.append(db)
+            self.__local.db = db
+        return db
+
+    def search(self, keyword, field=None, highlight=True):
+        """
+        Finds all items that matches with the provided keyword.
+
+        Parameters:
+            keyword (str): The keyword to search for
+            field (str): The field in which the function searches. If None, the function will search all fields
+            highlight (bool): If False, matches are not marked in the returned information. Default=True
+
+        Returns:
+            results (list): List of all library items that matches the keyword
+        """
+        return list(self.iterSearch(keyword, field, highlight=highlight))
+
+    def iterSearch(self, keyword, field=None, offset=0, limit=None, highlight=True):
+        """
+        Finds items that match with the provided keyword, one at a time and in the order of search().
+        Items are read from the database while the caller iterates.
+
+        Parameters:
+            keyword (str): The keyword to search for
+            field (str): The field in which the function searches. If None, the function will search all fields
+            offset (int): Number of matched items to skip. Default=0
+            limit (int): Maximum number of items to return. If None, all matched items are returned
+            highlight (bool): If False, matches are not marked in the returned information. Default=True
+
+        Returns:
+            A generator of information of the library items that match the keyword
+        """
+        query = SearchPattern(keyword)
+        return islice(self.__matches(query, field, highlight), offset, None if limit is None else offset + limit)
+
+    def getItems(self):
+        """
+        Returns all library items sorted by type.
+
+        Returns:
+            results (list): A list containing all library items sorted by type. In which:
+                results[0]: A list of Book items
+                results[1]: A list of CD items
+                results[2]: A list of DVD items
+                results[3]: A list of Magazine items
+        """
+        return [list(self.iterItems(type)) for type in SqliteCatalog.__types]
+
+    def iterItems(self, type, offset=0, limit=None):
+        """
+        Returns library items of one type sorted by title, one at a time.
+
+        Parameters:
+            type (str): Type of the items (Book, CD, DVD or Magazine)
+            offset (int): Number of items to skip. Default=0
+            limit (int): Maximum number of items to return. If None, all items are returned
+
+        Returns:
+            A generator of information of the items, without their type
+        """
+        rows = self.__db.execute("SELECT record FROM items WHERE type = ? ORDER BY title, id LIMIT ? OFFSET ?",
+                                 (type, -1 if limit is None else limit, offset))
+        for record, in rows:
+            res = SqliteCatalog.__information(record)
+            del res["Type"]
+            yield res
+
+    def countItems(self, type):
+        """
+        Returns the number of library items of one type.
+
+        Parameters:
+            type (str): Type of the items (Book, CD, DVD or Magazine)
+        """
+        return self.__db.execute("SELECT COUNT(*) FROM items WHERE type = ?", (type,)).fetchone()[0]
+
+    def lookup(self, field, value):
+        """
+        Finds items by an exact identifier, ignoring spaces, dashes and case.
+
+        Parameters:
+            field (str): The identifier field (UPC, ISBN or ASIN)
+            value (str): The identifier to look for
+
+        Returns:
+            results (list): List of all library items holding the identifier, sorted by type and title
+        """
+        if field not in SqliteCatalog.__identifiers:
+            raise ValueError("Invalid field.")
+        return self.__select(f"{field.lower()} = ?", (HashIndex.normalize(value),))
+
+    def duplicates(self, field):
+        """
+        Finds identifiers that are held by more than one item.
+
+        Parameters:
+            field (str): The identifier field (UPC, ISBN or ASIN)
+
+        Returns:
+            results (dict): Maps every duplicated identifier to the list of library items holding it
+        """
+        if field not in SqliteCatalog.__identifiers:
+            raise ValueError("Invalid field.")
+        column = field.lower()
+        values = self.__db.execute(f"SELECT {column} FROM items WHERE {column} IS NOT NULL"
+                                   f" GROUP BY {column} HAVING COUNT(*) > 1 ORDER BY {column}").fetchall()
+        return {value: self.__select(f"{column} = ?", (value,)) for value, in values}
+
+    def byContributor(self, name, role=None):
+        """
+        Finds all items crediting a contributor, by exact name.
+
+        Parameters:
+            name (str): Name of the contributor, ignoring case and diacritics
+            role (str): Type of contributor (Author, Director, Actor, ...). If None, all roles are used
+
+        Returns:
+            results (list): List of all library items crediting the contributor, sorted by type and title
+        """
+        condition = "id IN (SELECT item FROM credits JOIN contributors ON contributors.id = contributor" \
+                    " WHERE key = ?" + ("" if role is None else " AND role = ?") + ")"
+        return self.__select(condition, (TokenIndex.fold(name),) + (() if role is None else (role,)))
+
+    def byRole(self, role):
+        """
+        Finds all items having a contributor of a type.
+
+        Parameters:
+            role (str): Type of contributor (Author, Director, Actor, ...)
+
+        Returns:
+            results (list): List of all library items with such a contributor, sorted by type and title
+        """
+        return self.__select("id IN (SELECT item FROM credits WHERE role = ?)", (role,))
+
+    def getContributors(self, role=None):
+        """
+        Returns the names of all contributors of the library, sorted.
+
+        Parameters:
+            role (str): Type of contributor (Author, Director, Actor, ...). If None, all types are used
+        """
+        if role is None:
+            rows = self.__db.execute("SELECT name FROM contributors ORDER BY name")
+        else:
+            rows = self.__db.execute("SELECT name FROM contributors WHERE id IN"
+                                     " (SELECT contributor FROM credits WHERE role = ?) ORDER BY name", (role,))
+        return [name for name, in rows]
+
+    def addItem(self, data):
+        """
+        Adds new items to the library in a single transaction.
+
+        Parameters:
+            data (list): A list of dictionaries containing information of the items
+        """
+        with self.__db:
+            for d in data:
+                self.__insert(d)
+
+    def deleteItems(self, keyword):
+        """
+        Deletes items that match with keyword by title, which are the items search(keyword, "Title") finds,
+        in a single transaction.
+
+        Parameters:
+            keyword (str): keyword to search for
+
+        Returns:
+            count (int): Number of deleted items
+        """
+        condition, parameters = SqliteCatalog.__condition(SearchPattern(keyword), "Title")
+        with self.__db:
+            ids = [id for id, in self.__db.execute("SELECT DISTINCT item FROM fields WHERE " + condition, parameters)]
+            return self.__deleteAll(ids)
+
+    def deleteByIdentifier(self, field, values):
+        """
+        Deletes all items holding any of many identifiers, ignoring spaces, dashes and case like lookup(),
+        in a single transaction.
+
+        Parameters:
+            field (str): The identifier field (UPC, ISBN or ASIN)
+            values (list): The identifiers of the items to delete
+
+        Returns:
+            count (int): Number of deleted items
+        """
+        if field not in SqliteCatalog.__identifiers:
+            raise ValueError("Invalid field.")
+        with self.__db:
+            ids = set()
+            for value in values:
+                ids.update(id for id, in self.__db.execute(f"SELECT id FROM items WHERE {field.lower()} = ?",
+                                                          (HashIndex.normalize(value),)))
+            return self.__deleteAll(sorted(ids))
+
+    def importItems(self, path, format=None):
+        """
+        Adds the items of a csv, json-lines or json file to the library.
+        The whole file is read and validated first, then its valid items are added in a single transaction.
+        Invalid items are skipped.
+
+        Parameters:
+            path (str): The file to read
+            format (str): "csv", "jsonl" or "json". If None, it is guessed from the extension of path
+
+        Returns:
+            count (int): Number of added items
+            rejected (list): (line, reason) pairs of the skipped items
+
+        Raises:
+            ValueError: If the format is unknown or the file is not valid
+            OSError: If the file cannot be read
+        """
+        valid, rejected = Catalog.checkItems(BulkFormat.of(path, format, Catalog.columns()).read(path))
+        self.addItem(valid)
+        return len(valid), rejected
+
+    def export(self, path, format="json"):
+        """
+        Writes all items of the library into a file, one item at a time.
+
+        Parameters:
+            path (str): The path of the file
+            format (str): "json", "jsonl" or "csv". If None, it is guessed from the extension of path.
+                Default="json"
+        """
+        roles = [role for role, in self.__db.execute("SELECT DISTINCT role FROM credits ORDER BY role")]
+        writer = BulkFormat.of(path, format, Catalog.columns(), roles)
+        records = (json.loads(record) for record, in self.__db.execute("SELECT record FROM items ORDER BY id"))
+        with Storage.openAtomic(path, newline="" if isinstance(writer, CsvFormat) else None) as file:
+            writer.write(file, records)
+
+    def __insert(self, d):
+        """
+        Inserts one item with its contributors and search keys. Must run inside a transaction.
+        """
+        information = SqliteCatalog.__classes.get(d["Type"], Magazine).project(d)
+        identifiers = [HashIndex.normalize(information[f]) if f in information else None
+                       for f in SqliteCatalog.__identifiers]
+        id = self.__db.execute("INSERT INTO items (type, title, record, upc, isbn, asin) VALUES (?, ?, ?, ?, ?, ?)",
+                               (information["Type"], information["Title"], json.dumps(d, ensure_ascii=False),
+                                *identifiers)).lastrowid
+
+        for role, names in d["Contributor"].items():
+            for name in names.split(", "):
+                key = TokenIndex.fold(name)
+                self.__db.execute("INSERT OR IGNORE INTO contributors (name, key) VALUES (?, ?)", (name, key))
+                self.__db.execute("INSERT INTO credits (item, contributor, role)"
+                                  " SELECT ?, id, ? FROM contributors WHERE key = ?", (id, role, key))
+
+        rows = []
+        for n, (name, value) in enumerate(information.items()):
+            rows.append((id * SqliteCatalog.__stride + n, TokenIndex.fold(value), id, name,
+                         int(name in d["Contributor"])))
+        self.__db.executemany("INSERT INTO fields (rowid, key, item, name, contributor) VALUES (?, ?, ?, ?, ?)",
+                              rows)
+
+    def __deleteAll(self, ids):
+        """
+        Deletes items and the contributors no other item credits. Must run inside a transaction.
+
+        Returns:
+            count (int): Number of deleted items
+        """
+        for id in ids:
+            self.__delete(id)
+        if len(ids) != 0:
+            self.__db.execute("DELETE FROM contributors WHERE id NOT IN (SELECT contributor FROM credits)")
+        return len(ids)
+
+    def __delete(self, id):
+        """
+        Deletes one item with its credits and search keys. Must run inside a transaction.
+        """
+        self.__db.execute("DELETE FROM fields WHERE rowid >= ? AND rowid < ?",
+                          (id * SqliteCatalog.__stride, (id + 1) * SqliteCatalog.__stride))
+        self.__db.execute("DELETE FROM credits WHERE item = ?", (id,))
+        self.__db.execute("DELETE FROM items WHERE id = ?", (id,))
+
+    def __matches(self, query, field, highlight=True):
+        """
+        Yields highlighted information of items matching a query, sorted by type and title.
+        Plain keywords of three characters or more are looked up in the trigram index,
+        shorter ones and regular expressions are matched against every search key.
+
+        Parameters:
+            query (SearchPattern): The keyword to search for
+            field (str): The field in which the function searches. If None, all fields are searched
+            highlight (bool): If False, matched fields are left as they are. Default=True
+        """
+        condition, parameters = SqliteCatalog.__condition(query, field)
+        highlight = query.highlighter(TokenIndex.fold, highlight)
+        rows = self.__db.execute("SELECT record FROM items WHERE id IN (SELECT item FROM fields WHERE "
+                                 + condition + ") ORDER BY type, title, id", parameters)
+        for record, in rows:
+            d = json.loads(record)
+            information = SqliteCatalog.__information(d)
+            found = False
+            if field == "Contributor":
+                names = list(d["Contributor"])
+            elif field is not None:
+                names = [field] if field in information else []
+            else:
+                names = list(information)
+            for i in names:
+                value, count = highlight(information[i])
+                if count != 0:
+                    information[i] = value
+                    found = True
+            if found:
+                yield information
+
+    @staticmethod
+    def __condition(query, field):
+        """
+        Returns the SQL condition on the fields table, and its parameters, selecting the search keys of a field
+        that match a query.
+        """
+        if field == "Contributor":
+            condition = " AND contributor = 1"
+            parameters = []
+        elif field is not None:
+            condition = " AND name = ?"
+            parameters = [field]
+        else:
+            condition = ""
+            parameters = []
+
+        if query.isRegex():
+            condition = "key REGEXP ?" + condition
+            parameters.insert(0, query.getPattern().pattern)
+        elif len(TokenIndex.fold(query.getKeyword())) >= 3:
+            condition = "key MATCH ?" + condition
+            parameters.insert(0, '"' + TokenIndex.fold(query.getKeyword()).replace('"', '""') + '"')
+        else:
+            condition = "instr(key, ?) > 0" + condition
+            parameters.insert(0, TokenIndex.fold(query.getKeyword()))
+        return condition, parameters
+
+    def __select(self, condition, parameters):
+        """
+        Returns information of the items matching an SQL condition, sorted by type and title.
+        """
+        rows = self.__db.execute(f"SELECT record FROM items WHERE {condition} ORDER BY type, title, id", parameters)
+        return [SqliteCatalog.__information(record) for record, in rows]
+
+    @staticmethod
+    def __regexp(pattern, key):
+        """
+        Implements the REGEXP operator of SQLite on folded search keys.
+        """
+        return re.search(pattern, key, re.IGNORECASE) is not None
+
+    @staticmethod
+    def __information(record):
+        """
+        Returns the information search() shows for a stored item, from its json or its dictionary.
+        """
+        d = json.loads(record) if isinstance(record, str) else record
+        return SqliteCatalog.__classes.get(d["Type"], Magazine).project(d)
+
+
+class SqliteIncrementalSearch:
+    """
+    A search of a SqliteCatalog that is run again on every keystroke.
+    """
+
+    def __init__(self, ctl, field=None, limit=10):
+        """
+        Initializes a SqliteIncrementalSearch object.
+
+        Parameters:
+            ctl (SqliteCatalog): The catalog to search
+            field (str): The field in which the search looks. If None, all fields are searched
+            limit (int): Number of results returned for a keyword. Default=10
+        """
+        self.__ctl = ctl
+        self.__field = field
+        self.__limit = limit
+
+    def search(self, keyword):
+        """
+        Searches for a keyword.
+
+        Parameters:
+            keyword (str): The keyword typed so far
+
+        Returns:
+            results (list): Highlighted information of at most limit items, sorted by type and title
+            count (int): Number of matched items, or None if there may be more than the ones shown
+        """
+        results = list(self.__ctl.iterSearch(keyword, self.__field, limit=self.__limit))
+        return results, len(results) if len(results) < self.__limit else None
@@ -0,0 +1,603 @@
+from abc import ABC, abstractmethod
+import codecs
+from contextlib import contextmanager
+import hashlib
+import json
+import os
+import re
+if os.name == "nt":
+    import msvcrt
+else:
+    import fcntl
+
+class Storage(ABC):
+    """
+    An abstract class for the place a catalog keeps its items in.
+    """
+    __whitespace = re.compile(r"\s*")
+
+    @abstractmethod
+    def load(self):
+        """
+        Reads all items from the storage. Items are produced one by one, so that the caller
+        never has to hold the whole file in memory.
+
+        Returns:
+            An iterable of dictionaries containing information of the items
+        """
+
+    @abstractmethod
+    def commit(self, added, deleted, records):
+        """
+        Persists one batch of changes.
+
+        Parameters:
+            added (list): Dictionaries of the items added by the batch
+            deleted (list): Dictionaries of the items deleted by the batch
+            records (iterable): Dictionaries of all items after the batch. It is only consumed
+                by storages that rewrite everything, so it may be a generator
+
+        Returns:
+            False if other programs changed the storage since it was last read, so that it holds changes
+            the caller has not seen and has to be loaded again, otherwise True
+        """
+
+    @contextmanager
+    def lock(self):
+        """
+        Holds a lock shared with the other programs writing the storage inside a with block, so that reading
+        their changes and writing a batch after them happen together. Locks nothing by default.
+        """
+        yield
+
+    def compact(self, records):
+        """
+        Rewrites the storage so that it only contains records. Does nothing by default.
+
+        Parameters:
+            records (iterable): Dictionaries of all items
+        """
+
+    def stamp(self):
+        """
+        Returns a value that changes whenever the files of the storage change, such as their modification
+        times and sizes. Returns None by default, meaning that changes cannot be detected.
+        """
+        return None
+
+    def follow(self):
+        """
+        Reads the batches of changes that other programs appended to the storage since it was last read
+        or written. Returns None by default, meaning that the storage has to be loaded again instead.
+
+        Returns:
+            batches (list): (added, deleted) pairs of lists of dictionaries, in the order they were made,
+                or None if the changes cannot be read on their own
+        """
+        return None
+
+    def position(self):
+        """
+        Returns how far the storage has been read or written, so that a copy of the items made now can be
+        brought up to date later with resume() and follow(). Returns None by default, meaning that it cannot.
+        """
+        return None
+
+    def resume(self, position):
+        """
+        Continues from a position returned by position(), possibly by another object on the same files,
+        instead of loading the items. follow() then gives the changes made after it.
+
+        Parameters:
+            position: A value returned by position()
+
+        Returns:
+            True if the files still hold the items read up to position, False if they have to be loaded
+        """
+        return False
+
+    def reader(self):
+        """
+        Returns a storage on the same files that loads them without ever writing, so that they can be read
+        while this one is in use. Returns None by default, meaning that there is none.
+        """
+        return None
+
+    @staticmethod
+    def statFile(path):
+        """
+        Returns the modification time, the size, the change time and the inode of a file, or None if it does
+        not exist. The change time and the inode also change when a file is replaced or its modification time
+        is set back, so that an edit keeping the size and the modification time is still noticed.
+
+        Parameters:
+            path (str): The file
+        """
+        try:
+            info = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return info.st_mtime_ns, info.st_size, info.st_ctime_ns, info.st_ino
+
+    @staticmethod
+    @contextmanager
+    def lockFile(path):
+        """
+        Holds an exclusive lock on a file, which is created if needed, inside a with block.
+        Programs locking the same file wait for each other.
+
+        Parameters:
+            path (str): The file to lock
+        """
+        with open(path, "a+b") as file:
+            if os.name == "nt":
+                file.seek(0)
+                while True:
+                    try:
+                        msvcrt.locking(file.fileno(), msvcrt.LK_LOCK, 1)
+                        break
+                    except OSError:
+                        # LK_LOCK gives up after ten seconds.
+                        continue
+            else:
+                fcntl.flock(file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if os.name == "nt":
+                    file.seek(0)
+                    msvcrt.locking(file.fileno(), msvcrt.LK_UNLCK, 1)
+                else:
+                    fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+
+    @staticmethod
+    def writeAtomic(path, data):
+        """
+        Writes data to path through a temporary file, so that a crash never leaves a truncated file behind.
+
+        Parameters:
+            path (str): The file to write
+            data (str): Content of the file
+        """
+        with Storage.openAtomic(path) as file:
+            file.write(data)
+
+    @staticmethod
+    @contextmanager
+    def openAtomic(path, newline=None):
+        """
+        Opens a temporary file for writing that replaces path when it is closed without an error.
+        Large files can be written to it piece by piece.
+
+        Parameters:
+            path (str): The file to write
+            newline (str): Passed to open(). Default=None
+
+        Returns:
+            A context manager giving the opened file
+        """
+        tmpPath = path + ".tmp"
+        try:
+            with open(tmpPath, "w", newline=newline, encoding="utf-8") as file:
+                yield file
+                file.flush()
+                os.fsync(file.fileno())
+        except BaseException:
+            if os.path.isfile(tmpPath):
+                os.remove(tmpPath)
+            raise
+        os.replace(tmpPath, path)
+
+    @staticmethod
+    def iterArray(file, digest=None, chunkSize=1 << 16):
+        """
+        Parses a json file containing a top-level array and yields its elements one by one.
+
+        Parameters:
+            file: A file opened in binary mode
+            digest: A hashlib object that is fed with every byte of the file. Default=None
+            chunkSize (int): Number of bytes read at a time
+
+        Returns:
+            A generator of the elements of the array
+        """
+        decoder = json.JSONDecoder()
+        textDecoder = codecs.getincrementaldecoder("utf-8")()
+        buffer = ""
+        pos = 0
+        eof = False
+        expected = "["
+        while True:
+            pos = Storage.__whitespace.match(buffer, pos).end()
+            if pos == len(buffer):
+                if eof:
+                    raise ValueError("Unexpected end of json array.")
+                chunk = file.read(chunkSize)
+                if digest is not None:
+                    digest.update(chunk)
+                eof = chunk == b""
+                buffer = buffer[pos:] + textDecoder.decode(chunk, final=eof)
+                pos = 0
+                continue
+
+            if expected == "[":
+                if buffer[pos] != "[":
+                    raise ValueError("Expected a json array.")
+                pos += 1
+                expected = "first"
+            elif buffer[pos] == "]" and expected != "value":
+                if digest is not None:
+                    for chunk in iter(lambda: file.read(chunkSize), b""):
+                        digest.update(chunk)
+                return
+            elif expected == "next":
+                if buffer[pos] != ",":
+                    raise ValueError("Expected ',' between json array elements.")
+                pos += 1
+                expected = "value"
+            else:
+                try:
+                    value, end = decoder.raw_decode(buffer, pos)
+                except json.JSONDecodeError:
+                    end = None
+                if end is None or (end == len(buffer) and not eof):
+                    # The element is cut off at the end of the buffer, read more of the file.
+                    if eof:
+                        raise ValueError("Invalid json array element.")
+                    chunk = file.read(chunkSize)
+                    if digest is not None:
+                        digest.update(chunk)
+                    eof = chunk == b""
+                    buffer = buffer[pos:] + textDecoder.decode(chunk, final=eof)
+                    pos = 0
+                    continue
+                yield value
+                pos = end
+                expected = "next"
+
+
+class JsonStorage(Storage):
+    """
+    A storage that keeps all items in a single json file and rewrites it on every change.
+    """
+
+    def __init__(self, path):
+        """
+        Initializes a JsonStorage object.
+
+        Parameters:
+            path (str): The path to a json file containing information about library items
+        """
+        self.__path = path
+
+    def load(self):
+        """
+        Overwrites load method in Storage class.
+        """
+        with open(self.__path, "rb") as file:
+            yield from Storage.iterArray(file)
+
+    def commit(self, added, deleted, records):
+        """
+        Overwrites commit method in Storage class.
+        """
+        self.compact(records)
+        return True
+
+    def lock(self):
+        """
+        Overwrites lock method in Storage class.
+        """
+        return Storage.lockFile(self.__path + ".lock")
+
+    def compact(self, records):
+        """
+        Overwrites compact method in Storage class.
+        """
+        Storage.writeAtomic(self.__path, json.dumps(list(records), indent=4))
+
+    def stamp(self):
+        """
+        Overwrites stamp method in Storage class.
+        """
+        return Storage.statFile(self.__path)
+
+    def position(self):
+        """
+        Overwrites position method in Storage class. The file is only ever replaced as a whole,
+        so its stat is the position.
+        """
+        return Storage.statFile(self.__path)
+
+    def resume(self, position):
+        """
+        Overwrites resume method in Storage class.
+        """
+        return position is not None and position == Storage.statFile(self.__path)
+
+    def reader(self):
+        """
+        Overwrites reader method in Storage class.
+        """
+        return JsonStorage(self.__path)
+
+
+class JournalStorage(Storage):
+    """
+    A storage that keeps a json snapshot of the items and appends every change to a journal next to it.
+    The snapshot has the same format as JsonStorage. The journal is a json-lines file whose first line
+    holds the checksum of the snapshot it applies to, followed by one line per add or delete batch.
+    When the journal grows larger than the catalog, it is compacted into a new snapshot.
+
+    Several programs may write the same files. Each of them has to read the batches the others appended,
+    with follow(), before appending its own while holding lock(). A storage that finds batches it has not
+    read when it appends is diverged: it is not compacted until it is loaded again. load() cuts off a torn
+    batch and sets aside a journal of another snapshot, so it must hold lock() too, or a batch that another
+    program is still writing would be taken for a torn one.
+    """
+
+    def __init__(self, path, ratio=1.0, minimum=1000, readOnly=False):
+        """
+        Initializes a JournalStorage object.
+
+        Parameters:
+            path (str): The path to the json snapshot
+            ratio (float): Compaction happens when journaled items exceed ratio times the number of items
+            minimum (int): Number of journaled items below which compaction never happens
+            readOnly (bool): If True, load() never repairs the journal, so that the files can be read
+                while another program writes them. Such a storage cannot commit. Default=False
+        """
+        self.__path = path
+        self.__readOnly = readOnly
+        self.__journalPath = path + ".journal"
+        self.__ratio = ratio
+        self.__minimum = minimum
+        self.__journaled = 0
+        self.__count = 0
+        # Bytes of the journal that have been read or written by this object, and the snapshot they apply to.
+        # follow() reads the journal from there as long as nobody else replaced the snapshot or the journal.
+        self.__offset = 0
+        self.__snapshot = None
+        self.__checksum = None
+        self.__diverged = False
+
+    def load(self):
+        """
+        Overwrites load method in Storage class. Replays the journal on top of the snapshot.
+        The snapshot is streamed unless the journal deletes items, which needs all of them at hand.
+        """
+        lines = []
+        self.__snapshot = Storage.statFile(self.__path)
+        self.__diverged = False
+        self.__offset = 0
+        self.__journaled = 0
+        if os.path.isfile(self.__journalPath):
+            with open(self.__journalPath, "rb") as file:
+                text = file.read()
+            self.__offset = len(text)
+            lines = text.decode().split("\n")
+        base = JournalStorage.__parse(lines[0]) if len(lines) != 0 else None
+
+        entries = []
+        for i in range(1, len(lines)):
+            entry = JournalStorage.__parse(lines[i])
+            if entry is None:
+                # A torn write at the end of the journal. Everything before it is intact,
+                # so cut it off before new batches are appended after it.
+                if "".join(lines[i:]).strip() != "":
+                    self.__offset = len(("\n".join(lines[:i]) + "\n").encode())
+                    if not self.__readOnly:
+                        Storage.writeAtomic(self.__journalPath, "\n".join(lines[:i]) + "\n")
+                break
+            entries.append(entry)
+        replay = any(entry["op"] == "delete" for entry in entries)
+
+        digest = hashlib.sha1()
+        self.__count = 0
+        with open(self.__path, "rb") as file:
+            if replay:
+                records = dict(enumerate(Storage.iterArray(file, digest)))
+            else:
+                for d in Storage.iterArray(file, digest):
+                    self.__count += 1
+                    yield d
+        checksum = digest.hexdigest()
+        self.__checksum = checksum
+
+        if base is None or base.get("checksum") != checksum:
+            # The journal belongs to another version of the snapshot, either because a compaction
+            # was interrupted after the snapshot was replaced, or because the snapshot was edited.
+            if self.__readOnly:
+                self.__diverged = True
+            else:
+                if os.path.isfile(self.__journalPath):
+                    os.replace(self.__journalPath, self.__journalPath + ".stale")
+                self.__reset(checksum)
+            if replay:
+                self.__count = len(records)
+                yield from records.values()
+            return
+
+        if not replay:
+            for entry in entries:
+                self.__journaled += len(entry["records"])
+                self.__count += len(entry["records"])
+                yield from entry["records"]
+            return
+
+        nextId = len(records)
+        positions = {}
+        for id, d in records.items():
+            positions.setdefault(JournalStorage.__key(d), []).append(id)
+        for entry in entries:
+            if entry["op"] == "add":
+                for d in entry["records"]:
+                    records[nextId] = d
+                    positions.setdefault(JournalStorage.__key(d), []).append(nextId)
+                    nextId += 1
+            elif entry["op"] == "delete":
+                for d in entry["records"]:
+                    ids = positions.get(JournalStorage.__key(d))
+                    if ids:
+                        del records[ids.pop(0)]
+            self.__journaled += len(entry["records"])
+        self.__count = len(records)
+        yield from records.values()
+
+    def commit(self, added, deleted, records):
+        """
+        Overwrites commit method in Storage class. Appends the batch to the journal.
+        """
+        if self.__readOnly:
+            raise ValueError("Read-only storage.")
+        lines = ""
+        if len(added) != 0:
+            lines += json.dumps({"op": "add", "records": added}) + "\n"
+        if len(deleted) != 0:
+            lines += json.dumps({"op": "delete", "records": deleted}) + "\n"
+        if lines == "":
+            return not self.__diverged
+
+        with open(self.__journalPath, "ab") as file:
+            if file.tell() != self.__offset:
+                # Another program appended batches that follow() has not read yet.
+                self.__diverged = True
+            file.write(lines.encode())
+            file.flush()
+            os.fsync(file.fileno())
+            self.__offset = file.tell()
+        self.__journaled += len(added) + len(deleted)
+        self.__count += len(added) - len(deleted)
+
+        # Compacting a diverged storage would write over the batches of other programs.
+        if not self.__diverged and self.__journaled > max(self.__minimum, self.__ratio * self.__count):
+            self.compact(records)
+        return not self.__diverged
+
+    def lock(self):
+        """
+        Overwrites lock method in Storage class. A read-only storage never changes the files,
+        so it locks nothing and does not create the lock file.
+        """
+        if self.__readOnly:
+            return super().lock()
+        return Storage.lockFile(self.__path + ".lock")
+
+    def compact(self, records):
+        """
+        Overwrites compact method in Storage class. Writes a new snapshot and starts an empty journal.
+
+        Raises:
+            ValueError: If the storage is read-only, or diverged and has to be loaded again first
+        """
+        if self.__readOnly:
+            raise ValueError("Read-only storage.")
+        if self.__diverged:
+            raise ValueError("Diverged storage.")
+        records = list(records)
+        snapshot = json.dumps(records, indent=4)
+        Storage.writeAtomic(self.__path, snapshot)
+        self.__snapshot = Storage.statFile(self.__path)
+        self.__checksum = hashlib.sha1(snapshot.encode()).hexdigest()
+        self.__reset(self.__checksum)
+        self.__count = len(records)
+
+    def stamp(self):
+        """
+        Overwrites stamp method in Storage class. Both the snapshot and the journal are watched.
+        """
+        return Storage.statFile(self.__path), Storage.statFile(self.__journalPath)
+
+    def follow(self):
+        """
+        Overwrites follow method in Storage class. Batches appended to the journal are read from where
+        this object stopped reading or writing it, as long as the snapshot is the one it was loaded from.
+        """
+        size = Storage.statFile(self.__journalPath)
+        if self.__diverged or Storage.statFile(self.__path) != self.__snapshot or size is None \
+                or size[1] < self.__offset:
+            return None
+
+        with open(self.__journalPath, "rb") as file:
+            file.seek(self.__offset)
+            text = file.read()
+        batches = []
+        # A batch being written by another program is left for the next call.
+        end = text.rfind(b"\n") + 1
+        for line in text[:end].decode().split("\n"):
+            entry = JournalStorage.__parse(line)
+            if entry is None:
+                continue
+            if entry.get("op") not in ("add", "delete"):
+                return None
+            batch = (entry["records"], []) if entry["op"] == "add" else ([], entry["records"])
+            batches.append(batch)
+            self.__journaled += len(entry["records"])
+            self.__count += len(batch[0]) - len(batch[1])
+        self.__offset += end
+        return batches
+
+    def position(self):
+        """
+        Overwrites position method in Storage class. The position is the snapshot, identified by its
+        stat and checksum, and how many bytes of its journal have been read or written.
+        """
+        if self.__diverged or self.__snapshot is None:
+            return None
+        return {"snapshot": self.__snapshot, "checksum": self.__checksum, "offset": self.__offset,
+                "journaled": self.__journaled, "count": self.__count}
+
+    def resume(self, position):
+        """
+        Overwrites resume method in Storage class. The snapshot must be the same file, and the journal
+        must still start from its checksum and be at least as long as it was.
+        """
+        if not isinstance(position, dict) or position["snapshot"] != Storage.statFile(self.__path):
+            return False
+        journal = Storage.statFile(self.__journalPath)
+        if journal is None or journal[1] < position["offset"]:
+            return False
+        with open(self.__journalPath, "rb") as file:
+            base = JournalStorage.__parse(file.readline().decode(errors="replace"))
+        if not isinstance(base, dict) or base.get("checksum") != position["checksum"]:
+            return False
+        self.__snapshot = position["snapshot"]
+        self.__checksum = position["checksum"]
+        self.__offset = position["offset"]
+        self.__journaled = position["journaled"]
+        self.__count = position["count"]
+        self.__diverged = False
+        return True
+
+    def reader(self):
+        """
+        Overwrites reader method in Storage class.
+        """
+        return JournalStorage(self.__path, self.__ratio, self.__minimum, readOnly=True)
+
+    def __reset(self, checksum):
+        """
+        Starts an empty journal on top of the snapshot with the given checksum.
+        """
+        content = json.dumps({"op": "base", "checksum": checksum}) + "\n"
+        Storage.writeAtomic(self.__journalPath, content)
+        self.__journaled = 0
+        self.__offset = len(content.encode())
+        self.__diverged = False
+
+    @staticmethod
+    def __parse(line):
+        """
+        Parses one line of the journal. Returns None if the line is empty or incomplete.
+        """
+        try:
+            return json.loads(line)
+        except ValueError:
+            return None
+
+    @staticmethod
+    def __key(d):
+        """
+        Returns a key that identifies the content of an item.
+        """
+        return json.dumps(d, sort_keys=True)
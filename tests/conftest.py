@@ -0,0 +1,71 @@
+import json
+import os
+import random
+import sys
+import pytest
+
+# The modules of the catalog live at the top of the repository.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def book(title, upc=None):
+    """
+    Returns the dictionary of a book with the given title.
+    """
+    return {"Title": title, "Type": "Book", "Contributor": {"Author": "Dan Brown"}, "Subject": "Mystery-thriller",
+            "ISBN": "9780552161268", "DDS": "M546", "UPC": upc if upc is not None else str(abs(hash(title)))}
+
+WORDS = ["Đắc", "nhân", "tâm", "Angels", "&", "Demons", "Self-help", "Mekong", "river", "of", "the", "Đà", "Lạt",
+         "centimet", "trên", "giây", "Dune:", "Part", "Two", "Œuvre", "straße", "X-Men", "2049"]
+NAMES = ["Dan Brown", "Dale Carnegie", "Nguyễn Nhật Ánh", "Timothée Chalamet", "Lewis R. Foster"]
+
+def library(count=300, seed=1):
+    """
+    Returns the dictionaries of count random items, whose titles mix diacritics, punctuation and characters
+    folding to several letters. Item n has the UPC 100000000000 + n.
+    """
+    rand = random.Random(seed)
+    res = []
+    for n in range(count):
+        type = ["Book", "CD", "DVD", "Magazine"][n % 4]
+        d = {"Title": " ".join(rand.choices(WORDS, k=rand.randint(1, 5))), "Type": type}
+        if type == "Book":
+            d["Contributor"] = {"Author": ", ".join(rand.sample(NAMES, rand.randint(1, 2)))}
+            d.update({"Subject": rand.choice(["Romance", "Self-help"]), "ISBN": str(9780000000000 + n),
+                      "DDS": "R%03d" % n})
+        elif type in ("CD", "DVD"):
+            d["Contributor"] = {"Director": rand.choice(NAMES), "Actor": ", ".join(rand.sample(NAMES, 2))}
+            d.update({"Genre": rand.choice(["Music", "Science Fiction"]), "ASIN": "B0%08d" % n})
+        else:
+            d["Contributor"] = {"Editor": rand.choice(NAMES)}
+            d.update({"Volume": rand.choice(["I", "II"]), "Issue": str(n % 12 + 1)})
+        d["UPC"] = str(100000000000 + n)
+        res.append(d)
+    return res
+
+@pytest.fixture(autouse=True)
+def snapshotKey(tmp_path, monkeypatch):
+    """
+    Signs snapshots with a key of the test instead of the key of the user.
+    """
+    monkeypatch.setenv("CATALOG_SNAPSHOT_KEY", os.path.join(tmp_path, "snapshot.key"))
+
+@pytest.fixture
+def catalogFile(tmp_path):
+    """
+    Returns a function writing a json file of items into a temporary directory and returning its path.
+    """
+    def write(items, name="items.json"):
+        path = os.path.join(tmp_path, name)
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(items, file, indent=4)
+        return path
+    return write
+
+@pytest.fixture
+def titles():
+    """
+    Returns a function giving the titles of all items of a catalog, sorted.
+    """
+    def titles(ctl):
+        return sorted(item["Title"] for items in ctl.getItems() for item in items)
+    return titles
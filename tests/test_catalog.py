@@ -0,0 +1,11 @@
+import json
+from catalog import Book
+from conftest import book
+
+def testLocateGivesADictionaryTheCallerOwns():
+    item = Book(book("Seed"))
+    information = item.locate()
+    assert type(information) is dict
+    assert json.loads(json.dumps(information))["Title"] == "Seed"
+    information["Title"] = "Changed"
+    assert item.locate()["Title"] == "Seed"
@@ -0,0 +1,72 @@
+import pytest
+from catalog import Catalog
+from conftest import library
+from sqlitecatalog import SqliteCatalog
+
+def upcs(results):
+    return {d["UPC"] for d in results}
+
+def stored(ctl):
+    return {d["UPC"] for type in ["Book", "CD", "DVD", "Magazine"] for d in ctl.iterItems(type)}
+
+def journaled(path):
+    with open(path + ".journal", encoding="utf-8") as file:
+        return len(file.readlines())
+
+@pytest.fixture(params=["eager", "lazy", "sqlite"])
+def engine(request, catalogFile):
+    """
+    Returns a function opening the catalog of a file of library() items with each engine.
+    """
+    path = catalogFile(library())
+    opened = []
+
+    def open():
+        if request.param == "sqlite":
+            ctl = SqliteCatalog(SqliteCatalog.databasePath(path), path)
+            opened.append(ctl)
+            return ctl
+        return Catalog(path, lazy=request.param == "lazy")
+    yield open
+    for ctl in opened:
+        ctl.close()
+
+@pytest.mark.parametrize("keyword", ["mekong", "MEKONG RIVER", "da lat", "Đà Lạt", "nhan tam", "an ta", "x-men",
+                                     "&", "self-help", "^the", "river$", "straße|oeuvre", "d[aà] l", "help|romance"])
+def testDeleteRemovesWhatSearchPreviews(engine, keyword):
+    ctl = engine()
+    before = stored(ctl)
+    preview = upcs(ctl.iterSearch(keyword, "Title", highlight=False))
+    assert len(preview) != 0
+    assert ctl.deleteItems(keyword) == len(preview)
+    assert before - stored(ctl) == preview
+    assert before - stored(engine()) == preview
+    assert list(ctl.iterSearch(keyword, "Title")) == []
+
+def testDeleteByIdentifierIgnoresSpacesDashesAndCase(engine):
+    ctl = engine()
+    before = stored(ctl)
+    values = ["1000-0000-0005", " 100000000006 ", "100000000005", "100 000 000 012", "999", "b0-0000-0001"]
+    assert ctl.deleteByIdentifier("UPC", values) == 3
+    assert before - stored(ctl) == {"100000000005", "100000000006", "100000000012"}
+    assert ctl.deleteByIdentifier("ASIN", ["b0-0000-0001", "B000000002"]) == 2
+    assert before - stored(engine()) == {"100000000005", "100000000006", "100000000012", "100000000001",
+                                         "100000000002"}
+    with pytest.raises(ValueError):
+        ctl.deleteByIdentifier("Title", ["x"])
+
+def testDeleteByIdentifierWritesOneBatch(catalogFile):
+    path = catalogFile(library())
+    ctl = Catalog(path)
+    lines = journaled(path)
+    assert ctl.deleteByIdentifier("UPC", ["1000-0000-0005", "100000000006", "1000 0000 0012"]) == 3
+    assert journaled(path) == lines + 1
+    assert ctl.deleteByIdentifier("UPC", ["999"]) == 0
+    assert journaled(path) == lines + 1
+
+def testDeleteWritesOneBatch(catalogFile):
+    path = catalogFile(library())
+    ctl = Catalog(path)
+    lines = journaled(path)
+    assert ctl.deleteItems("mekong") > 1
+    assert journaled(path) == lines + 1
@@ -0,0 +1,37 @@
+import json
+import os
+import pytest
+from catalog import Catalog
+from conftest import book
+
+def testInvalidJsonLineIsReportedAsParseError(catalogFile, titles, tmp_path):
+    ctl = Catalog(catalogFile([book("Seed")]))
+    source = os.path.join(tmp_path, "new.jsonl")
+    with open(source, "w", encoding="utf-8") as file:
+        file.write(json.dumps(book("Good")) + "\n{\"Title\": \n" + json.dumps({"Title": "Odd"}) + "\n")
+
+    count, rejected = ctl.importItems(source)
+    assert count == 1
+    assert [line for line, reason in rejected] == [2, 3]
+    assert rejected[0][1].startswith("Invalid json: ")
+    assert rejected[1][1] == "Invalid Type."
+    assert titles(ctl) == ["Good", "Seed"]
+
+def testBrokenFileImportsNothing(catalogFile, titles, tmp_path):
+    path = catalogFile([book("Seed")])
+    ctl = Catalog(path)
+    source = os.path.join(tmp_path, "new.json")
+    with open(source, "w", encoding="utf-8") as file:
+        file.write("[" + ",\n".join(json.dumps(book(f"New {n}")) for n in range(3)) + ",\n{\"Title\": ")
+
+    with pytest.raises(ValueError):
+        ctl.importItems(source)
+    assert titles(ctl) == ["Seed"]
+    assert titles(Catalog(path)) == ["Seed"]
+
+def testMissingFileRaisesOSError(catalogFile, tmp_path):
+    ctl = Catalog(catalogFile([book("Seed")]))
+    with pytest.raises(OSError):
+        ctl.importItems(os.path.join(tmp_path, "missing.csv"))
+    with pytest.raises(OSError):
+        ctl.export(os.path.join(tmp_path, "missing", "items.csv"), None)
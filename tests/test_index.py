@@ -0,0 +1,85 @@
+import pytest
+from catalog import Catalog
+from conftest import library
+from index import TokenIndex
+
+KEYWORDS = ["an ta", "nhân tâm", "nhan", "DAC NHAN", "c nhân t", "đà lạt", "a l", " demons", "angels &",
+            "& demons", "s & d", "&", "-", ":", " ", "self-h", "elf-hel", "f-he", "mekong river", "river of",
+            " of ", "ong riv", "ver of th", "e", "a", "n", "on", "oeuvre", "strasse", "x-m", "20", "04",
+            "brown", "n br", "t, d", "timothee", "zzz", "the the"]
+
+def values(d, field):
+    """
+    Returns the values of an item that a search of field looks at.
+    """
+    if field == "Contributor":
+        return list(d["Contributor"].values())
+    if field is not None:
+        return [d[field]] if field in d else []
+    return [v for k, v in d.items() if k != "Contributor"] + list(d["Contributor"].values())
+
+def scan(data, keyword, field):
+    """
+    Returns the UPCs of the items holding keyword, found by folding every value of every item.
+    """
+    folded = TokenIndex.fold(keyword)
+    return sorted(d["UPC"] for d in data if any(folded in TokenIndex.fold(v) for v in values(d, field)))
+
+@pytest.fixture(scope="module")
+def indexed(tmp_path_factory):
+    data = library()
+    path = str(tmp_path_factory.mktemp("index") / "items.json")
+    Catalog.create(path, data)
+    return data, Catalog(path)
+
+@pytest.mark.parametrize("field", [None, "Title", "Contributor"])
+@pytest.mark.parametrize("keyword", KEYWORDS)
+def testSearchFindsWhatAScanFinds(indexed, keyword, field):
+    data, ctl = indexed
+    found = sorted(d["UPC"] for d in ctl.iterSearch(keyword, field, highlight=False))
+    assert found == scan(data, keyword, field)
+
+def index(data):
+    idx = TokenIndex()
+    for id, d in enumerate(data):
+        information = {k: v for k, v in d.items() if k != "Contributor"}
+        information.update(d["Contributor"])
+        idx.add(id, information, list(d["Contributor"]))
+    return idx
+
+@pytest.mark.parametrize("keyword", KEYWORDS)
+def testCandidatesHoldEveryMatch(keyword):
+    data = library()
+    idx = index(data)
+    for field in (None, "Title"):
+        candidates = idx.candidates(keyword, field)
+        if candidates is not None:
+            upcs = {data[id]["UPC"] for id in candidates}
+            assert upcs >= set(scan(data, keyword, field))
+
+def testPunctuationOnlyKeywordsScanEverything():
+    idx = index(library())
+    for keyword in ["&", "-", " ", ": "]:
+        assert idx.candidates(keyword) is None
+
+def testTokensInMostIndexedTokensFallBackToAScan():
+    # "n" is part of more than a quarter of the tokens of titles, "mekong" of a few only.
+    data = library()
+    idx = index(data)
+    assert idx.candidates("n", "Title") is None
+    assert idx.candidates("mekong", "Title") is not None
+    # Leaving out the edge token that matches too much still narrows the search by the other one.
+    candidates = idx.candidates("mekong n", "Title")
+    assert candidates is not None and {data[id]["UPC"] for id in candidates} >= set(scan(data, "mekong n", "Title"))
+
+def testVocabularyGivesTheSameCandidatesAsTheIndex():
+    data = library()
+    idx = index(data)
+    for keyword in ["centimet", "mekong river", "nhân tâm", "x-men", "dan brown"]:
+        vocabulary = {}
+        for n in range(1, len(keyword) + 1):
+            part = keyword[:n]
+            assert idx.candidates(part, "Title", vocabulary) == idx.candidates(part, "Title"), part
+        for n in range(len(keyword) - 1, -1, -1):
+            part = keyword[n:]
+            assert idx.candidates(part, "Title", vocabulary) == idx.candidates(part, "Title"), part
@@ -0,0 +1,117 @@
+import threading
+import pytest
+from catalog import Catalog
+from conftest import book
+from locking import ReadWriteLock
+
+def start(target):
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    return thread
+
+def testReadersShareTheLock():
+    lock = ReadWriteLock()
+    inside = threading.Barrier(3, timeout=5)
+
+    def read():
+        with lock.reading():
+            inside.wait()
+    threads = [start(read) for _ in range(3)]
+    for thread in threads:
+        thread.join(5)
+    assert not inside.broken
+
+def testWriterExcludesReaders():
+    lock = ReadWriteLock()
+    entered = threading.Event()
+    with lock.writing():
+        reader = start(lambda: lock.reading().__enter__() or entered.set())
+        assert not entered.wait(0.2)
+    assert entered.wait(5)
+    reader.join(5)
+
+def testWaitingWriterStopsNewReaders():
+    lock = ReadWriteLock()
+    events = []
+    wrote = threading.Event()
+
+    def write():
+        with lock.writing():
+            events.append("write")
+        wrote.set()
+
+    def read():
+        with lock.reading():
+            events.append("read")
+
+    with lock.reading():
+        writer = start(write)
+        while not writer.is_alive():
+            pass
+        # Let the writer wait for the reader holding the lock before a new reader comes.
+        assert not wrote.wait(0.2)
+        reader = start(read)
+        assert not wrote.wait(0.2)
+    writer.join(5)
+    reader.join(5)
+    assert events == ["write", "read"]
+
+def testLockIsReentrant():
+    lock = ReadWriteLock()
+    with lock.reading():
+        with lock.reading():
+            pass
+        with pytest.raises(RuntimeError):
+            with lock.writing():
+                pass
+    with lock.writing():
+        with lock.writing():
+            with lock.reading():
+                pass
+    # Nothing is held anymore, so another thread can write.
+    writer = start(lambda: lock.writing().__enter__())
+    writer.join(5)
+    assert not writer.is_alive()
+
+def testSearchSeesBatchesWholeWhileWritersRun(catalogFile):
+    ctl = Catalog(catalogFile([book(f"Seed {n:03}") for n in range(300)]))
+    batch = [book(f"Extra {n:03}") for n in range(300)]
+    stop = threading.Event()
+    writes = []
+
+    def write():
+        # A writer that never pauses would keep readers out, since waiting writers go first.
+        while not stop.wait(0.002):
+            ctl.addItem(batch)
+            stop.wait(0.002)
+            ctl.deleteItems("extra")
+            writes.append(1)
+    writer = start(write)
+    seen = set()
+    try:
+        for _ in range(20):
+            titles = []
+            # Walk the results slowly, so that batches are added and deleted meanwhile.
+            for n, d in enumerate(ctl.iterSearch("e", "Title", highlight=False)):
+                titles.append(d["Title"])
+                if n % 50 == 0:
+                    stop.wait(0.001)
+            batches = [t for t in titles if t.startswith("Extra")]
+            assert len(batches) in (0, len(batch))
+            assert len(titles) == len(set(titles))
+            assert titles == sorted(titles)
+            seen.add(len(batches))
+    finally:
+        stop.set()
+        writer.join(10)
+    assert len(writes) > 1
+    assert seen == {0, len(batch)}
+
+def testDeletedItemsStayReadableBySearchesStartedBefore(catalogFile):
+    ctl = Catalog(catalogFile([book(f"Seed {n:03}") for n in range(100)]))
+    results = ctl.iterSearch("seed", "Title", highlight=False)
+    first = next(results)
+    assert ctl.deleteItems("seed") == 100
+    titles = [first["Title"]] + [d["Title"] for d in results]
+    assert titles == [f"Seed {n:03}" for n in range(100)]
+    assert ctl.search("seed", "Title") == []
@@ -0,0 +1,44 @@
+import json
+import os
+import subprocess
+import sys
+import pytest
+from catalog import Catalog
+from conftest import book
+
+MAIN = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "main.py")
+
+def query(*args, stdin=""):
+    return subprocess.run([sys.executable, MAIN, *args], input=stdin, capture_output=True, text=True)
+
+def testQueryWritesNoFiles(catalogFile, tmp_path):
+    path = catalogFile([book("Seed"), book("Mekong")])
+    res = query("query", "--file", path, stdin="mekong\n")
+    assert res.returncode == 0
+    assert json.loads(res.stdout)["count"] == 1
+    assert sorted(os.listdir(tmp_path)) == ["items.json"]
+
+def testQueryReadsJournaledChanges(catalogFile):
+    path = catalogFile([book("Seed")])
+    Catalog(path).addItem([book("Mekong")])
+    res = query("query", "--file", path, stdin="mekong\n")
+    assert json.loads(res.stdout)["count"] == 1
+
+@pytest.mark.parametrize("args", [["query", "--file", "missing.json"],
+                                  ["--engine", "sqlite", "query", "--file", "missing.json"]])
+def testMissingCatalogIsAnError(tmp_path, args):
+    res = query(*[os.path.join(tmp_path, a) if a.endswith(".json") else a for a in args], stdin="mekong\n")
+    assert res.returncode == 1
+    assert res.stderr.startswith("Cannot open the catalog: ")
+    assert os.listdir(tmp_path) == []
+
+def testMissingQueriesIsAnError(catalogFile, tmp_path):
+    res = query("query", "--file", catalogFile([book("Seed")]), "--queries", os.path.join(tmp_path, "missing.txt"))
+    assert res.returncode == 1
+    assert res.stderr.startswith("Cannot open the queries: ")
+
+def testReadOnlyCatalogCannotBeChanged(catalogFile, titles):
+    ctl = Catalog(catalogFile([book("Seed")]), readOnly=True)
+    with pytest.raises(ValueError):
+        ctl.addItem([book("Mekong")])
+    assert titles(ctl) == ["Seed"]
@@ -0,0 +1,68 @@
+import os
+import pickle
+import struct
+from catalog import Catalog
+from conftest import book
+from snapshot import Snapshot
+
+def testSnapshotIsRestoredWithJournaledChanges(catalogFile, titles):
+    path = catalogFile([book("Seed"), book("Mekong")])
+    assert Catalog.buildSnapshot(path)
+    Catalog(path).addItem([book("Journaled")])
+    ctl = Catalog(path, snapshot=True)
+    assert titles(ctl) == ["Journaled", "Mekong", "Seed"]
+    assert [item["Title"] for item in ctl.search("mekong")] == ["\x1b[6;30;42mMekong\x1b[0m"]
+
+def testEditKeepingSizeAndTimeIsNoticed(catalogFile, titles):
+    path = catalogFile([book("Seed AAAA")])
+    assert Catalog.buildSnapshot(path)
+    info = os.stat(path)
+    # Like restoring a backup of the same size with its old modification time.
+    catalogFile([book("Seed BBBB", book("Seed AAAA")["UPC"])])
+    os.utime(path, ns=(info.st_atime_ns, info.st_mtime_ns))
+    assert os.stat(path).st_size == info.st_size
+    assert titles(Catalog(path, snapshot=True)) == ["Seed BBBB"]
+
+def testDamagedSnapshotFallsBackToLoading(catalogFile, titles):
+    path = catalogFile([book("Seed")])
+    assert Catalog.buildSnapshot(path)
+    with open(Snapshot.pathOf(path), "r+b") as file:
+        file.seek(os.path.getsize(Snapshot.pathOf(path)) // 2)
+        file.write(b"\0" * 64)
+    assert titles(Catalog(path, snapshot=True)) == ["Seed"]
+
+def testSnapshotOfOtherFilesIsNotUsed(catalogFile, titles):
+    path = catalogFile([book("Seed")])
+    assert Catalog.buildSnapshot(path)
+    other = catalogFile([book("Other")], "other.json")
+    os.replace(Snapshot.pathOf(path), Snapshot.pathOf(other))
+    assert titles(Catalog(other, snapshot=True)) == ["Other"]
+
+class Planted:
+    """
+    An object whose unpickling writes a file, standing for code run by a planted snapshot.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def __reduce__(self):
+        return open, (self.path, "w")
+
+def testUnsignedSnapshotIsNeverUnpickled(catalogFile, titles, tmp_path):
+    path = catalogFile([book("Seed")])
+    ran = os.path.join(tmp_path, "ran")
+    header = pickle.dumps(Planted(ran))
+    with open(Snapshot.pathOf(path), "wb") as file:
+        file.write(b"CATSNAP\0" + b"\0" * 32 + struct.pack("<Q", len(header)) + header)
+    assert titles(Catalog(path, snapshot=True)) == ["Seed"]
+    assert not os.path.exists(ran)
+
+def testSnapshotOfAnotherKeyIsNotUsed(catalogFile, titles, tmp_path, monkeypatch):
+    path = catalogFile([book("Seed")])
+    monkeypatch.setenv("CATALOG_SNAPSHOT_KEY", os.path.join(tmp_path, "other.key"))
+    assert Catalog.buildSnapshot(path)
+    monkeypatch.setenv("CATALOG_SNAPSHOT_KEY", os.path.join(tmp_path, "snapshot.key"))
+    assert Snapshot.open(Snapshot.pathOf(path)) is None
+    assert titles(Catalog(path, snapshot=True)) == ["Seed"]
+    assert oct(os.stat(os.path.join(tmp_path, "other.key")).st_mode & 0o777) == "0o600"
@@ -0,0 +1,23 @@
+import threading
+from conftest import book
+from sqlitecatalog import SqliteCatalog
+
+def testDatabaseIsFilledFromTheJsonFile(catalogFile):
+    path = catalogFile([book("Seed"), book("Mekong")])
+    ctl = SqliteCatalog(SqliteCatalog.databasePath(path), path)
+    assert SqliteCatalog.databasePath(path).endswith("items.db")
+    assert [d["Title"] for d in ctl.iterSearch("mekong", "Title", highlight=False)] == ["Mekong"]
+    ctl.close()
+    ctl = SqliteCatalog(SqliteCatalog.databasePath(path), path)
+    assert ctl.countItems("Book") == 2
+    ctl.close()
+
+def testWritesOfOtherThreadsAreSeen(catalogFile):
+    path = catalogFile([book("Seed")])
+    ctl = SqliteCatalog(SqliteCatalog.databasePath(path), path)
+    writer = threading.Thread(target=ctl.addItem, args=([book("From a thread")],))
+    writer.start()
+    writer.join()
+    assert not ctl.reload()
+    assert ctl.incremental().search("thread") == ([ctl.search("thread")[0]], 1)
+    ctl.close()
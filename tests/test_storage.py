@@ -0,0 +1,144 @@
+import json
+import os
+import threading
+import pytest
+from catalog import Catalog
+from conftest import book
+from snapshot import Snapshot
+from sqlitecatalog import SqliteCatalog
+from storage import JournalStorage
+
+def testTwoWritersKeepEachOthersItems(catalogFile, titles):
+    path = catalogFile([book("Seed")])
+    a = Catalog(path)
+    b = Catalog(path)
+    a.addItem([book("FROM A")])
+    b.addItem([book("FROM B")])
+
+    assert titles(b) == ["FROM A", "FROM B", "Seed"]
+    assert a.reload()
+    assert titles(a) == ["FROM A", "FROM B", "Seed"]
+    b.compact()
+    assert titles(Catalog(path)) == ["FROM A", "FROM B", "Seed"]
+
+def testTwoWritersDeleteAfterEachOther(catalogFile, titles):
+    path = catalogFile([book("Seed"), book("Mekong")])
+    a = Catalog(path)
+    b = Catalog(path)
+    a.addItem([book("Mekong river")])
+    assert b.deleteItems("mekong") == 2
+    assert titles(b) == ["Seed"]
+    assert a.reload()
+    assert titles(a) == ["Seed"]
+    assert titles(Catalog(path)) == ["Seed"]
+
+def testAutomaticCompactionKeepsOtherWriters(catalogFile, titles):
+    path = catalogFile([book("Seed")])
+    a = Catalog(path, JournalStorage(path, minimum=2))
+    b = Catalog(path, JournalStorage(path, minimum=2))
+    for n in range(5):
+        a.addItem([book(f"A {n}")])
+        b.addItem([book(f"B {n}")])
+    expected = sorted(["Seed"] + [f"A {n}" for n in range(5)] + [f"B {n}" for n in range(5)])
+    assert titles(b) == expected
+    assert titles(Catalog(path)) == expected
+    a.reload()
+    assert titles(a) == expected
+
+def testDivergedStorageIsNotCompacted(catalogFile):
+    path = catalogFile([book("Seed")])
+    mine = JournalStorage(path)
+    list(mine.load())
+    other = JournalStorage(path)
+    list(other.load())
+    assert other.commit([book("Other")], [], [])
+    # This storage did not read the other batch, so it must not write a snapshot over it.
+    assert mine.commit([book("Mine")], [], []) is False
+    with pytest.raises(ValueError):
+        mine.compact([book("Seed"), book("Mine")])
+    assert sorted(d["Title"] for d in JournalStorage(path).load()) == ["Mine", "Other", "Seed"]
+
+def testTornJournalTailIsCutOff(catalogFile):
+    path = catalogFile([book("Seed")])
+    ctl = Catalog(path)
+    ctl.addItem([book("Whole")])
+    with open(path + ".journal", "a") as file:
+        file.write(json.dumps({"op": "add", "records": [book("Torn")]})[:20])
+    assert sorted(d["Title"] for d in JournalStorage(path).load()) == ["Seed", "Whole"]
+    Catalog(path).addItem([book("After")])
+    assert sorted(d["Title"] for d in JournalStorage(path).load()) == ["After", "Seed", "Whole"]
+
+def testEditedSnapshotDropsStaleJournal(catalogFile):
+    path = catalogFile([book("Seed")])
+    Catalog(path).addItem([book("Journaled")])
+    catalogFile([book("Edited")])
+    assert [d["Title"] for d in JournalStorage(path).load()] == ["Edited"]
+
+def testCreatedCatalogDropsOldChanges(catalogFile, titles):
+    path = catalogFile([book("Seed")])
+    ctl = Catalog(path)
+    ctl.addItem([book("Journaled")])
+    assert Catalog.buildSnapshot(path)
+    Catalog.create(path, [book("Seed")])
+    assert not os.path.exists(Snapshot.pathOf(path))
+    assert titles(Catalog(path, snapshot=True)) == ["Seed"]
+
+def testCreatedDatabaseDropsOldItems(catalogFile):
+    path = catalogFile([book("Seed")])
+    SqliteCatalog(SqliteCatalog.databasePath(path), path).close()
+    SqliteCatalog.create(SqliteCatalog.databasePath(path), [book("New")])
+    ctl = SqliteCatalog(SqliteCatalog.databasePath(path), path)
+    assert [d["Title"] for d in ctl.iterItems("Book")] == ["New"]
+    ctl.close()
+
+def testReloadFollowsOtherWritersAndCompactions(catalogFile, titles):
+    path = catalogFile([book("Seed")])
+    a = Catalog(path)
+    b = Catalog(path)
+    assert not a.reload()
+    b.addItem([book("Added")])
+    assert a.reload()
+    assert not a.reload()
+    b.deleteItems("seed")
+    b.compact()
+    assert a.reload()
+    assert titles(a) == ["Added"]
+    a.addItem([book("After")])
+    assert titles(Catalog(path)) == ["Added", "After"]
+
+@pytest.mark.parametrize("mode", [{}, {"lazy": True}, {"columnar": True}])
+def testFieldsOutsideTheSchemaAreKept(catalogFile, titles, mode):
+    odd = dict(book("Odd"), Year="2001")
+    journal = dict(book("Journal"), Type="Journal", Volume="1", Issue="2")
+    path = catalogFile([book("Seed"), odd, journal])
+    ctl = Catalog(path, **mode)
+    ctl.compact()
+    with open(path, encoding="utf-8") as file:
+        assert json.load(file) == [book("Seed"), odd, journal]
+
+    assert Catalog(path, **mode).deleteItems("odd") == 1
+    assert Catalog(path, **mode).deleteItems("journal") == 1
+    assert titles(Catalog(path, **mode)) == ["Seed"]
+
+@pytest.mark.parametrize("reader", ["reload", "open"])
+def testBatchBeingWrittenIsNotCutOff(catalogFile, titles, reader):
+    path = catalogFile([book("Seed")])
+    a = Catalog(path)
+    a.addItem([book("First")])
+    a.compact()
+    b = Catalog(path)
+    line = (json.dumps({"op": "add", "records": [book("Written")]}) + "\n").encode()
+    done = threading.Event()
+    # Another program appending a batch holds the lock while the first bytes are already in the journal.
+    with JournalStorage(path).lock():
+        with open(path + ".journal", "ab") as file:
+            file.write(line[:40])
+            file.flush()
+            thread = threading.Thread(target=lambda: (b.reload() if reader == "reload" else Catalog(path),
+                                                      done.set()), daemon=True)
+            thread.start()
+            assert not done.wait(0.2)
+            file.write(line[40:])
+    thread.join(5)
+    assert done.is_set()
+    assert titles(Catalog(path)) == ["First", "Seed", "Written"]